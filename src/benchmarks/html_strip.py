@@ -0,0 +1,53 @@
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from src.data.html_text import strip_html, strip_html_bs4
+from src.definitions import RAW_DATA_FOLDER
+
+# Fragments seen around article bodies in scraped Ukrainian news
+__WRAPPERS = [
+    "<p>{}</p>",
+    "<div class=\"article\"><p>{}</p><p><a href=\"https://example.com/?a=1&b=2\">Читайте також</a></p></div>",
+    "<p><strong>{}</strong></p>\n\n<p>&nbsp;</p>",
+    "<p>{}</p><script>window.dataLayer = window.dataLayer || [];</script>",
+    "<blockquote>&laquo;{}&raquo;</blockquote><!-- banner -->",
+    "<p>{}&#8212;<em>джерело</em> &amp; фото</p><br/><img src=\"x.jpg\" alt=\"\">",
+]
+
+
+def make_documents(rng, count):
+    content = pd.read_parquet(RAW_DATA_FOLDER / "span-detection.parquet", columns=["content"])
+    texts = content["content"].to_numpy()
+    picked = texts[rng.integers(0, len(texts), size=count)]
+    wrappers = rng.integers(0, len(__WRAPPERS), size=count)
+
+    return [
+        __WRAPPERS[w].format(text.replace("\n", "</p>\n<p>"))
+        for text, w in zip(picked, wrappers)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = make_documents(np.random.default_rng(42), args.documents)
+    size_mb = sum(len(it.encode("utf-8")) for it in documents) / 2**20
+
+    assert strip_html(documents) == strip_html_bs4(documents)
+
+    for name, stage in (("bs4", strip_html_bs4), ("htmlparser", strip_html)):
+        elapsed = min(timeit.repeat(lambda: stage(documents), number=1, repeat=args.repeat))
+        print(
+            f"{name}: {elapsed:.3f}s, {len(documents) / elapsed:,.0f} docs/s, "
+            f"{size_mb / elapsed:.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
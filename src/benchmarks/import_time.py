@@ -0,0 +1,63 @@
+import argparse
+import pkgutil
+import subprocess
+import sys
+
+import src
+from src.definitions import PROJECT_ROOT_DIR
+
+
+def list_modules(skip=("src.benchmarks", "src.utils")):
+    return sorted(
+        it.name
+        for it in pkgutil.walk_packages(src.__path__, prefix="src.")
+        if not it.name.startswith(skip)
+    )
+
+
+def import_time_us(module: str) -> int:
+    """
+    Cumulative import time of `module` in a fresh interpreter, as reported by
+    python -X importtime. Returns -1 when the module fails to import.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+    if completed.returncode != 0:
+        return -1
+
+    for line in reversed(completed.stderr.splitlines()):
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative)
+
+    return -1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modules = args.modules or list_modules()
+
+    print(f"{'module':<45} {'import ms':>10}")
+    for module in modules:
+        timings = [import_time_us(module) for _ in range(args.repeat)]
+
+        if min(timings) < 0:
+            print(f"{module:<45} {'failed':>10}")
+        else:
+            print(f"{module:<45} {min(timings) / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import timeit
+
+import numpy as np
+
+from src.data.label_alignment import align_batch_labels
+
+
+def loop_align_labels(offsets, spans, word_ids, exclude_tail):
+    example_labels = [0] * len(offsets)
+    spans = spans if spans is not None else []
+    for start, end in spans:
+        for idx, (offset_start, offset_end) in enumerate(offsets):
+            if offset_start >= start and offset_end <= end:
+                example_labels[idx] = 1
+
+    previous_word_id = None
+
+    for j, id in enumerate(word_ids):
+        if exclude_tail:
+            if id is None or id == previous_word_id:
+                example_labels[j] = -100
+        else:
+            if id is None:
+                example_labels[j] = -100
+        previous_word_id = id
+
+    return example_labels
+
+
+def make_example(rng, n_tokens, n_spans):
+    lengths = rng.integers(1, 8, size=n_tokens - 2)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    offsets = [(0, 0)] + list(zip(starts.tolist(), ends.tolist())) + [(0, 0)]
+
+    word_starts = rng.random(n_tokens - 2) < 0.6
+    word_starts[0] = True
+    word_ids = [None] + (np.cumsum(word_starts) - 1).tolist() + [None]
+
+    text_len = int(ends[-1])
+    span_starts = np.sort(rng.integers(0, text_len, size=n_spans))
+    span_ends = span_starts + rng.integers(5, 80, size=n_spans)
+    spans = list(zip(span_starts.tolist(), span_ends.tolist()))
+
+    return offsets, spans, word_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=512)
+    parser.add_argument("--spans", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    examples = [
+        make_example(rng, args.tokens, args.spans) for _ in range(args.examples)
+    ]
+
+    offset_mapping, trigger_words, word_ids = map(list, zip(*examples))
+
+    def run_loop(exclude_tail):
+        return [loop_align_labels(*it, exclude_tail) for it in examples]
+
+    def run_numpy(exclude_tail):
+        return align_batch_labels(offset_mapping, trigger_words, word_ids, exclude_tail)
+
+    for exclude_tail in (True, False):
+        assert run_numpy(exclude_tail) == run_loop(exclude_tail)
+
+        loop_time = min(
+            timeit.repeat(
+                lambda: run_loop(exclude_tail), number=1, repeat=args.repeat
+            )
+        )
+        numpy_time = min(
+            timeit.repeat(
+                lambda: run_numpy(exclude_tail), number=1, repeat=args.repeat
+            )
+        )
+
+        print(
+            f"exclude_tail={exclude_tail}: loop {loop_time:.3f}s, "
+            f"numpy {numpy_time:.3f}s, speedup x{loop_time / numpy_time:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from math import exp
+
+import numpy as np
+import torch
+from sklearn.metrics import f1_score
+from transformers import EvalPrediction
+
+from src.model.mlm_metrics import compute_metrics
+
+
+def legacy_compute_metrics(p: EvalPrediction):
+    # Previous implementation, with sklearn's f1_score in place of
+    # evaluate.load("f1"), which wraps the same function
+    logits, labels = p.predictions, p.label_ids
+
+    probs = torch.nn.functional.softmax(torch.tensor(logits), dim=-1)
+    predictions = torch.argmax(probs, dim=-1)
+    mask = labels != -100
+
+    correct_predictions = (predictions[mask] == labels[mask]).sum().item()
+    total_masked_tokens = mask.sum().item()
+
+    loss_fn = torch.nn.CrossEntropyLoss()
+    loss = loss_fn(torch.tensor(logits[mask]), torch.tensor(labels[mask]))
+
+    return {
+        "masked_accuracy": correct_predictions / total_masked_tokens,
+        "perplexity": exp(loss.item()),
+        "f1_score": f1_score(
+            labels[mask].tolist(), predictions[mask].tolist(), average="macro"
+        ),
+    }
+
+
+def make_eval_prediction(rows, width, vocab, seed=42):
+    rng = np.random.default_rng(seed)
+    logits = rng.standard_normal((rows, width, vocab), dtype=np.float32)
+    labels = rng.integers(0, vocab, size=(rows, width))
+    np.put_along_axis(logits, labels[..., None], 5.0, axis=-1)
+    labels[rng.random((rows, width)) > 0.15] = -100
+
+    return EvalPrediction(predictions=logits, label_ids=labels)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant, rows, width, vocab):
+    p = make_eval_prediction(rows, width, vocab)
+    baseline = max_rss_mb()
+
+    start = time.perf_counter()
+    if variant == "legacy":
+        result = legacy_compute_metrics(p)
+    else:
+        result = compute_metrics(p)
+    elapsed = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "variant": variant,
+                "seconds": elapsed,
+                "extra_peak_mb": max_rss_mb() - baseline,
+                "result": {k: float(v) for k, v in result.items()},
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=64)
+    parser.add_argument("--width", type=int, default=128)
+    parser.add_argument("--vocab", type=int, default=30000)
+    parser.add_argument("--variant", choices=["legacy", "chunked"])
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        run_variant(args.variant, args.rows, args.width, args.vocab)
+        return
+
+    # Every variant runs in a fresh process so peak RSS is not shared
+    runs = {}
+    for variant in ("legacy", "chunked"):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "src.benchmarks.mlm_metrics",
+                f"--rows={args.rows}",
+                f"--width={args.width}",
+                f"--vocab={args.vocab}",
+                f"--variant={variant}",
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs[variant] = json.loads(output.strip().splitlines()[-1])
+
+    logits_mb = args.rows * args.width * args.vocab * 4 / 2**20
+    print(f"logits: {logits_mb:.0f} MB")
+
+    for variant, run in runs.items():
+        print(
+            f"{variant}: {run['seconds']:.2f}s, extra peak memory "
+            f"{run['extra_peak_mb']:.0f} MB, {run['result']}"
+        )
+
+    legacy, chunked = runs["legacy"]["result"], runs["chunked"]["result"]
+    assert legacy["masked_accuracy"] == chunked["masked_accuracy"]
+    assert legacy["f1_score"] == chunked["f1_score"]
+    assert np.isclose(legacy["perplexity"], chunked["perplexity"], rtol=1e-4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from transformers import (
+    AutoModel,
+    AutoModelForSequenceClassification,
+    AutoModelForTokenClassification,
+    AutoTokenizer,
+    BertConfig,
+)
+
+from src.data.span_detection_ds import TECHNIQUES
+from src.definitions import RAW_DATA_FOLDER
+from src.model.multitask import MultiTaskModel, predict_spans_and_techniques
+from src.model.span_inference import encode_posts, iter_model_batches, predict_spans
+
+
+def separate_models(token_model, technique_model, tokenizer, texts, batch_size, max_length):
+    spans = predict_spans(token_model, tokenizer, texts, batch_size=batch_size, max_length=max_length)
+
+    encodings = encode_posts(tokenizer, texts, max_length=max_length)
+    technique_logits = np.zeros((len(texts), len(TECHNIQUES)), dtype=np.float32)
+    for batch_idx, _, output in iter_model_batches(technique_model, encodings, batch_size):
+        technique_logits[batch_idx] = output.logits.float().cpu().numpy()
+
+    return spans, technique_logits > 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", default="bert-base-multilingual-cased")
+    parser.add_argument("--posts", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    texts = pd.read_parquet(RAW_DATA_FOLDER / "span-detection.parquet")["content"]
+    texts = texts.head(args.posts).tolist()
+
+    # Randomly initialized encoders of one size: only the cost is measured
+    config = BertConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=args.hidden_size,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.hidden_size // 64,
+        intermediate_size=args.hidden_size * 4,
+        label2id={"O": 0, "I-MANIPULATION": 1},
+        id2label={0: "O", 1: "I-MANIPULATION"},
+    )
+    token_model = AutoModelForTokenClassification.from_config(config).eval()
+    technique_config = BertConfig(**config.to_dict())
+    technique_config.id2label = dict(enumerate(TECHNIQUES))
+    technique_config.label2id = {v: k for k, v in technique_config.id2label.items()}
+    technique_model = AutoModelForSequenceClassification.from_config(technique_config).eval()
+    joint_model = MultiTaskModel(AutoModel.from_config(config, add_pooling_layer=False)).eval()
+
+    runs = {
+        "separate": lambda: separate_models(
+            token_model, technique_model, tokenizer, texts, args.batch_size, args.max_length
+        ),
+        "multitask": lambda: predict_spans_and_techniques(
+            joint_model, tokenizer, texts, batch_size=args.batch_size, max_length=args.max_length
+        ),
+    }
+
+    torch.set_grad_enabled(False)
+    for name, run in runs.items():
+        run()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed:.2f}s, {elapsed / len(texts) * 1000:.1f} ms/post")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import datasets
+import numpy as np
+import pandas as pd
+
+from src.data.arrow_filters import not_null, timestamp_after
+from src.data.lenta_ru_extended import REF_DATE
+from src.data.news_corpus import load_corpus
+from src.definitions import RAW_DATA_FOLDER
+
+
+def make_corpus(rng, rows, path: Path):
+    """
+    lenta.ru-like parquet: article text, string dates around REF_DATE and
+    metadata columns that the loader never needs.
+    """
+    texts = pd.read_parquet(RAW_DATA_FOLDER / "span-detection.parquet", columns=["content"])
+    texts = texts["content"].to_numpy()[rng.integers(0, len(texts), size=rows)]
+
+    start = REF_DATE - timedelta(days=2 * 365)
+    dates = [
+        (start + timedelta(minutes=int(it))).strftime("%Y-%m-%d %H:%M:%S")
+        for it in rng.integers(0, 3 * 365 * 24 * 60, size=rows)
+    ]
+
+    pd.DataFrame(
+        {
+            "url": [f"https://lenta.ru/news/{i}" for i in range(rows)],
+            "title": [it[:80] for it in texts],
+            "news": texts,
+            "topic": rng.choice(["Мир", "Россия", "Экономика"], size=rows),
+            "tags": [["a", "b"]] * rows,
+            "date": dates,
+        }
+    ).to_parquet(path, row_group_size=10_000)
+
+
+def row_filter(path):
+    ds = load_corpus(None, data_files=path)
+    ds = ds.filter(
+        lambda x: x["date"] is not None
+        and x["news"] is not None
+        and datetime.strptime(x["date"], "%Y-%m-%d %H:%M:%S") > REF_DATE
+    )
+
+    return ds.select_columns(["news"])
+
+
+def pushdown(path):
+    return load_corpus(
+        None,
+        data_files=path,
+        columns=["news"],
+        filters=not_null("news") & timestamp_after("date", REF_DATE),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    datasets.disable_progress_bars()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "lenta.parquet"
+        make_corpus(np.random.default_rng(42), args.rows, path)
+
+        results = {}
+        for name, load in (("row filter", row_filter), ("pushdown", pushdown)):
+            # Fresh cache, so both include building the Arrow files
+            datasets.config.HF_DATASETS_CACHE = Path(tmp) / name
+
+            start = time.perf_counter()
+            results[name] = load(path)
+            print(f"{name}: {time.perf_counter() - start:.2f}s, [ {len(results[name])} ] rows")
+
+        assert results["row filter"]["news"] == results["pushdown"]["news"]
+
+
+if __name__ == "__main__":
+    main()
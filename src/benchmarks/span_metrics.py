@@ -0,0 +1,103 @@
+import argparse
+import timeit
+
+import numpy as np
+from seqeval.metrics import classification_report as seqeval_report
+from seqeval.metrics import accuracy_score
+from sklearn.metrics import classification_report
+
+from src.model.span_detection_metrics import evaluate_masked
+
+
+def legacy_evaluate(labels, predictions):
+    true_predictions = [
+        [p for (p, l) in zip(prediction, label) if l != -100]
+        for prediction, label in zip(predictions, labels)
+    ]
+    true_labels = [
+        [l for (p, l) in zip(prediction, label) if l != -100]
+        for prediction, label in zip(predictions, labels)
+    ]
+
+    report = classification_report(
+        [l for seq in true_labels for l in seq],
+        [p for seq in true_predictions for p in seq],
+        labels=[0, 1],
+        target_names=["O", "I-MANIPULATION"],
+        output_dict=True,
+        zero_division=0,
+    )
+
+    y_true_io = [["I-MANIPULATION" if l == 1 else "O" for l in seq] for seq in true_labels]
+    y_pred_io = [["I-MANIPULATION" if p == 1 else "O" for p in seq] for seq in true_predictions]
+    spans = seqeval_report(y_true_io, y_pred_io, output_dict=True, zero_division=0)[
+        "micro avg"
+    ]
+
+    return {
+        "token_f1": report["I-MANIPULATION"]["f1-score"],
+        "token_precision": report["I-MANIPULATION"]["precision"],
+        "token_recall": report["I-MANIPULATION"]["recall"],
+        "span_f1": spans["f1-score"],
+        "span_precision": spans["precision"],
+        "span_recall": spans["recall"],
+        "accuracy": accuracy_score(y_true_io, y_pred_io),
+    }
+
+
+def make_eval_set(rng, rows, width, flip):
+    lengths = rng.integers(width // 4, width + 1, size=rows)
+    labels = np.full((rows, width), -100, dtype=np.int64)
+    predictions = np.zeros((rows, width), dtype=np.int64)
+
+    for i, length in enumerate(lengths):
+        runs = np.cumsum(rng.random(length) < 0.1) % 2
+        labels[i, 1 : length - 1] = runs[1 : length - 1]
+        labels[i, 1 : length - 1][rng.random(length - 2) < 0.3] = -100
+        noisy = np.where(rng.random(length) < flip, 1 - runs, runs)
+        predictions[i, :length] = noisy
+
+    return labels, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+
+    for flip in (0.0, 0.05, 0.3):
+        labels, predictions = make_eval_set(rng, args.rows, args.width, flip)
+
+        expected = legacy_evaluate(labels, predictions)
+        actual = evaluate_masked(labels, predictions)
+        for name, value in expected.items():
+            assert actual[name] == value, (
+                name,
+                actual[name],
+                value,
+            )
+
+        legacy_time = min(
+            timeit.repeat(
+                lambda: legacy_evaluate(labels, predictions), number=1, repeat=args.repeat
+            )
+        )
+        numpy_time = min(
+            timeit.repeat(
+                lambda: evaluate_masked(labels, predictions), number=1, repeat=args.repeat
+            )
+        )
+
+        print(
+            f"flip={flip}: span_f1={actual['span_f1']:.4f}, seqeval+sklearn "
+            f"{legacy_time:.3f}s, numpy {numpy_time:.3f}s, "
+            f"speedup x{legacy_time / numpy_time:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
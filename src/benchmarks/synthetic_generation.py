@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.data.synthetic_generation import (
+    HttpBackend,
+    StubGenerationServer,
+    generate_dataset_async,
+    requests_from_df,
+)
+from src.definitions import RAW_DATA_FOLDER
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--rate", type=float, default=50)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(RAW_DATA_FOLDER / "span-detection.parquet")
+    requests = requests_from_df(df)[: args.requests]
+
+    with StubGenerationServer(args.latency, args.failure_rate) as server, \
+            tempfile.TemporaryDirectory() as folder:
+        for concurrency in (1, 8, 32):
+            path = Path(folder) / f"concurrency-{concurrency}.jsonl"
+
+            start = time.perf_counter()
+            stats = asyncio.run(
+                generate_dataset_async(
+                    requests,
+                    HttpBackend(server.url),
+                    path,
+                    concurrency=concurrency,
+                    rate=args.rate,
+                )
+            )
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"concurrency {concurrency}: {elapsed:.2f}s, "
+                f"{stats['generated'] / elapsed:.1f} posts/s, {stats}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+import pandas as pd
+
+from src.data.embedding_store import EmbeddingStore
+from src.definitions import EMBEDDING_CACHE_FOLDER, RAW_DATA_FOLDER
+from src.model.technique_retrieval import (
+    MINILM_CHECKPOINT,
+    IVFIndex,
+    SentenceEncoder,
+    TechniqueRetriever,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=MINILM_CHECKPOINT)
+    parser.add_argument("--nlist", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--holdout", type=float, default=0.1)
+    parser.add_argument("--max-missed", type=float, default=0.02)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(RAW_DATA_FOLDER / "span-detection.parquet").sample(frac=1, random_state=42)
+    holdout_size = int(len(df) * args.holdout)
+    train, holdout = df.iloc[holdout_size:], df.iloc[:holdout_size]
+
+    encoder = SentenceEncoder(args.checkpoint)
+    store = EmbeddingStore(EMBEDDING_CACHE_FOLDER / encoder.cache_key)
+
+    start = time.perf_counter()
+    store.embed(df["content"], encoder)
+    print(f"embedding: {time.perf_counter() - start:.2f}s, [ {len(store)} ] posts cached")
+
+    retriever = TechniqueRetriever(encoder, store, IVFIndex(nlist=args.nlist), k=args.k)
+    retriever.add(train)
+
+    queries = retriever.embed(holdout["content"])
+    for nprobe in (1, 2, 4, 8, args.nlist):
+        start = time.perf_counter()
+        recall = retriever.index.recall(queries, args.k, nprobe)
+        print(f"nprobe {nprobe}: recall@{args.k} {recall:.4f}, {time.perf_counter() - start:.3f}s")
+
+    print(retriever.calibrate_skip(holdout, max_missed=args.max_missed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pds
+
+
+def equals(column: str, value) -> pds.Expression:
+    return pc.field(column) == value
+
+
+def not_null(*columns: str) -> pds.Expression:
+    expression = pc.field(columns[0]).is_valid()
+    for column in columns[1:]:
+        expression &= pc.field(column).is_valid()
+
+    return expression
+
+
+def timestamp_after(column: str, moment: datetime, fmt: str = "%Y-%m-%d %H:%M:%S") -> pds.Expression:
+    """
+    Rows whose string timestamp column parses with fmt and is later than
+    moment. Unparseable and missing values are dropped.
+    """
+    parsed = pc.strptime(pc.field(column), format=fmt, unit="s", error_is_null=True)
+
+    return parsed > pa.scalar(moment, type=pa.timestamp("s"))
+
+
+def without_prefix(column: str, prefix: str) -> pds.Expression:
+    return ~pc.starts_with(pc.field(column), prefix)
+
+
+def filter_mask(table: pa.Table, expression: pds.Expression) -> pa.BooleanArray:
+    """
+    Evaluate expression over an Arrow table, null counts as False.
+    """
+    mask = pds.dataset(table).to_table(columns={"mask": expression})["mask"]
+
+    return pc.fill_null(mask, False).combine_chunks()
+
+
+def filter_dataset(ds, expression: pds.Expression, batch_size: int = 1000, num_proc: int = None):
+    """
+    Batched Arrow-compute filter of a Dataset or IterableDataset, for sources
+    that can not take the expression at read time, e.g. CSV or JSON files.
+    """
+    kwargs = {"num_proc": num_proc} if num_proc is not None else {}
+
+    return (
+        ds.with_format("arrow")
+        .filter(lambda batch: filter_mask(batch, expression), batched=True, batch_size=batch_size, **kwargs)
+        .with_format(None)
+    )
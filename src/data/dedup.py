@@ -0,0 +1,278 @@
+import json
+import multiprocessing
+import re
+import unicodedata
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from src.util.cpu_budget import cpu_budget
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+_NON_WORD_PATTERN = re.compile(r"[\W_]+")
+_SIGNATURES_FILE = "signatures.npy"
+_META_FILE = "index.json"
+
+_worker_permutations = None
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFKC, lowercase, no URLs and punctuation, single spaces.
+    """
+    text = unicodedata.normalize("NFKC", text if isinstance(text, str) else "").lower()
+    text = _URL_PATTERN.sub(" ", text)
+
+    return " ".join(_NON_WORD_PATTERN.sub(" ", text).split())
+
+
+def shingle_hashes(text: str, shingle_size: int = 3) -> np.ndarray:
+    """
+    CRC32 of every word shingle of the normalized text.
+    """
+    words = normalize_text(text).split()
+    count = max(len(words) - shingle_size + 1, 1)
+
+    return np.fromiter(
+        (
+            zlib.crc32(" ".join(words[i : i + shingle_size]).encode("utf-8"))
+            for i in range(count)
+        ),
+        dtype=np.uint64,
+        count=count,
+    )
+
+
+def minhash_signatures(texts, permutations, shingle_size: int = 3) -> np.ndarray:
+    """
+    [len(texts), num_perm] MinHash signatures.
+
+    Args:
+        permutations: [2, num_perm] universal hash coefficients a, b < 2**32,
+            so a * h + b fits into uint64 for 32 bit shingle hashes
+    """
+    a, b = permutations[0][:, None], permutations[1][:, None]
+    result = np.empty((len(texts), permutations.shape[1]), dtype=np.uint64)
+
+    for i, text in enumerate(texts):
+        hashes = shingle_hashes(text, shingle_size)[None, :]
+        result[i] = ((a * hashes + b) % _MERSENNE_PRIME).min(axis=1)
+
+    return result
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of near-duplicate texts.
+
+    Texts are normalized, split into word shingles and MinHashed; signatures
+    are bucketed by `bands` LSH bands and candidates are confirmed with the
+    estimated Jaccard similarity against `threshold`. Signatures are computed
+    in worker processes, and the index can be saved and loaded to check new
+    batches incrementally.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 3,
+        seed: int = 42,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm [ {num_perm} ] is not divisible by bands [ {bands} ]")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.permutations = rng.integers(1, 1 << 32, size=(2, num_perm), dtype=np.uint64)
+
+        self.keys = []
+        # Grown by doubling, rows past len(self.keys) are unused capacity
+        self.__signatures = np.empty((0, num_perm), dtype=np.uint64)
+        self.__buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def signatures(self, texts, num_proc: int = None, chunk_size: int = 1000) -> np.ndarray:
+        """
+        MinHash signatures of texts, computed in num_proc worker processes.
+        """
+        texts = list(texts)
+        num_proc = num_proc or cpu_budget()
+
+        if num_proc <= 1 or len(texts) <= chunk_size:
+            return minhash_signatures(texts, self.permutations, self.shingle_size)
+
+        chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+        with ProcessPoolExecutor(
+            max_workers=num_proc,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.permutations,),
+        ) as executor:
+            parts = executor.map(_signatures_chunk, chunks, [self.shingle_size] * len(chunks))
+
+            return np.concatenate(list(parts))
+
+    def add(self, keys, texts=None, signatures=None, num_proc: int = None):
+        """
+        Insert texts (or precomputed signatures) under the given keys.
+        """
+        keys = list(keys)
+        if signatures is None:
+            signatures = self.signatures(texts, num_proc)
+
+        offset = len(self.keys)
+        self.keys.extend(keys)
+
+        if len(self.keys) > len(self.__signatures):
+            capacity = max(len(self.keys), 2 * len(self.__signatures))
+            grown = np.empty((capacity, self.num_perm), dtype=np.uint64)
+            grown[:offset] = self.__signatures[:offset]
+            self.__signatures = grown
+        self.__signatures[offset : len(self.keys)] = signatures
+
+        for i, signature in enumerate(signatures):
+            for band, bucket_key in enumerate(self.__band_keys(signature)):
+                self.__buckets[band].setdefault(bucket_key, []).append(offset + i)
+
+    def query(self, texts=None, signatures=None, num_proc: int = None):
+        """
+        Keys of indexed near-duplicates for every text.
+        """
+        if signatures is None:
+            signatures = self.signatures(texts, num_proc)
+
+        return [
+            [self.keys[i] for i in self.__matches(signature)] for signature in signatures
+        ]
+
+    def deduplicate(self, keys, texts, num_proc: int = None) -> np.ndarray:
+        """
+        Keep mask of a batch: False for texts that duplicate an indexed text
+        or an earlier text of the batch. Kept texts are added to the index.
+        """
+        keys = list(keys)
+        signatures = self.signatures(texts, num_proc)
+        keep = np.zeros(len(keys), dtype=bool)
+
+        for i, signature in enumerate(signatures):
+            if len(self.__matches(signature)) == 0:
+                keep[i] = True
+                self.add([keys[i]], signatures=signature[None, :])
+
+        return keep
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        np.save(path / _SIGNATURES_FILE, self.__signatures[: len(self.keys)])
+        with open(path / _META_FILE, "w") as f:
+            json.dump(
+                {
+                    "threshold": self.threshold,
+                    "num_perm": self.num_perm,
+                    "bands": self.bands,
+                    "shingle_size": self.shingle_size,
+                    "seed": self.seed,
+                    "keys": self.keys,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, path: Path):
+        path = Path(path)
+
+        with open(path / _META_FILE) as f:
+            meta = json.load(f)
+
+        keys = meta.pop("keys")
+        index = cls(**meta)
+        index.add(keys, signatures=np.load(path / _SIGNATURES_FILE))
+
+        return index
+
+    def __band_keys(self, signature):
+        rows = self.num_perm // self.bands
+
+        return [
+            signature[band * rows : (band + 1) * rows].tobytes() for band in range(self.bands)
+        ]
+
+    def __matches(self, signature):
+        candidates = set()
+
+        for band, bucket_key in enumerate(self.__band_keys(signature)):
+            candidates.update(self.__buckets[band].get(bucket_key, ()))
+
+        if not candidates:
+            return []
+
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self.__signatures[candidates] == signature).mean(axis=1)
+
+        return np.sort(candidates[similarity >= self.threshold]).tolist()
+
+
+def drop_near_duplicates(
+    df,
+    column: str = "content",
+    index: NearDuplicateIndex = None,
+    key_column: str = None,
+    num_proc: int = None,
+):
+    """
+    Drop rows of a DataFrame whose text near-duplicates an earlier row or an
+    entry of index. Kept rows are added to index, so chaining calls over
+    several corpora deduplicates across all of them.
+
+    Returns:
+        tuple: Filtered DataFrame and the index
+    """
+    index = index if index is not None else NearDuplicateIndex()
+    keys = df[key_column] if key_column is not None else df.index
+
+    keep = index.deduplicate(keys.astype(str).tolist(), df[column].tolist(), num_proc)
+
+    return df[keep], index
+
+
+def near_duplicate_mask(
+    texts,
+    reference_texts,
+    threshold: float = 0.8,
+    num_proc: int = None,
+) -> np.ndarray:
+    """
+    True for every text that near-duplicates one of reference_texts, e.g. a
+    test post that reposts a train post.
+    """
+    index = NearDuplicateIndex(threshold)
+    reference_texts = list(reference_texts)
+    index.add(range(len(reference_texts)), reference_texts, num_proc=num_proc)
+
+    return np.array([len(it) > 0 for it in index.query(texts, num_proc=num_proc)], dtype=bool)
+
+
+def _init_worker(permutations):
+    global _worker_permutations
+
+    _worker_permutations = permutations
+
+
+def _signatures_chunk(texts, shingle_size):
+    return minhash_signatures(texts, _worker_permutations, shingle_size)
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+_KEY_SIZE = 16
+_KEYS_FILE = "keys.bin"
+_VECTORS_FILE = "vectors.f32"
+_META_FILE = "meta.json"
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_KEY_SIZE).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only store of text embeddings keyed by content hash.
+
+    Vectors live in one raw float32 file that is read through a memory map,
+    keys in a parallel file of fixed-size hashes, so opening the store reads
+    only the keys. One store holds the embeddings of one encoder, e.g.
+    `EMBEDDING_CACHE_FOLDER / encoder.cache_key`. Meant for a single writer;
+    rows whose key or vector was not fully written are dropped on open.
+    """
+
+    def __init__(self, root: Path, logger: logging.Logger = logging.getLogger(__name__)):
+        self.__root = Path(root)
+        self.__logger = logger
+        self.__rows = {}
+        self.__vectors = None
+        self.dim = None
+
+        meta_path = self.__root / _META_FILE
+        if meta_path.is_file():
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+            self.__open()
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def __contains__(self, text: str):
+        return content_hash(text) in self.__rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        Read-only [rows, dim] memory map of every stored vector.
+        """
+        if not len(self):
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+
+        if self.__vectors is None or len(self.__vectors) != len(self):
+            vectors = np.memmap(self.__root / _VECTORS_FILE, dtype=np.float32, mode="r")
+            self.__vectors = vectors.reshape(-1, self.dim)[: len(self)]
+
+        return self.__vectors
+
+    def rows(self, texts) -> np.ndarray:
+        """
+        Store rows of texts, -1 for texts without a stored embedding.
+        """
+        return np.fromiter(
+            (self.__rows.get(content_hash(it), -1) for it in texts), dtype=np.int64
+        )
+
+    def add(self, texts, vectors: np.ndarray):
+        """
+        Append embeddings of texts that are not stored yet.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        keys, fresh, seen = [], [], set()
+
+        for i, text in enumerate(texts):
+            key = content_hash(text)
+            if key not in self.__rows and key not in seen:
+                seen.add(key)
+                keys.append(key)
+                fresh.append(i)
+
+        if not keys:
+            return
+
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.__root.mkdir(parents=True, exist_ok=True)
+            with open(self.__root / _META_FILE, "w") as f:
+                json.dump({"dim": self.dim}, f)
+
+        # Vectors first: a key is only ever written after its vector
+        with open(self.__root / _VECTORS_FILE, "ab") as f:
+            f.write(vectors[fresh].tobytes())
+        with open(self.__root / _KEYS_FILE, "ab") as f:
+            f.write(b"".join(keys))
+
+        offset = len(self.__rows)
+        self.__rows.update((key, offset + i) for i, key in enumerate(keys))
+
+    def embed(self, texts, encode, batch_size: int = 1024) -> np.ndarray:
+        """
+        Embeddings of texts, computing and storing only the missing ones.
+
+        Args:
+            encode: Callable mapping a list of texts to a [n, dim] array,
+                e.g. SentenceEncoder
+
+        Returns:
+            np.ndarray: [len(texts), dim] float32 array
+        """
+        texts = list(texts)
+        missing = list(
+            dict.fromkeys(it for it, row in zip(texts, self.rows(texts)) if row < 0)
+        )
+
+        if missing:
+            self.__logger.info(
+                "Embedding [ %s ] of [ %s ] texts, the rest is cached in [ %s ]",
+                len(missing),
+                len(texts),
+                self.__root,
+            )
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start : start + batch_size]
+            self.add(chunk, encode(chunk))
+
+        return np.asarray(self.vectors[self.rows(texts)])
+
+    def __open(self):
+        keys_path, vectors_path = self.__root / _KEYS_FILE, self.__root / _VECTORS_FILE
+        if not keys_path.is_file() or not vectors_path.is_file():
+            return
+
+        count = min(
+            keys_path.stat().st_size // _KEY_SIZE,
+            vectors_path.stat().st_size // (4 * self.dim),
+        )
+
+        # Cut whatever an interrupted append left past the last complete row
+        for path, size in ((keys_path, count * _KEY_SIZE), (vectors_path, count * 4 * self.dim)):
+            if path.stat().st_size != size:
+                self.__logger.warning("Truncating [ %s ] to [ %s ] complete rows", path, count)
+                with open(path, "rb+") as f:
+                    f.truncate(size)
+
+        keys = keys_path.read_bytes()
+        self.__rows = {keys[i * _KEY_SIZE : (i + 1) * _KEY_SIZE]: i for i in range(count)}
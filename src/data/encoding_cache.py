@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from datasets import load_from_disk
+
+ENCODING_VERSION = 1
+
+_HASH_CHUNK_SIZE = 1 << 20
+_LAST_USED_FILE = ".last_used"
+_KEY_FILE = "cache_key.json"
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer) -> dict:
+    if getattr(tokenizer, "is_fast", False):
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        # Calls with truncation or padding switch these on the backend
+        # tokenizer, they are settings of the call rather than content
+        state.pop("truncation", None)
+        state.pop("padding", None)
+        content = json.dumps(state, sort_keys=True, ensure_ascii=False)
+    else:
+        content = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+
+    # Content only: name_or_path is often a local folder, and the same
+    # tokenizer at another path must map to the same encodings
+    return {
+        "class": type(tokenizer).__name__,
+        "vocab_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+    }
+
+
+def make_cache_key(**params) -> str:
+    """
+    Stable hex key of JSON-serializable parameters plus ENCODING_VERSION.
+    """
+    payload = json.dumps(
+        {"encoding_version": ENCODING_VERSION, **params},
+        sort_keys=True,
+        default=str,
+    )
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def write_cache_key(path: Path, key: str):
+    with open(path / _KEY_FILE, "w") as f:
+        json.dump({"key": key}, f)
+
+
+def read_cache_key(path: Path) -> str:
+    key_file = path / _KEY_FILE
+
+    if not key_file.is_file():
+        return None
+
+    with open(key_file) as f:
+        return json.load(f).get("key")
+
+
+class EncodingCache:
+    """
+    Directory of saved datasets addressed by content-derived keys.
+
+    Entries are written to a temporary directory and renamed into place, so
+    parallel runs never see partial entries. When `max_size_bytes` is set, the
+    least recently used entries are evicted after every write.
+    """
+
+    __root: Path
+    __max_size_bytes: int = None
+
+    def __init__(
+        self,
+        root: Path,
+        max_size_bytes: int = None,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self.__root = root
+        self.__max_size_bytes = max_size_bytes
+        self.__logger = logger
+
+    def load(self, key: str):
+        entry = self.__root / key
+
+        if not entry.is_dir():
+            return None
+
+        self.__logger.info("Found cached encoding [ %s ] in [ %s ]", key, entry)
+        (entry / _LAST_USED_FILE).touch()
+
+        return load_from_disk(str(entry))
+
+    def save(self, key: str, dataset):
+        self.__root.mkdir(parents=True, exist_ok=True)
+
+        entry = self.__root / key
+        tmp = self.__root / f".tmp-{key}-{uuid.uuid4().hex}"
+
+        dataset.save_to_disk(str(tmp))
+        write_cache_key(tmp, key)
+        (tmp / _LAST_USED_FILE).touch()
+
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process has stored the same key in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict(keep=key)
+
+        return load_from_disk(str(entry))
+
+    def evict(self, keep: str = None):
+        if self.__max_size_bytes is None or not self.__root.is_dir():
+            return
+
+        entries = [
+            it
+            for it in self.__root.iterdir()
+            if it.is_dir() and not it.name.startswith(".")
+        ]
+        sizes = {it: _dir_size(it) for it in entries}
+        total = sum(sizes.values())
+
+        for entry in sorted(entries, key=_last_used):
+            if total <= self.__max_size_bytes:
+                break
+            if entry.name == keep:
+                continue
+
+            self.__logger.info("Evicting cached encoding [ %s ]", entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
+def _last_used(entry: Path) -> float:
+    marker = entry / _LAST_USED_FILE
+
+    return marker.stat().st_mtime if marker.exists() else time.time()
+
+
+def _dir_size(path: Path) -> int:
+    return sum(it.stat().st_size for it in path.rglob("*") if it.is_file())
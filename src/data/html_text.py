@@ -0,0 +1,210 @@
+import html
+import re
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution
+
+# BeautifulSoup.get_text() leaves out the text inside these tags
+_SKIPPED_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+_PRESERVED_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+_EMPTY_ELEMENT_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+_DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+_HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+
+def strip_html(texts):
+    """
+    Extract the text of a batch of HTML documents.
+
+    Documents are run through a single streaming HTMLParser that keeps text
+    nodes, decodes entities and drops comments, declarations and the
+    contents of script, style, template, rt and rp tags, which matches
+    BeautifulSoup(..., "html.parser").get_text(). Documents the parser can
+    not consume completely, e.g. with an unterminated tag or an undecodable
+    entity, are handed to BeautifulSoup.
+
+    Numeric references to U+0000 or to a surrogate decode to U+FFFD, as in
+    BeautifulSoup 4.15; older releases, e.g. 4.13, keep those code points.
+
+    Args:
+        texts: List of HTML strings, None entries are kept as None
+
+    Returns:
+        list: Extracted text for every document
+    """
+    parser = _TextParser()
+    result = []
+
+    for text in texts:
+        if text is None or (
+            "<" not in text and "&" not in text and text.strip(_ASCII_SPACES)
+        ):
+            result.append(text)
+            continue
+
+        extracted = parser.extract(text)
+        result.append(extracted if extracted is not None else strip_html_bs4([text])[0])
+
+    return result
+
+
+def strip_html_bs4(texts):
+    """
+    Reference extraction stage, one BeautifulSoup tree per document.
+    """
+    return [
+        BeautifulSoup(text, "html.parser").get_text() if text is not None else None
+        for text in texts
+    ]
+
+
+class _TextParser(HTMLParser):
+    """
+    Text-only mirror of the BeautifulSoup html.parser tree builder.
+
+    The stack of open tags is kept as BeautifulSoup keeps it: end tags close
+    every tag opened after their own and are ignored when no such tag is
+    open, and empty-element tags such as <br> are closed right away.
+    Entities are decoded with the BeautifulSoup tables and runs of ASCII
+    whitespace between tags collapse to a single space or newline outside
+    <pre>/<textarea>, so the output matches get_text(); see strip_html for
+    where it can differ.
+    """
+
+    def __init__(self):
+        super(_TextParser, self).__init__(convert_charrefs=False)
+        self.clear()
+
+    def clear(self):
+        self.parts = []
+        self.data = []
+        self.open_tags = []
+        self.closed_empty_tags = []
+        self.skipped_depth = 0
+        self.preserved_depth = 0
+
+    def extract(self, text):
+        self.reset()
+        self.clear()
+
+        self.feed(text)
+
+        if self.rawdata:
+            return None
+
+        self.end_data()
+
+        return "".join(self.parts)
+
+    def end_data(self, cdata=False):
+        if not self.data:
+            return
+
+        data = "".join(self.data)
+        self.data = []
+
+        if self.preserved_depth == 0 and not data.strip(_ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+
+        # CDATA sections keep their own string class inside skipped tags
+        if cdata or self.skipped_depth == 0:
+            self.parts.append(data)
+
+    def push_tag(self, tag):
+        self.open_tags.append(tag)
+
+        if tag in _SKIPPED_TAGS:
+            self.skipped_depth += 1
+        if tag in _PRESERVED_TAGS:
+            self.preserved_depth += 1
+
+    def pop_tag(self):
+        tag = self.open_tags.pop()
+
+        if tag in _SKIPPED_TAGS:
+            self.skipped_depth -= 1
+        if tag in _PRESERVED_TAGS:
+            self.preserved_depth -= 1
+
+        return tag
+
+    def handle_starttag(self, tag, attrs, empty_element=True):
+        self.end_data()
+        self.push_tag(tag)
+
+        if empty_element and tag in _EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag, check_closed=False)
+            # A matching end tag later on closes nothing
+            self.closed_empty_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, empty_element=False)
+        self.handle_endtag(tag, check_closed=False)
+
+    def handle_endtag(self, tag, check_closed=True):
+        if check_closed and tag in self.closed_empty_tags:
+            self.closed_empty_tags.remove(tag)
+            return
+
+        self.end_data()
+
+        if tag in self.open_tags:
+            while self.pop_tag() != tag:
+                pass
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.data.append(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        self.data.append(_dereference_charref(name))
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+
+        if data.upper().startswith("CDATA["):
+            self.data.append(data[len("CDATA["):])
+            self.end_data(cdata=True)
+
+
+def _dereference_charref(name):
+    """
+    Text of a numeric character reference as the BeautifulSoup 4.15
+    html.parser builder produces it: the HTML5 "numeric character reference end state"
+    rules, with any data after the digits kept as text.
+    """
+    base, digits, pattern = 10, name, _DECIMAL_REFERENCE
+    if name[:1] in ("x", "X"):
+        base, digits, pattern = 16, name[1:], _HEX_REFERENCE
+
+    extra = ""
+    try:
+        number = int(digits, base)
+    except ValueError:
+        match = pattern.search(digits)
+        if match is None:
+            return digits
+        number, extra = int(match.group(1), base), match.group(2)
+
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return "\ufffd" + extra
+    if 0x80 <= number <= 0x9F:
+        # Windows-1252 code points in place of Unicode ones, e.g. &#147;
+        return html.unescape(f"&#{number};") + extra
+
+    return chr(number) + extra
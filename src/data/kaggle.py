@@ -1,7 +1,28 @@
+import io
+import json
 import logging
+import struct
 from pathlib import Path
 import zipfile
-import kaggle
+import zlib
+
+import pyarrow as pa
+
+from src.data.encoding_cache import file_hash
+
+_CHECKSUM_SUFFIX = ".sha256.json"
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_TAIL_SIZE = 1 << 20
+_JSON_LINES_SUFFIXES = (".json", ".jsonl")
+
+
+def _kaggle_api():
+    # The kaggle package authenticates on import, so only load it when needed
+    import kaggle
+
+    kaggle.api.authenticate()
+
+    return kaggle.api
 
 
 def download_dataset(
@@ -14,14 +35,15 @@ def download_dataset(
 
     file_path = dest / f"{name}.zip"
 
-    if file_path.is_file():
+    if is_archive_intact(file_path, logger=logger):
         logger.info(
             "Found [ %s ] dataset in [ %s ]. Skipping download...", name, file_path
         )
     else:
         logger.info("Downloading [ %s ] dataset to [ %s ]", name, file_path)
-        kaggle.api.authenticate()
-        kaggle.api.dataset_download_files(dataset=f"{owner}/{name}", path=dest)
+        file_path.unlink(missing_ok=True)
+        _kaggle_api().dataset_download_files(dataset=f"{owner}/{name}", path=dest)
+        write_archive_checksum(file_path)
 
     return file_path
 
@@ -31,11 +53,17 @@ def download_competition_dataset(
     dest: Path,
     logger: logging.Logger = logging.getLogger(__name__),
 ) -> Path:
+    """
+    Returns:
+        Path: The competition archive; read its files in place with
+            archive_members and read_member or iter_member_batches instead
+            of unzip_file
+    """
     dest.mkdir(parents=True, exist_ok=True)
 
     file_path = dest / f"{competition}.zip"
 
-    if file_path.is_file():
+    if is_archive_intact(file_path, logger=logger):
         logger.info(
             "Found [ %s ] dataset in [ %s ]. Skipping download...",
             competition,
@@ -43,12 +71,67 @@ def download_competition_dataset(
         )
     else:
         logger.info("Downloading [ %s ] dataset to [ %s ]", competition, file_path)
-        kaggle.api.authenticate()
-        kaggle.api.competition_download_files(competition, path=dest)
+        file_path.unlink(missing_ok=True)
+        _kaggle_api().competition_download_files(competition, path=dest)
+        write_archive_checksum(file_path)
 
     return file_path
 
 
+def write_archive_checksum(archive: Path) -> str:
+    """
+    Record the archive's SHA-256 next to it, as `<archive>.sha256.json`.
+    """
+    checksum = file_hash(archive)
+
+    with open(archive.with_name(archive.name + _CHECKSUM_SUFFIX), "w") as f:
+        json.dump({"sha256": checksum, "size": archive.stat().st_size}, f)
+
+    return checksum
+
+
+def is_archive_intact(
+    archive: Path,
+    logger: logging.Logger = logging.getLogger(__name__),
+) -> bool:
+    """
+    Whether a downloaded archive can be reused.
+
+    An archive with a recorded checksum is reused when its SHA-256 still
+    matches. One without, e.g. downloaded before checksums were recorded,
+    is reused when every member passes its CRC check, and its checksum is
+    recorded then. Missing, truncated or corrupted archives are not.
+    """
+    if not archive.is_file():
+        return False
+
+    checksum_path = archive.with_name(archive.name + _CHECKSUM_SUFFIX)
+
+    if checksum_path.is_file():
+        with open(checksum_path) as f:
+            expected = json.load(f)
+
+        if expected["size"] == archive.stat().st_size and expected["sha256"] == file_hash(archive):
+            return True
+
+        logger.warning("[ %s ] does not match its recorded checksum", archive)
+        return False
+
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            corrupted = zf.testzip()
+    except (zipfile.BadZipFile, zlib.error, EOFError):
+        corrupted = archive.name
+
+    if corrupted is not None:
+        logger.warning("[ %s ] is corrupted at [ %s ]", archive, corrupted)
+        return False
+
+    write_archive_checksum(archive)
+
+    return True
+
+
 def unzip_file(
     archive: Path,
     logger: logging.Logger = logging.getLogger(__name__),
@@ -66,9 +149,261 @@ def unzip_file(
     return dest_file
 
 
+def archive_members(archive: Path) -> list:
+    """
+    Names of the files in an archive, directories left out.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        return [it.filename for it in zf.infolist() if not it.is_dir()]
+
+
+def member_checksum(archive: Path, member: str) -> str:
+    """
+    Content fingerprint of an archive member from the zip directory alone:
+    its CRC-32 and uncompressed size.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo(member)
+
+    return f"crc32:{info.CRC:08x}:{info.file_size}"
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    Seekable reader over a compressed archive member.
+
+    zipfile inflates again from the start on every backwards seek, and
+    parquet readers visit the footer several times before reading the row
+    groups front to back. The last _TAIL_SIZE bytes are therefore inflated
+    once and served from memory, and everything else is streamed.
+    """
+
+    def __init__(self, stream, size: int):
+        self.__stream = stream
+        self.__size = size
+        self.__position = 0
+        self.__tail_start = max(0, size - _TAIL_SIZE)
+        self.__tail = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.__position, io.SEEK_END: self.__size}[whence]
+        self.__position = min(max(base + offset, 0), self.__size)
+
+        return self.__position
+
+    def readinto(self, buffer):
+        end = min(self.__position + len(buffer), self.__size)
+
+        if self.__position >= self.__tail_start:
+            if self.__tail is None:
+                self.__stream.seek(self.__tail_start)
+                self.__tail = self.__stream.read()
+
+            data = self.__tail[self.__position - self.__tail_start : end - self.__tail_start]
+        else:
+            if self.__stream.tell() != self.__position:
+                self.__stream.seek(self.__position)
+            data = self.__stream.read(end - self.__position)
+
+        buffer[: len(data)] = data
+        self.__position += len(data)
+
+        return len(data)
+
+    def close(self):
+        self.__stream.close()
+        super().close()
+
+
+def open_member(archive: Path, member: str):
+    """
+    Seekable reader over an archive member without extracting it.
+
+    Stored members are a zero-copy view into a memory map of the archive.
+    Compressed members are inflated as they are read, see _MemberReader,
+    so memory stays flat regardless of the member size.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo(member)
+
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            # The member stream keeps the archive file open past this block
+            return _MemberReader(zf.open(info), info.file_size)
+
+    # Buffers keep their part of the map alive after it is closed, and it
+    # is unmapped once the reader and its buffers are gone
+    with pa.memory_map(str(archive)) as mapped:
+        header = _LOCAL_HEADER.unpack_from(
+            mapped.read_at(_LOCAL_HEADER.size, info.header_offset)
+        )
+        start = info.header_offset + _LOCAL_HEADER.size + header[-2] + header[-1]
+        data = mapped.read_at(info.file_size, start)
+
+    return pa.BufferReader(data)
+
+
+def iter_member_batches(
+    archive: Path,
+    member: str,
+    columns: list = None,
+    filters=None,
+    batch_size: int = 10_000,
+):
+    """
+    Stream a parquet, CSV or JSON lines archive member as Arrow record
+    batches, without extracting or fully loading it.
+
+    Parquet members get columns and filters while their row groups are
+    scanned. CSV and JSON lines members are parsed in chunks by pandas, as
+    the datasets CSV and JSON builders do, and every chunk is then filtered
+    and projected. Since pandas infers the types of every chunk on its own,
+    these members are parsed twice: once to find types that fit all chunks,
+    see _promote_schema, and once to hand them out cast to those types.
+
+    Args:
+        columns: Only keep these columns
+        filters: pyarrow.dataset.Expression rows have to satisfy, see
+            src.data.arrow_filters; it may use columns outside of columns
+    """
+    if Path(member).suffix == ".parquet":
+        import pyarrow.dataset as pds
+
+        with open_member(archive, member) as f:
+            fragment = pds.ParquetFileFormat().make_fragment(f)
+            # One row group at a time, in file order: a compressed member is
+            # read in a single forward pass, and each scan is finished
+            # before its batches are handed out, so stopping early leaves
+            # no Arrow read pending on the member
+            for row_group in fragment.row_groups:
+                batches = fragment.subset(row_group_ids=[row_group.id]).to_batches(
+                    columns=columns,
+                    filter=filters,
+                    batch_size=batch_size,
+                    batch_readahead=0,
+                    fragment_readahead=0,
+                )
+                yield from list(batches)
+        return
+
+    for table in _iter_text_member(archive, member, columns, filters, batch_size):
+        yield from table.to_batches()
+
+
+def _iter_text_member(archive, member, columns, filters, batch_size):
+    schema = None
+    for table in _read_text_chunks(archive, member, batch_size):
+        schema = table.schema if schema is None else _promote_schema(schema, table.schema)
+
+    for table in _read_text_chunks(archive, member, batch_size):
+        yield _filter_and_select(_cast_chunk(table, schema), columns, filters)
+
+
+def _read_text_chunks(archive, member, batch_size):
+    import pandas as pd
+
+    suffix = Path(member).suffix
+
+    if suffix == ".csv":
+        read_chunks = lambda f: pd.read_csv(f, chunksize=batch_size)
+    elif suffix in _JSON_LINES_SUFFIXES:
+        read_chunks = lambda f: pd.read_json(
+            f, lines=True, chunksize=batch_size, dtype=False, convert_dates=False
+        )
+    else:
+        raise ValueError(f"Unsupported archive member [ {member} ]")
+
+    with zipfile.ZipFile(archive) as zf, zf.open(member) as f:
+        for chunk in read_chunks(f):
+            yield pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata()
+
+
+def _promote_schema(schema, other):
+    """
+    Fields of both schemas by name, in order of appearance. Types are
+    widened where Arrow can (null to any type, int to float), and columns
+    with values of two kinds, e.g. numbers first and text later, become
+    strings.
+    """
+    fields = {it.name: it for it in schema}
+
+    for field in other:
+        current = fields.get(field.name)
+
+        if current is None or current.type == field.type:
+            fields[field.name] = current or field
+            continue
+
+        try:
+            fields[field.name] = pa.unify_schemas(
+                [pa.schema([current]), pa.schema([field])], promote_options="permissive"
+            ).field(0)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields[field.name] = current.with_type(pa.large_string())
+
+    return pa.schema(list(fields.values()))
+
+
+def _cast_chunk(table, schema):
+    return pa.Table.from_arrays(
+        [
+            table.column(it.name).cast(it.type)
+            if it.name in table.column_names
+            else pa.nulls(len(table), it.type)
+            for it in schema
+        ],
+        schema=schema,
+    )
+
+
+def _filter_and_select(table, columns, filters):
+    if filters is not None:
+        table = table.filter(filters)
+
+    return table.select(columns) if columns is not None else table
+
+
+def read_member(
+    archive: Path,
+    member: str,
+    columns: list = None,
+    filters=None,
+) -> pa.Table:
+    """
+    Read a parquet, CSV or JSON lines archive member into an Arrow table,
+    for members that fit in memory; see iter_member_batches otherwise.
+
+    Args:
+        columns: Only decode these columns
+        filters: pyarrow.dataset.Expression rows have to satisfy, see
+            src.data.arrow_filters
+    """
+    if Path(member).suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        with open_member(archive, member) as f:
+            return pq.read_table(f, columns=columns, filters=filters)
+
+    tables = list(_read_text_chunks(archive, member, 10_000))
+    schema = tables[0].schema
+    for table in tables[1:]:
+        schema = _promote_schema(schema, table.schema)
+
+    return pa.concat_tables(
+        [_filter_and_select(_cast_chunk(it, schema), columns, filters) for it in tables]
+    )
+
+
 def submit_competition(path, message, competition):
-    kaggle.api.authenticate()
-    kaggle.api.competition_submit(path, message, competition)
+    _kaggle_api().competition_submit(path, message, competition)
 
 
 def submit_df_competition(df, submission_path, message, competition):
@@ -0,0 +1,95 @@
+from itertools import chain
+
+import numpy as np
+
+IGNORE_LABEL = -100
+
+
+def align_batch_labels(offset_mapping, trigger_words, word_ids, exclude_tail=True):
+    """
+    Label a whole tokenized batch in bulk.
+
+    A token is labelled 1 when its character offsets lie fully inside at least
+    one trigger span. Every example is shifted into its own character range, so
+    all spans of the batch are swept at once: spans are sorted by start, a
+    running maximum of their ends is kept, and a token (s, e) is covered iff the
+    widest span starting at or before s ends at or after e.
+
+    Special tokens (word id None) are masked with -100. With exclude_tail, every
+    sub-token after the first one of a word is masked as well.
+
+    Args:
+        offset_mapping: List of per-example lists of (start, end) token offsets
+        trigger_words: List of per-example lists of (start, end) spans, may be None
+        word_ids: List of per-example word id lists as returned by word_ids(i)
+        exclude_tail: Whether to mask non-first sub-tokens of a word
+
+    Returns:
+        list: Per-example lists of labels, same as the per-token loop would give
+    """
+    lengths = np.fromiter(
+        (len(it) for it in offset_mapping), dtype=np.int64, count=len(offset_mapping)
+    )
+    total = int(lengths.sum())
+    example_idx = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+
+    offsets = np.fromiter(
+        chain.from_iterable(chain.from_iterable(offset_mapping)),
+        dtype=np.int64,
+        count=2 * total,
+    ).reshape(-1, 2)
+
+    span_counts = np.fromiter(
+        (0 if it is None else len(it) for it in trigger_words),
+        dtype=np.int64,
+        count=len(trigger_words),
+    )
+    spans = np.fromiter(
+        chain.from_iterable(
+            chain.from_iterable(it) for it in trigger_words if it is not None
+        ),
+        dtype=np.int64,
+        count=2 * int(span_counts.sum()),
+    ).reshape(-1, 2)
+
+    labels = np.zeros(total, dtype=np.int64)
+
+    if len(spans) > 0 and total > 0:
+        shift = max(int(offsets.max()), int(spans.max())) + 1
+        span_shift = np.repeat(np.arange(len(span_counts), dtype=np.int64), span_counts)
+        span_shift *= shift
+        span_starts = spans[:, 0] + span_shift
+        span_ends = spans[:, 1] + span_shift
+
+        order = np.argsort(span_starts, kind="stable")
+        span_starts = span_starts[order]
+        span_ends_max = np.maximum.accumulate(span_ends[order])
+
+        token_starts = offsets[:, 0] + example_idx * shift
+        token_ends = offsets[:, 1] + example_idx * shift
+
+        candidates = np.searchsorted(span_starts, token_starts, side="right")
+        covered = candidates > 0
+        labels[covered] = span_ends_max[candidates[covered] - 1] >= token_ends[covered]
+
+    ids = np.fromiter(
+        (-1 if it is None else it for it in chain.from_iterable(word_ids)),
+        dtype=np.int64,
+        count=total,
+    )
+    mask = ids < 0
+
+    if exclude_tail and total > 1:
+        same_example = example_idx[1:] == example_idx[:-1]
+        mask[1:] |= (ids[1:] == ids[:-1]) & same_example
+
+    labels[mask] = IGNORE_LABEL
+
+    flat = labels.tolist()
+    bounds = np.concatenate(([0], np.cumsum(lengths))).tolist()
+
+    return [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def align_labels(offsets, spans, word_ids, exclude_tail=True):
+    return align_batch_labels([offsets], [spans], [word_ids], exclude_tail)[0]
@@ -1,9 +1,12 @@
 from datetime import datetime
 from datasets import load_dataset, Dataset
-import multiprocessing
 
 import pandas as pd
 
+from src.data.arrow_filters import not_null, timestamp_after
+from src.data.news_corpus import load_corpus, tokenized_corpus
+from src.util.cpu_budget import dataset_num_proc
+
 REF_DATE = datetime(2022, 2, 24)
 
 
@@ -11,6 +14,10 @@ def load_lenta_ru_extended_dataset(
     tokenizer,
     rows_count=None,
     max_tokens=512,
+    data_files=None,
+    streaming=False,
+    materialize=True,
+    member=None,
 ):
     def preprocess_function(examples):
         return tokenizer(examples["news"], truncation=False)
@@ -18,26 +25,42 @@ def load_lenta_ru_extended_dataset(
     def filter_long_examples(example):
         return len(example["input_ids"]) <= max_tokens
 
-    def filter_invalid_examples(example):
-        if example["date"] is None or example["news"] is None:
-            return False
-        return datetime.strptime(example["date"], "%Y-%m-%d %H:%M:%S") > REF_DATE
+    # Articles published after REF_DATE, evaluated by Arrow at read time
+    valid_examples = not_null("news") & timestamp_after("date", REF_DATE)
 
-    core_count = multiprocessing.cpu_count()
+    if streaming:
+        return tokenized_corpus(
+            load_corpus(
+                "data-silence/lenta.ru_2-extended",
+                rows_count=rows_count,
+                data_files=data_files,
+                member=member,
+                streaming=True,
+                columns=["news"],
+                filters=valid_examples,
+            ),
+            tokenizer,
+            text_column="news",
+            max_tokens=max_tokens,
+            materialize=materialize,
+        )
 
-    split = f"train[:{rows_count}]" if rows_count is not None else "train"
+    core_count = dataset_num_proc()
 
-    ds = load_dataset(
+    ds = load_corpus(
         "data-silence/lenta.ru_2-extended",
-        split=split,
+        rows_count=rows_count,
+        data_files=data_files,
+        member=member,
         num_proc=core_count,
+        columns=["news"],
+        filters=valid_examples,
     )
 
-    ds = ds.filter(filter_invalid_examples)
-    ds = ds.select_columns(["news"])
     ds = ds.map(
         preprocess_function, remove_columns=["news"], num_proc=core_count, batched=True
     )
-    ds = ds.filter(filter_long_examples)
+    if max_tokens is not None:
+        ds = ds.filter(filter_long_examples)
 
     return ds
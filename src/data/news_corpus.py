@@ -0,0 +1,190 @@
+from itertools import islice
+from pathlib import Path
+
+from datasets import Dataset, IterableDataset, load_dataset, load_dataset_builder
+
+from src.data.arrow_filters import filter_dataset
+from src.data.kaggle import iter_member_batches, member_checksum
+
+__BUILDERS = {
+    ".parquet": "parquet",
+    ".json": "json",
+    ".jsonl": "json",
+    ".csv": "csv",
+}
+
+
+def load_corpus(
+    name: str,
+    rows_count=None,
+    data_files=None,
+    streaming: bool = False,
+    num_proc: int = None,
+    columns: list = None,
+    filters=None,
+    member: str = None,
+):
+    """
+    Load a news corpus from the hub or from a local parquet/JSONL/CSV mirror.
+
+    Parquet sources, local or on the hub, get columns and filters at read
+    time: row groups are filtered with Arrow compute before any row reaches
+    Python and the other columns are never decoded. Other formats are
+    filtered in Arrow batches after loading.
+
+    Args:
+        name: Hub dataset name, ignored when data_files is set
+        rows_count: Only read the first rows_count rows that pass filters
+        data_files: Local file or list of files mirroring the hub dataset
+        streaming: Return an IterableDataset that reads rows lazily
+        columns: Only keep these columns
+        filters: pyarrow.dataset.Expression rows have to satisfy, see
+            src.data.arrow_filters; it may use columns outside of columns
+        member: Parquet, CSV or JSON lines file inside the zip archive
+            data_files, streamed in place with iter_member_batches
+    """
+    if member is not None:
+        gen_kwargs = {
+            "archive": str(data_files),
+            "member": member,
+            # A tuple, list values would be split into generator shards
+            "columns": tuple(columns) if columns is not None else None,
+            "filters": filters,
+            "rows_count": rows_count,
+            # Part of the generator fingerprint, so a changed archive is re-read
+            "checksum": member_checksum(data_files, member),
+        }
+
+        if streaming:
+            return IterableDataset.from_generator(_member_rows, gen_kwargs=gen_kwargs)
+
+        return Dataset.from_generator(_member_rows, gen_kwargs=gen_kwargs)
+
+    if data_files is not None:
+        files = [data_files] if isinstance(data_files, (str, Path)) else list(data_files)
+        name = __BUILDERS[Path(files[0]).suffix]
+        data_files = [str(it) for it in files]
+
+    pushdown = {}
+    if columns is not None or filters is not None:
+        builder = name if data_files is not None else load_dataset_builder(name).name
+        if builder == "parquet":
+            pushdown = {"columns": columns, "filters": filters}
+
+    if streaming:
+        ds = load_dataset(name, data_files=data_files, split="train", streaming=True, **pushdown)
+        ds = _filter_and_project(ds, columns, filters, pushdown)
+        return ds.take(rows_count) if rows_count is not None else ds
+
+    if pushdown or filters is None:
+        split = f"train[:{rows_count}]" if rows_count is not None else "train"
+        ds = load_dataset(name, data_files=data_files, split=split, num_proc=num_proc, **pushdown)
+        return _filter_and_project(ds, columns, filters, pushdown)
+
+    ds = load_dataset(name, data_files=data_files, split="train", num_proc=num_proc)
+    ds = _filter_and_project(ds, columns, filters, pushdown, num_proc)
+
+    return ds.select(range(min(rows_count, len(ds)))) if rows_count is not None else ds
+
+
+def _member_rows(archive, member, columns, filters, rows_count, checksum):
+    remaining = rows_count
+
+    columns = list(columns) if columns is not None else None
+
+    for batch in iter_member_batches(archive, member, columns=columns, filters=filters):
+        rows = batch.to_pylist()
+        if remaining is not None:
+            rows = rows[:remaining]
+            remaining -= len(rows)
+
+        yield from rows
+
+        if remaining == 0:
+            return
+
+
+def _filter_and_project(ds, columns, filters, pushdown, num_proc=None):
+    if pushdown:
+        return ds
+    if filters is not None:
+        ds = filter_dataset(ds, filters, num_proc=num_proc)
+
+    return ds.select_columns(columns) if columns is not None else ds
+
+
+def tokenized_corpus(
+    rows,
+    tokenizer,
+    text_column: str,
+    max_tokens: int = 512,
+    keep=None,
+    clean_texts=None,
+    batch_size: int = 1000,
+    materialize: bool = True,
+):
+    """
+    Filter, clean, tokenize and length-filter corpus rows in a single pass.
+
+    Rows are consumed lazily in batches, so memory stays flat regardless of
+    corpus size. Texts with more whitespace-separated words than max_tokens
+    are dropped before tokenization: every word yields at least one token.
+
+    Args:
+        rows: Iterable of row dicts, e.g. a streaming dataset from load_corpus
+        tokenizer: Tokenizer applied with truncation=False
+        text_column: Column holding the article text
+        max_tokens: Longest accepted tokenized article, None keeps all of them
+        keep: Optional row predicate applied before anything else
+        clean_texts: Optional batched text transformation, e.g. HTML stripping
+        materialize: Write the result to a single Arrow dataset, otherwise
+            return an IterableDataset that is computed on iteration
+
+    Returns:
+        Dataset or IterableDataset with the tokenizer output columns
+    """
+    gen_kwargs = {
+        "rows": rows,
+        "tokenizer": tokenizer,
+        "text_column": text_column,
+        "max_tokens": max_tokens,
+        "keep": keep,
+        "clean_texts": clean_texts,
+        "batch_size": batch_size,
+    }
+
+    if materialize:
+        return Dataset.from_generator(_generate_tokenized, gen_kwargs=gen_kwargs)
+
+    return IterableDataset.from_generator(_generate_tokenized, gen_kwargs=gen_kwargs)
+
+
+def _generate_tokenized(rows, tokenizer, text_column, max_tokens, keep, clean_texts, batch_size):
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+
+        if not batch:
+            return
+
+        texts = [
+            row[text_column]
+            for row in batch
+            if row[text_column] is not None and (keep is None or keep(row))
+        ]
+
+        if clean_texts is not None:
+            texts = clean_texts(texts)
+
+        if max_tokens is not None:
+            texts = [it for it in texts if len(it.split()) <= max_tokens]
+
+        if not texts:
+            continue
+
+        encoded = tokenizer(texts, truncation=False)
+
+        for i, input_ids in enumerate(encoded["input_ids"]):
+            if max_tokens is None or len(input_ids) <= max_tokens:
+                yield {k: v[i] for k, v in encoded.items()}
@@ -0,0 +1,215 @@
+import logging
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+from datasets import Dataset
+
+PAD_DOCUMENT_ID = -1
+
+
+def pack_sequences(
+    ds,
+    output_path: Path,
+    block_size: int = 512,
+    separator_id: int = None,
+    pad_token_id: int = None,
+    document_mask: bool = False,
+    batch_size: int = 1000,
+    logger: logging.Logger = logging.getLogger(__name__),
+):
+    """
+    Concatenate tokenized documents into fixed-length MLM blocks.
+
+    Documents are read in batches, concatenated (with separator_id after
+    each one, if given) and cut into block_size blocks, which are appended to
+    an Arrow stream file as soon as they are complete, so memory stays flat.
+    Documents longer than a block continue in the next one instead of being
+    dropped. The remainder is padded into a last block when pad_token_id is
+    set, otherwise dropped.
+
+    Args:
+        ds: Dataset or IterableDataset with an input_ids column, e.g. from
+            load_train_test_dataset(truncation=False) or a news loader with
+            max_tokens=None
+        output_path: Arrow file the blocks are streamed to
+        document_mask: Add a document_ids column numbering the documents
+            inside every block (-1 on padding), for DocumentMaskCollator
+
+    Returns:
+        tuple: Memory-mapped Dataset of blocks and the packing stats dict
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    writer = None
+    ids_buffer = np.empty(0, dtype=np.int32)
+    docs_buffer = np.empty(0, dtype=np.int64)
+    documents_count = 0
+    lengths_parts = []
+
+    def write(ids, docs, attention_mask):
+        nonlocal writer
+
+        columns = {
+            "input_ids": ids,
+            "attention_mask": attention_mask,
+        }
+        if document_mask:
+            columns["document_ids"] = block_document_ids(docs)
+
+        offsets = pa.array(np.arange(0, ids.size + 1, block_size, dtype=np.int32))
+        batch = pa.RecordBatch.from_pydict(
+            {
+                k: pa.ListArray.from_arrays(offsets, pa.array(np.ravel(v), type=pa.int32()))
+                for k, v in columns.items()
+            }
+        )
+
+        if writer is None:
+            writer = pa.ipc.new_stream(str(output_path), batch.schema)
+        writer.write_batch(batch)
+
+    for batch in ds.iter(batch_size=batch_size):
+        documents = batch["input_ids"]
+        lengths = np.fromiter(map(len, documents), dtype=np.int64, count=len(documents))
+        ids = np.fromiter(chain.from_iterable(documents), dtype=np.int32, count=int(lengths.sum()))
+
+        if separator_id is not None:
+            ids, lengths = __append_separators(ids, lengths, separator_id)
+
+        lengths_parts.append(lengths)
+        docs = np.repeat(np.arange(documents_count, documents_count + len(lengths)), lengths)
+        documents_count += len(lengths)
+
+        ids_buffer = np.concatenate((ids_buffer, ids))
+        docs_buffer = np.concatenate((docs_buffer, docs))
+
+        full = len(ids_buffer) // block_size * block_size
+        if full > 0:
+            write(
+                ids_buffer[:full].reshape(-1, block_size),
+                docs_buffer[:full].reshape(-1, block_size),
+                np.ones((full // block_size, block_size), dtype=np.int32),
+            )
+            ids_buffer = ids_buffer[full:]
+            docs_buffer = docs_buffer[full:]
+
+    dropped_tokens = 0
+    if len(ids_buffer) > 0 and pad_token_id is not None:
+        padding = block_size - len(ids_buffer)
+        write(
+            np.pad(ids_buffer, (0, padding), constant_values=pad_token_id)[None, :],
+            np.pad(docs_buffer, (0, padding), constant_values=PAD_DOCUMENT_ID)[None, :],
+            np.pad(np.ones(len(ids_buffer), dtype=np.int32), (0, padding))[None, :],
+        )
+    else:
+        dropped_tokens = len(ids_buffer)
+
+    if writer is None:
+        raise ValueError(f"Not enough tokens for a single block of [ {block_size} ]")
+    writer.close()
+
+    packed = Dataset.from_file(str(output_path))
+    lengths = np.concatenate(lengths_parts)
+    stats = packing_stats(lengths, len(packed), block_size, dropped_tokens)
+
+    logger.info(
+        "Packed [ %s ] documents into [ %s ] blocks of [ %s ]: "
+        "padding efficiency [ %.3f ] -> [ %.3f ], x%.1f fewer sequences",
+        stats["documents"],
+        stats["blocks"],
+        block_size,
+        stats["unpacked_efficiency"],
+        stats["packed_efficiency"],
+        stats["sequence_reduction"],
+    )
+
+    return packed, stats
+
+
+def packing_stats(lengths, blocks_count, block_size, dropped_tokens=0):
+    """
+    Share of real tokens among all sequence positions before and after packing.
+
+    Unpacked, every document is padded to block_size and truncated beyond it,
+    which is the best case for padding to a fixed length.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    tokens = int(lengths.sum())
+    kept_unpacked = int(np.minimum(lengths, block_size).sum())
+
+    unpacked_efficiency = kept_unpacked / (len(lengths) * block_size) if len(lengths) else 0.0
+    packed_efficiency = (
+        (tokens - dropped_tokens) / (blocks_count * block_size) if blocks_count else 0.0
+    )
+
+    return {
+        "documents": len(lengths),
+        "tokens": tokens,
+        "blocks": blocks_count,
+        "dropped_tokens": dropped_tokens,
+        "truncated_tokens": tokens - kept_unpacked,
+        "unpacked_efficiency": unpacked_efficiency,
+        "packed_efficiency": packed_efficiency,
+        "sequence_reduction": len(lengths) / blocks_count if blocks_count else 0.0,
+    }
+
+
+def block_document_ids(docs):
+    """
+    Renumber global document ids [blocks, block_size] from 0 inside each block.
+    """
+    docs = np.asarray(docs)
+    starts = np.ones(docs.shape, dtype=bool)
+    starts[:, 1:] = docs[:, 1:] != docs[:, :-1]
+
+    result = np.cumsum(starts, axis=1, dtype=np.int32) - 1
+    result[docs == PAD_DOCUMENT_ID] = PAD_DOCUMENT_ID
+
+    return result
+
+
+class DocumentMaskCollator:
+    """
+    Wraps an MLM collator and replaces the attention mask of packed blocks with
+    a [batch, seq, seq] mask of 1 where a token may attend and 0 elsewhere, so
+    tokens only attend within their own document.
+
+    BERT and XLM-R take such a 3D mask as is and turn it into the additive
+    mask themselves; dtype should be the model's dtype.
+    """
+
+    def __init__(self, collator, dtype=None):
+        self.collator = collator
+        self.dtype = dtype
+
+    def __call__(self, features):
+        import torch
+
+        document_ids = [feature.pop("document_ids") for feature in features]
+        batch = self.collator(features)
+
+        seq_len = batch["input_ids"].shape[1]
+        docs = torch.full((len(document_ids), seq_len), PAD_DOCUMENT_ID, dtype=torch.long)
+        for i, it in enumerate(document_ids):
+            docs[i, : len(it)] = torch.as_tensor(it)
+
+        allowed = (docs[:, :, None] == docs[:, None, :]) & (
+            docs[:, None, :] != PAD_DOCUMENT_ID
+        )
+        batch["attention_mask"] = allowed.to(self.dtype or torch.float32)
+
+        return batch
+
+
+def __append_separators(ids, lengths, separator_id):
+    total = lengths + 1
+    result = np.full(int(total.sum()), separator_id, dtype=ids.dtype)
+
+    is_token = np.ones(len(result), dtype=bool)
+    is_token[np.cumsum(total) - 1] = False
+    result[is_token] = ids
+
+    return result, total
@@ -1,11 +1,17 @@
 from datasets import load_dataset
-import multiprocessing
+
+from src.data.news_corpus import load_corpus, tokenized_corpus
+from src.util.cpu_budget import dataset_num_proc
 
 
 def load_rus_news_classifier_dataset(
     tokenizer,
     rows_count=None,
     max_tokens=512,
+    data_files=None,
+    streaming=False,
+    materialize=True,
+    member=None,
 ):
     def preprocess_function(examples):
         return tokenizer(examples["news"], truncation=False)
@@ -13,19 +19,35 @@ def load_rus_news_classifier_dataset(
     def filter_long_examples(example):
         return len(example["input_ids"]) <= max_tokens
 
-    core_count = multiprocessing.cpu_count()
+    if streaming:
+        return tokenized_corpus(
+            load_corpus(
+                "data-silence/rus_news_classifier",
+                rows_count=rows_count,
+                data_files=data_files,
+                member=member,
+                streaming=True,
+            ),
+            tokenizer,
+            text_column="news",
+            max_tokens=max_tokens,
+            materialize=materialize,
+        )
 
-    split = f"train[:{rows_count}]" if rows_count is not None else "train"
+    core_count = dataset_num_proc()
 
-    ds = load_dataset(
+    ds = load_corpus(
         "data-silence/rus_news_classifier",
-        split=split,
+        rows_count=rows_count,
+        data_files=data_files,
+        member=member,
         num_proc=core_count,
     )
     ds = ds.select_columns(["news"])
     ds = ds.map(
         preprocess_function, remove_columns=["news"], num_proc=core_count, batched=True
     )
-    ds = ds.filter(filter_long_examples)
+    if max_tokens is not None:
+        ds = ds.filter(filter_long_examples)
 
     return ds
@@ -1,14 +1,36 @@
-import ast
+import json
+import logging
 from pathlib import Path
-import re
+from typing import TYPE_CHECKING
 import numpy as np
-from transformers import PreTrainedTokenizerBase, BertTokenizerFast
-from datasets import load_dataset, DatasetDict
+from datasets import Dataset, load_dataset, load_from_disk
+
+from src.data.arrow_filters import equals, filter_dataset
+from src.data.dedup import near_duplicate_mask
+from src.data.encoding_cache import (
+    EncodingCache,
+    file_hash,
+    make_cache_key,
+    read_cache_key,
+    tokenizer_fingerprint,
+    write_cache_key,
+)
+from src.data.kaggle import member_checksum, read_member
+from src.data.label_alignment import align_batch_labels
+from src.definitions import TECHNIQUE_DESCRIPTIONS_PATH
+
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase, BertTokenizerFast
+
+logger = logging.getLogger(__name__)
+
+with open(TECHNIQUE_DESCRIPTIONS_PATH, encoding="utf-8") as _file:
+    TECHNIQUES = list(json.load(_file))
 
 
 class ManipulationDetectionDataset:
 
-    __tokenizer: BertTokenizerFast
+    __tokenizer: "BertTokenizerFast"
     __raw_path: Path
     __processed_path: Path
     __train_ratio: float = 0.9
@@ -20,9 +42,16 @@ class ManipulationDetectionDataset:
     __id2label = {v: k for k, v in __label2id.items()}
     __exclude_tail: bool = True
     __load_existing: bool = False
+    __max_length: int = None
+    __stride: int = None
+    __cache: EncodingCache = None
+    __with_techniques: bool = False
+    __raw_member: str = None
+    __near_duplicate_threshold: float = None
+
     def __init__(
         self,
-        tokenizer: PreTrainedTokenizerBase,
+        tokenizer: "PreTrainedTokenizerBase",
         raw_path: Path,
         processed_path: Path,
         exclude_tail: bool = True,
@@ -30,8 +59,25 @@ class ManipulationDetectionDataset:
         seed: int = 42,
         load_existing: bool = False,
         do_split: bool = True,
-        lang: str = None
+        lang: str = None,
+        max_length: int = None,
+        stride: int = None,
+        cache: EncodingCache = None,
+        with_techniques: bool = False,
+        raw_member: str = None,
+        near_duplicate_threshold: float = None,
     ):
+        """
+        Args:
+            with_techniques: Also add a multi-hot `technique_labels` column
+                over TECHNIQUES, for MultiTaskModel
+            raw_member: Parquet file inside the zip archive raw_path, e.g.
+                from download_competition_dataset, read without extracting
+            near_duplicate_threshold: Drop test posts whose content
+                near-duplicates a train post at this estimated Jaccard
+                similarity, see NearDuplicateIndex, so reposts do not leak
+                across the split
+        """
         self.__tokenizer = tokenizer
         self.__raw_path = raw_path
         self.__processed_path = processed_path
@@ -41,6 +87,12 @@ class ManipulationDetectionDataset:
         self.__load_existing = load_existing
         self.__do_split = do_split
         self.__lang = lang
+        self.__max_length = max_length
+        self.__stride = stride
+        self.__cache = cache
+        self.__with_techniques = with_techniques
+        self.__raw_member = raw_member
+        self.__near_duplicate_threshold = near_duplicate_threshold
 
     @property
     def label2id(self):
@@ -50,65 +102,173 @@ class ManipulationDetectionDataset:
     def id2label(self):
         return self.__id2label
 
+    def cache_key(self) -> str:
+        return make_cache_key(
+            raw_hash=(
+                member_checksum(self.__raw_path, self.__raw_member)
+                if self.__raw_member is not None
+                else file_hash(self.__raw_path)
+            ),
+            tokenizer=tokenizer_fingerprint(self.__tokenizer),
+            exclude_tail=self.__exclude_tail,
+            train_ratio=self.__train_ratio,
+            seed=self.__seed,
+            do_split=self.__do_split,
+            lang=self.__lang,
+            max_length=self.__max_length,
+            stride=self.__stride,
+            techniques=TECHNIQUES if self.__with_techniques else None,
+            near_duplicate_threshold=self.__near_duplicate_threshold,
+        )
+
     def read(self):
-        if self.__processed_path.exists() and self.__load_existing:
-            return DatasetDict.load_from_disk(str(self.__processed_path))
+        key = self.cache_key()
 
-        ds = self.__load_ds()
-        ds.save_to_disk(str(self.__processed_path))
+        if self.__processed_path is not None and self.__processed_path.exists() and self.__load_existing:
+            if read_cache_key(self.__processed_path) == key:
+                return load_from_disk(str(self.__processed_path))
+
+            logger.warning(
+                "[ %s ] was encoded with different inputs. Re-encoding ...",
+                self.__processed_path,
+            )
+
+        ds = self.__cache.load(key) if self.__cache is not None else None
+
+        if ds is None:
+            ds = self.__load_ds()
+
+            if self.__cache is not None:
+                ds = self.__cache.save(key, ds)
+
+        if self.__processed_path is not None:
+            ds.save_to_disk(str(self.__processed_path))
+            write_cache_key(self.__processed_path, key)
 
         return ds
 
     def __load_ds(self):
-        dataset = load_dataset(
-            "parquet", split="train", data_files=str(self.__raw_path)
-        )
+        # Only the encoded columns are decoded. The language is filtered in
+        # Arrow batches after the split, so every language keeps the train
+        # and test membership of the shuffle over all posts
+        columns = ["id", "content", "trigger_words"]
+        if self.__with_techniques:
+            columns.append("techniques")
+        if self.__lang:
+            columns.append("lang")
+
+        if self.__raw_member is not None:
+            dataset = Dataset(read_member(self.__raw_path, self.__raw_member, columns=columns))
+        else:
+            dataset = load_dataset(
+                "parquet",
+                split="train",
+                data_files=str(self.__raw_path),
+                columns=columns,
+            )
         dataset = dataset.shuffle(self.__seed)
         if self.__do_split:
             dataset = dataset.train_test_split(train_size=self.__train_ratio, seed=self.__seed)
 
+            if self.__near_duplicate_threshold is not None:
+                dataset["test"] = self.__drop_leaked_posts(dataset["train"], dataset["test"])
+
         if self.__lang:
-            dataset = dataset.filter(lambda x: x["lang"] == self.__lang)
+            dataset = filter_dataset(dataset, equals("lang", self.__lang))
+
+        remove_columns = columns[2:]
+        if self.__stride is not None:
+            remove_columns += ["id", "content"]
 
-        dataset = dataset.map(self.__encode_labels, batched=True, remove_columns=["lang", "manipulative", "techniques", "trigger_words"])
+        dataset = dataset.map(self.__encode_labels, batched=True, remove_columns=remove_columns)
 
         return dataset
 
+    def __drop_leaked_posts(self, train, test):
+        leaked = near_duplicate_mask(
+            test["content"], train["content"], self.__near_duplicate_threshold
+        )
+        logger.info(
+            "Dropping [ %s ] of [ %s ] test posts that near-duplicate a train post",
+            int(leaked.sum()),
+            len(test),
+        )
+
+        return test.select(np.flatnonzero(~leaked))
+
     def __encode_labels(self, data):
-        tokenized_inputs = self.__tokenizer(
-            data["content"],
-            truncation=True,
-            return_offsets_mapping=True,
+        return encode_span_labels(
+            self.__tokenizer,
+            data,
+            exclude_tail=self.__exclude_tail,
+            max_length=self.__max_length,
+            stride=self.__stride,
+            techniques=TECHNIQUES if self.__with_techniques else None,
         )
 
-        labels = []
 
-        for i, offsets in enumerate(tokenized_inputs["offset_mapping"]):
-            example_labels = [0] * len(offsets)
-            trigger_words = data["trigger_words"][i]
-            trigger_words = trigger_words if trigger_words is not None else []
-            for start, end in trigger_words:
-                for idx, (offset_start, offset_end) in enumerate(offsets):
-                    if offset_start >= start and offset_end <= end:
-                        example_labels[idx] = 1
+def encode_span_labels(
+    tokenizer: "PreTrainedTokenizerBase",
+    data,
+    exclude_tail: bool = True,
+    max_length: int = None,
+    stride: int = None,
+    carry_columns: tuple = ("id", "content"),
+    techniques: list = None,
+):
+    """
+    Args:
+        techniques: Technique names; when given, every sequence also gets
+            the multi-hot `technique_labels` of its post
+    """
+    windowed = stride is not None
+
+    tokenized_inputs = tokenizer(
+        data["content"],
+        truncation=True,
+        max_length=max_length,
+        stride=stride if windowed else 0,
+        return_overflowing_tokens=windowed,
+        return_offsets_mapping=True,
+    )
+
+    if windowed:
+        sample_mapping = tokenized_inputs.pop("overflow_to_sample_mapping")
+        for column in carry_columns:
+            tokenized_inputs[column] = [data[column][i] for i in sample_mapping]
+    else:
+        sample_mapping = range(len(data["content"]))
 
-            word_ids = tokenized_inputs.word_ids(i)
+    labels = align_batch_labels(
+        tokenized_inputs["offset_mapping"],
+        [data["trigger_words"][i] for i in sample_mapping],
+        [tokenized_inputs.word_ids(i) for i in range(len(sample_mapping))],
+        exclude_tail,
+    )
+
+    tokenized_inputs["labels"] = labels
+
+    if techniques is not None:
+        tokenized_inputs["technique_labels"] = technique_targets(
+            [data["techniques"][i] for i in sample_mapping], techniques
+        )
 
-            previous_word_id = None
+    del tokenized_inputs["offset_mapping"]
 
-            for j, id in enumerate(word_ids):
-                if self.__exclude_tail:
-                    if id is None or id == previous_word_id:
-                        example_labels[j] = -100
-                else:
-                    if id is None:
-                        example_labels[j] = -100
-                previous_word_id = id
+    return tokenized_inputs
 
-            labels.append(example_labels)
 
-        tokenized_inputs["labels"] = labels
+def technique_targets(rows, techniques: list = TECHNIQUES) -> list:
+    """
+    Multi-hot float targets of technique name lists; None means no technique.
+    """
+    index = {name: i for i, name in enumerate(techniques)}
+    targets = []
 
-        del tokenized_inputs["offset_mapping"]
+    for row in rows:
+        target = [0.0] * len(techniques)
+        for name in row if row is not None else ():
+            target[index[name]] = 1.0
+        targets.append(target)
 
-        return tokenized_inputs
+    return targets
@@ -0,0 +1,229 @@
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datasets import Dataset, DatasetDict, load_from_disk
+
+from src.data.encoding_cache import EncodingCache, write_cache_key
+from src.data.span_detection_ds import ManipulationDetectionDataset, encode_span_labels
+from src.util.cpu_budget import cpu_budget
+
+__ROW_COLUMN = "row_idx"
+
+__worker_tokenizers = None
+__worker_params = None
+
+
+def encode_for_tokenizers(
+    tokenizers: dict,
+    raw_path: Path,
+    processed_folder: Path,
+    exclude_tail: bool = True,
+    train_ratio: float = 0.9,
+    seed: int = 42,
+    do_split: bool = True,
+    lang: str = None,
+    max_length: int = None,
+    stride: int = None,
+    cache: EncodingCache = None,
+    batch_size: int = 1000,
+    num_proc: int = None,
+    logger: logging.Logger = logging.getLogger(__name__),
+) -> dict:
+    """
+    Encode the span detection parquet for several tokenizers in one pass.
+
+    Record batches are read once and every batch is encoded by all tokenizers in
+    parallel worker processes. Each tokenizer gets the same rows, splits and
+    labels as ManipulationDetectionDataset with the same arguments, saved to
+    `processed_folder / name` and stamped with its cache key, so
+    ManipulationDetectionDataset(load_existing=True) picks it up.
+
+    Args:
+        tokenizers: Mapping of output folder name to tokenizer
+        raw_path: Span detection parquet
+        processed_folder: Parent folder of the per-tokenizer datasets
+        cache: Optional EncodingCache to store the results in as well
+        batch_size: Rows per record batch
+        num_proc: Worker processes, defaults to one per tokenizer up to cpu_budget()
+
+    Returns:
+        dict: Mapping of name to the saved Dataset or DatasetDict
+    """
+    names = list(tokenizers.keys())
+    blueprints = {
+        name: ManipulationDetectionDataset(
+            tokenizer=tokenizer,
+            raw_path=raw_path,
+            processed_path=processed_folder / name,
+            exclude_tail=exclude_tail,
+            train_ratio=train_ratio,
+            seed=seed,
+            do_split=do_split,
+            lang=lang,
+            max_length=max_length,
+            stride=stride,
+        )
+        for name, tokenizer in tokenizers.items()
+    }
+    num_proc = num_proc or min(len(names), cpu_budget())
+    params = {"exclude_tail": exclude_tail, "max_length": max_length, "stride": stride}
+
+    processed_folder.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=processed_folder, prefix=".sweep-"))
+
+    try:
+        langs = __encode_to_arrow(
+            [tokenizers[name] for name in names],
+            params,
+            raw_path,
+            [tmp_dir / f"{i}.arrow" for i in range(len(names))],
+            batch_size,
+            num_proc,
+            logger,
+        )
+        splits = __split_rows(len(langs), train_ratio, seed, do_split)
+
+        if lang:
+            langs = np.asarray(langs, dtype=object)
+            splits = {k: v[langs[v] == lang] for k, v in splits.items()}
+
+        result = {}
+
+        for i, name in enumerate(names):
+            encoded = Dataset.from_file(str(tmp_dir / f"{i}.arrow"))
+            ds = DatasetDict(
+                {k: __select_rows(encoded, v) for k, v in splits.items()}
+            )
+            ds = ds if do_split else ds["train"]
+
+            key = blueprints[name].cache_key()
+            path = processed_folder / name
+
+            logger.info("Saving [ %s ] encoding to [ %s ]", name, path)
+            ds.save_to_disk(str(path))
+            write_cache_key(path, key)
+
+            if cache is not None:
+                cache.save(key, ds)
+
+            result[name] = load_from_disk(str(path))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return result
+
+
+def __encode_to_arrow(tokenizers, params, raw_path, outputs, batch_size, num_proc, logger):
+    langs = []
+    writers = [None] * len(tokenizers)
+    in_flight = deque()
+    row_offset = 0
+
+    def drain(limit):
+        while len(in_flight) > limit:
+            tokenizer_idx, future = in_flight.popleft()
+            batch = future.result()
+
+            if writers[tokenizer_idx] is None:
+                writers[tokenizer_idx] = pa.ipc.new_stream(
+                    str(outputs[tokenizer_idx]), batch.schema
+                )
+            writers[tokenizer_idx].write_batch(batch)
+
+    parquet = pq.ParquetFile(raw_path)
+    logger.info(
+        "Encoding [ %s ] rows of [ %s ] with [ %s ] tokenizers",
+        parquet.metadata.num_rows,
+        raw_path,
+        len(tokenizers),
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=num_proc,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(tokenizers, params),
+    ) as executor:
+        for batch in parquet.iter_batches(
+            batch_size=batch_size, columns=["id", "content", "lang", "trigger_words"]
+        ):
+            data = batch.to_pydict()
+            data[__ROW_COLUMN] = list(range(row_offset, row_offset + batch.num_rows))
+            row_offset += batch.num_rows
+            langs.extend(data.pop("lang"))
+
+            for tokenizer_idx in range(len(tokenizers)):
+                in_flight.append(
+                    (tokenizer_idx, executor.submit(_encode_batch, tokenizer_idx, data))
+                )
+
+            drain(2 * num_proc)
+
+        drain(0)
+
+    for writer in writers:
+        if writer is not None:
+            writer.close()
+
+    return langs
+
+
+def _init_worker(tokenizers, params):
+    global __worker_tokenizers, __worker_params
+
+    __worker_tokenizers = tokenizers
+    __worker_params = params
+
+
+def _encode_batch(tokenizer_idx, data):
+    if __worker_params["stride"] is None:
+        encoded = encode_span_labels(__worker_tokenizers[tokenizer_idx], data, **__worker_params)
+        columns = {
+            "id": data["id"],
+            "content": data["content"],
+            **encoded,
+            __ROW_COLUMN: data[__ROW_COLUMN],
+        }
+    else:
+        encoded = encode_span_labels(
+            __worker_tokenizers[tokenizer_idx],
+            data,
+            carry_columns=("id", "content", __ROW_COLUMN),
+            **__worker_params,
+        )
+        columns = dict(encoded)
+
+    return pa.RecordBatch.from_pydict(columns)
+
+
+def __split_rows(rows_count, train_ratio, seed, do_split):
+    # Same permutations as ManipulationDetectionDataset: they only depend on
+    # the number of rows and the seed.
+    index = Dataset.from_dict({__ROW_COLUMN: np.arange(rows_count)}).shuffle(seed)
+
+    if not do_split:
+        return {"train": np.asarray(index[__ROW_COLUMN], dtype=np.int64)}
+
+    index = index.train_test_split(train_size=train_ratio, seed=seed)
+
+    return {k: np.asarray(v[__ROW_COLUMN], dtype=np.int64) for k, v in index.items()}
+
+
+def __select_rows(encoded: Dataset, rows: np.ndarray) -> Dataset:
+    encoded_rows = np.asarray(encoded[__ROW_COLUMN], dtype=np.int64)
+    counts = np.bincount(encoded_rows, minlength=int(rows.max(initial=-1)) + 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    lengths = counts[rows]
+    first = np.repeat(starts[rows], lengths)
+    step = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    return encoded.select(first + step).remove_columns(__ROW_COLUMN)
@@ -0,0 +1,459 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from src.definitions import PROMPTS_FOLDER, TECHNIQUE_DESCRIPTIONS_PATH
+
+# Dataset lang codes to prompts/ folders
+PROMPT_LANGS = {"uk": "ua", "ua": "ua", "ru": "ru"}
+
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+class RetryableError(Exception):
+    """
+    Backend failure worth retrying: rate limiting, overload or a timeout.
+    """
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def system_instruction(lang: str, describe_techniques: bool = False) -> str:
+    """
+    Instruction the generation models were fine-tuned with, taken from
+    prompts/<lang>/generate-data-ds.jsonl.
+
+    Args:
+        describe_techniques: Append technique_descriptions.json, for base
+            models that have not seen the fine-tuning data
+    """
+    path = PROMPTS_FOLDER / PROMPT_LANGS[lang] / "generate-data-ds.jsonl"
+    with open(path, encoding="utf-8") as f:
+        first = json.loads(f.readline())
+
+    instruction = first["systemInstruction"]["parts"][0]["text"]
+
+    if describe_techniques:
+        with open(TECHNIQUE_DESCRIPTIONS_PATH, encoding="utf-8") as f:
+            descriptions = json.load(f)
+        instruction += "\n\n" + "\n".join(
+            f"- {name}: {description.strip()}" for name, description in descriptions.items()
+        )
+
+    return instruction
+
+
+def request_contents(techniques, spans) -> str:
+    """
+    `$techniques ## $spans` question in the fine-tuning format.
+    """
+    spans = [tuple(int(it) for it in span) for span in spans]
+
+    return f"{np.asarray(techniques)} ## {spans}"
+
+
+def requests_from_df(df: pd.DataFrame, lang: str = None) -> list:
+    """
+    One generation request per manipulative post of span-detection.parquet,
+    reusing its techniques and trigger_words spans.
+
+    Request ids hash the lang, techniques and spans, so they survive
+    reordering of the source rows; repeated inputs get an occurrence suffix.
+
+    Returns:
+        list: Dicts with id, lang, techniques, spans and contents
+    """
+    df = df.query("manipulative == True")
+    if lang is not None:
+        df = df[df["lang"] == lang]
+
+    requests = []
+    seen = {}
+
+    for row_lang, techniques, trigger_words in zip(
+        df["lang"], df["techniques"], df["trigger_words"]
+    ):
+        techniques = [str(it) for it in techniques]
+        spans = [[int(it) for it in span] for span in trigger_words]
+
+        key = json.dumps([row_lang, techniques, spans])
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        seen[digest] = seen.get(digest, -1) + 1
+
+        requests.append(
+            {
+                "id": f"{digest}-{seen[digest]}",
+                "lang": row_lang,
+                "techniques": techniques,
+                "spans": spans,
+                "contents": request_contents(techniques, spans),
+            }
+        )
+
+    return requests
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` requests per second on average with bursts of
+    up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.__tokens = float(self.capacity)
+        self.__updated = time.monotonic()
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.__lock:
+            while True:
+                now = time.monotonic()
+                self.__tokens = min(
+                    self.capacity, self.__tokens + (now - self.__updated) * self.rate
+                )
+                self.__updated = now
+
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.__tokens) / self.rate)
+
+
+def backoff_delay(attempt: int, base: float = 4, cap: float = 128, rng=random) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2**attempt)],
+    so requests throttled together do not retry together.
+    """
+    return rng.uniform(0, min(cap, base * 2**attempt))
+
+
+class GenaiBackend:
+    """
+    google-genai async client, Vertex AI endpoints by default.
+
+    Args:
+        model: Model name or the full endpoint path of a fine-tuned model,
+            e.g. projects/<project>/locations/<location>/endpoints/<id>
+    """
+
+    def __init__(
+        self,
+        model: str,
+        project: str = None,
+        location: str = None,
+        vertexai: bool = True,
+        temperature: float = 1,
+        top_p: float = 0.95,
+        max_output_tokens: int = 8192,
+        **client_kwargs,
+    ):
+        from google import genai
+
+        self.model = model
+        self.client = genai.Client(
+            vertexai=vertexai, project=project, location=location, **client_kwargs
+        )
+        self.__generation_config = {
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_output_tokens": max_output_tokens,
+            "response_modalities": ["TEXT"],
+        }
+
+    async def generate(self, instruction: str, contents: str) -> str:
+        from google.genai import errors, types
+
+        config = types.GenerateContentConfig(
+            system_instruction=instruction, **self.__generation_config
+        )
+
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model, contents=[contents], config=config
+            )
+        except errors.APIError as err:
+            if err.code in RETRYABLE_STATUS:
+                raise RetryableError(str(err), err.code) from err
+            raise
+
+        return response.text
+
+
+class HttpBackend:
+    """
+    Minimal JSON-over-HTTP backend: POSTs {"instruction", "contents"} and
+    reads {"text"}. Speaks to StubGenerationServer.
+    """
+
+    def __init__(self, url: str, timeout: float = 60):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        self.timeout = timeout
+
+    async def generate(self, instruction: str, contents: str) -> str:
+        body = json.dumps({"instruction": instruction, "contents": contents}).encode("utf-8")
+        head = (
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("ascii")
+
+        try:
+            status, payload = await asyncio.wait_for(
+                self.__post(head + body), timeout=self.timeout
+            )
+        except (asyncio.TimeoutError, ConnectionError) as err:
+            raise RetryableError(f"{type(err).__name__}: {err}") from err
+
+        if status in RETRYABLE_STATUS:
+            raise RetryableError(f"HTTP {status}", status)
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {payload[:200]!r}")
+
+        return json.loads(payload)["text"]
+
+    async def __post(self, request: bytes):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+
+        head, _, payload = response.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+
+        return status, payload
+
+
+class StubGenerationServer:
+    """
+    Local stand-in for the generation API, for exercising the pipeline
+    without cloud credentials. Replies after `latency` seconds with a fake
+    post and answers a `failure_rate` share of requests with HTTP 429.
+
+        with StubGenerationServer(failure_rate=0.2) as server:
+            generate_dataset(requests, HttpBackend(server.url), path)
+    """
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: int = 42):
+        rng = random.Random(seed)
+        rng_lock = threading.Lock()
+        self.requests_count = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+
+                with rng_lock:
+                    stub.requests_count += 1
+                    failed = rng.random() < failure_rate
+
+                time.sleep(latency)
+
+                if failed:
+                    self.__reply(429, {"error": "rate limited"})
+                else:
+                    self.__reply(200, {"text": f"Stub post for {request['contents']}"})
+
+            def __reply(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def read_checkpoint(path: Path) -> pd.DataFrame:
+    """
+    Generated posts from a checkpoint, one row per request id.
+    """
+    records = list(__read_records(Path(path)))
+    columns = ["id", "lang", "techniques", "spans", "content"]
+
+    return pd.DataFrame(records, columns=columns).drop_duplicates("id", keep="last")
+
+
+def __read_records(path: Path):
+    if not path.is_file():
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+def __repair_checkpoint(path: Path):
+    """
+    Cut a trailing partial line left by a crash mid-write, so appends start
+    on a fresh line.
+    """
+    if not path.is_file():
+        return
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+
+async def generate_dataset_async(
+    requests: list,
+    backend,
+    checkpoint_path: Path,
+    concurrency: int = 8,
+    rate: float = 4,
+    burst: int = None,
+    max_retries: int = 5,
+    describe_techniques: bool = False,
+    logger: logging.Logger = logging.getLogger(__name__),
+) -> dict:
+    """
+    Generate a post for every request not yet in the checkpoint.
+
+    At most `concurrency` requests are in flight and new ones start at
+    `rate` per second. Retryable failures back off with jitter; requests
+    that run out of retries are left out of the checkpoint, so the next run
+    picks them up again. Every result is appended to the JSONL checkpoint as
+    soon as it arrives.
+
+    Args:
+        requests: Dicts with id, lang, techniques, spans and contents, see
+            requests_from_df
+        backend: Object with `async generate(instruction, contents) -> str`,
+            e.g. GenaiBackend or HttpBackend
+
+    Returns:
+        dict: Counts of skipped (already done), generated and failed requests
+    """
+    checkpoint_path = Path(checkpoint_path)
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    __repair_checkpoint(checkpoint_path)
+
+    done = {record["id"] for record in __read_records(checkpoint_path)}
+    pending = [it for it in requests if it["id"] not in done]
+    stats = {"skipped": len(requests) - len(pending), "generated": 0, "failed": 0}
+    logger.info(
+        "Generating [ %s ] posts, [ %s ] already in [ %s ]",
+        len(pending),
+        stats["skipped"],
+        checkpoint_path,
+    )
+
+    instructions = {
+        lang: system_instruction(lang, describe_techniques)
+        for lang in {it["lang"] for it in pending}
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst)
+
+    async def generate_one(request):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                await bucket.acquire()
+                try:
+                    content = await backend.generate(
+                        instructions[request["lang"]], request["contents"]
+                    )
+                    return request, content, None
+                except RetryableError as err:
+                    if attempt == max_retries:
+                        return request, None, err
+                    delay = backoff_delay(attempt)
+                    logger.debug(
+                        "[ %s ] %s, retrying in [ %.1f ] s", request["id"], err, delay
+                    )
+                    await asyncio.sleep(delay)
+                except Exception as err:
+                    return request, None, err
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for future in asyncio.as_completed([generate_one(it) for it in pending]):
+            request, content, error = await future
+
+            if error is not None:
+                stats["failed"] += 1
+                logger.warning("[ %s ] failed: %r", request["id"], error)
+                continue
+
+            record = {
+                "id": request["id"],
+                "lang": request["lang"],
+                "techniques": request["techniques"],
+                "spans": request["spans"],
+                "content": content,
+            }
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            stats["generated"] += 1
+
+            if stats["generated"] % 100 == 0:
+                logger.info("Generated [ %s / %s ]", stats["generated"], len(pending))
+
+    logger.info("Generation finished: %s", stats)
+
+    return stats
+
+
+def generate_dataset(requests: list, backend, checkpoint_path: Path, **kwargs) -> pd.DataFrame:
+    """
+    Blocking generate_dataset_async; returns the whole checkpoint.
+    """
+    asyncio.run(generate_dataset_async(requests, backend, checkpoint_path, **kwargs))
+
+    return read_checkpoint(checkpoint_path)
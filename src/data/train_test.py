@@ -1,15 +1,23 @@
-import multiprocessing
 import pandas as pd
 
 from datasets import Dataset
 
+from src.data.dedup import drop_near_duplicates
+from src.util.cpu_budget import dataset_num_proc
 
-def load_train_test_dataset(data_folder, tokenizer):
+
+def load_train_test_dataset(data_folder, tokenizer, truncation=True, deduplicate=False):
+    """
+    Tokenized span detection train and test posts for MLM fine-tuning.
+
+    Pass truncation=False to keep long posts whole for pack_sequences and
+    deduplicate=True to drop reposts with a NearDuplicateIndex.
+    """
 
     def preprocess_function(examples):
-        return tokenizer(examples["content"], truncation=True)
+        return tokenizer(examples["content"], truncation=truncation)
 
-    core_count = multiprocessing.cpu_count()
+    core_count = dataset_num_proc()
 
     train = pd.read_parquet(data_folder / "span-detection.parquet")
     test = pd.read_csv(data_folder / "test.csv")
@@ -18,6 +26,10 @@ def load_train_test_dataset(data_folder, tokenizer):
 
     df = pd.concat([train, test], ignore_index=True)
 
+    if deduplicate:
+        df, _ = drop_near_duplicates(df.to_frame(), num_proc=core_count)
+        df = df["content"].reset_index(drop=True)
+
     ds = Dataset.from_pandas(df.to_frame())
     ds = ds.map(
         preprocess_function,
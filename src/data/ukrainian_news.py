@@ -1,16 +1,31 @@
-from bs4 import BeautifulSoup
 from datasets import load_dataset, Dataset
-import multiprocessing
+
+from src.data.arrow_filters import without_prefix
+from src.data.html_text import strip_html
+from src.data.news_corpus import load_corpus, tokenized_corpus
+from src.util.cpu_budget import dataset_num_proc
 
 
 def load_ukrainian_news_dataset(
     tokenizer,
     rows_count=None,
     max_tokens=512,
+    data_files=None,
+    streaming=False,
+    materialize=True,
+    extract_text=strip_html,
+    member=None,
 ):
-    def remove_html_tags(example):
-        soup = BeautifulSoup(example["text"], "html.parser")
-        return {"text": soup.get_text()}
+    """
+    Args:
+        extract_text: Batched HTML-to-text stage, list of str -> list of str.
+            strip_html_bs4 from src.data.html_text reproduces the old
+            BeautifulSoup-per-row stage.
+        member: File inside the zip archive data_files, see load_corpus
+    """
+
+    def remove_html_tags(examples):
+        return {"text": extract_text(examples["text"])}
 
     def preprocess_function(examples):
         return tokenizer(examples["text"], truncation=False)
@@ -18,24 +33,44 @@ def load_ukrainian_news_dataset(
     def filter_long_examples(example):
         return len(example["input_ids"]) <= max_tokens
 
-    def filter_out_telegram_posts(example):
-        return not example["url"].startswith("https://t.me")
+    # Telegram reposts are filtered out by Arrow at read time
+    not_telegram = without_prefix("url", "https://t.me")
 
-    core_count = multiprocessing.cpu_count()
+    if streaming:
+        return tokenized_corpus(
+            load_corpus(
+                "zeusfsx/ukrainian-news",
+                rows_count=rows_count,
+                data_files=data_files,
+                member=member,
+                streaming=True,
+                columns=["text"],
+                filters=not_telegram,
+            ),
+            tokenizer,
+            text_column="text",
+            max_tokens=max_tokens,
+            clean_texts=extract_text,
+            materialize=materialize,
+        )
 
-    split = f"train[:{rows_count}]" if rows_count is not None else "train"
+    core_count = dataset_num_proc()
 
-    ds = load_dataset(
+    ds = load_corpus(
         "zeusfsx/ukrainian-news",
-        split=split,
+        rows_count=rows_count,
+        data_files=data_files,
+        member=member,
         num_proc=core_count,
+        columns=["text"],
+        filters=not_telegram,
     )
-    ds = ds.filter(filter_out_telegram_posts)
-    ds = ds.select_columns(["text"])
-    ds = ds.map(remove_html_tags, num_proc=core_count)
+    ds = ds.map(remove_html_tags, num_proc=core_count, batched=True)
     ds = ds.map(
         preprocess_function, remove_columns=["text"], num_proc=core_count, batched=True
     )
-    ds = ds.filter(filter_long_examples)
+    if max_tokens is not None:
+        ds = ds.filter(filter_long_examples)
 
     return ds
+
@@ -10,6 +10,11 @@ RAW_DATA_FOLDER = PROJECT_ROOT_DIR / "data" / "raw"
 PROCESSED_DATA_FOLDER = PROJECT_ROOT_DIR / "data" / "processed"
 TRAIN_DATA_FOLDER = PROCESSED_DATA_FOLDER / "train"
 TEST_DATA_FOLDER = PROCESSED_DATA_FOLDER / "test"
+ENCODING_CACHE_FOLDER = PROCESSED_DATA_FOLDER / "encoding-cache"
+ENSEMBLE_CACHE_FOLDER = PROCESSED_DATA_FOLDER / "ensemble-cache"
+EMBEDDING_CACHE_FOLDER = PROCESSED_DATA_FOLDER / "embedding-cache"
 MODELS_FOLDER = PROJECT_ROOT_DIR / "models"
 REPORTS_FOLDER = PROJECT_ROOT_DIR / "reports"
+PROMPTS_FOLDER = PROJECT_ROOT_DIR / "prompts"
+TECHNIQUE_DESCRIPTIONS_PATH = PROJECT_ROOT_DIR / "src" / "data" / "technique_descriptions.json"
 SUBMISSIONS_FOLDER = PROJECT_ROOT_DIR / "submissions"
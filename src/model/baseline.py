@@ -1,59 +1,107 @@
+import abc
+from itertools import chain
+
 import numpy as np
 import torch
 
 from torch import nn
+from transformers.modeling_outputs import TokenClassifierOutput
+
+
+class BaselineModel(nn.Module, abc.ABC):
+    """
+    Token classification model that ignores its input.
+
+    forward() takes the same keyword arguments as a transformers model and
+    returns a TokenClassifierOutput, so baselines run through
+    Trainer.predict. Subclasses only build [h, w, num_labels] logits.
+    """
+
+    def __init__(self, num_labels: int = 2, seed: int = None):
+        super(BaselineModel, self).__init__()
+        self.num_labels = num_labels
+        self.generator = torch.Generator()
+
+        if seed is not None:
+            self.generator.manual_seed(seed)
+
+    def forward(self, input_ids, attention_mask=None, labels=None, **kwargs):
+        h, w = input_ids.shape
+        logits = self.logits(h, w).to(input_ids.device)
+
+        loss = None
+        if labels is not None:
+            loss = nn.functional.cross_entropy(
+                logits.reshape(-1, self.num_labels), labels.reshape(-1), ignore_index=-100
+            )
+
+        return TokenClassifierOutput(loss=loss, logits=logits)
+
+    @abc.abstractmethod
+    def logits(self, h, w):
+        pass
+
+    def one_hot(self, classes):
+        return nn.functional.one_hot(classes, self.num_labels).float()
 
-from transformers import PreTrainedModel
 
+class AllZerosModel(BaselineModel):
 
-class AllZerosModel(nn.Module):
+    def logits(self, h, w):
+        return self.one_hot(torch.tensor(0)).expand(h, w, self.num_labels)
 
-    def __init__(self):
-        super(AllZerosModel, self).__init__()
 
-    def forward(self, x):
-        h, w = x.shape
+class AllOnesModel(BaselineModel):
 
-        return torch.tensor([zero_pred() for _ in range(h * w)]).reshape(h, w, 2)
+    def logits(self, h, w):
+        return self.one_hot(torch.tensor(1)).expand(h, w, self.num_labels)
 
 
-class AllOnesModel(nn.Module):
+class UniformDistModel(BaselineModel):
 
-    def __init__(self):
-        super(AllOnesModel, self).__init__()
+    def logits(self, h, w):
+        sample = torch.rand(h, w, generator=self.generator)
 
-    def forward(self, x):
-        h, w = x.shape
+        return self.one_hot((sample >= 0.5).long())
 
-        return torch.tensor([one_pred() for _ in range(h * w)]).reshape(h, w, 2)
 
+class NormalDistModel(BaselineModel):
 
-class NormalDistModel(nn.Module):
+    def logits(self, h, w):
+        sample = torch.normal(0.5, 0.1667, size=(h, w), generator=self.generator)
 
-    def forward(self, x):
-        h, w = x.shape
-        sample = np.random.rand(h * w)
+        return self.one_hot((sample >= 0.5).long())
 
-        return torch.tensor([sample_to_val(it) for it in sample]).reshape(h, w, 2)
 
+class ClassPriorModel(BaselineModel):
+    """
+    Samples every token label from the label frequencies of a training set.
+    """
 
-class UniformDistModel(nn.Module):
+    def __init__(self, num_labels: int = 2, seed: int = None):
+        super(ClassPriorModel, self).__init__(num_labels, seed)
+        self.register_buffer("prior", torch.full((num_labels,), 1 / num_labels))
 
-    def forward(self, x):
-        h, w = x.shape
-        sample = np.random.normal(loc=0.5, scale=0.1667, size=h*w)
+    def fit(self, labels):
+        """
+        Args:
+            labels: Padded [N, seq] labels or a datasets column of label lists,
+                -100 entries are ignored
+        """
+        if not torch.is_tensor(labels):
+            labels = torch.from_numpy(np.fromiter(chain.from_iterable(labels), dtype=np.int64))
 
-        return torch.tensor([sample_to_val(it) for it in sample]).reshape(h, w, 2)
+        labels = labels.reshape(-1)
+        labels = labels[labels != -100]
 
+        counts = torch.bincount(labels, minlength=self.num_labels).float()
+        self.prior = counts / counts.sum()
 
-def zero_pred():
-    return [1, 0]
+        return self
 
-def one_pred():
-    return [0, 1]
+    def logits(self, h, w):
+        thresholds = torch.cumsum(self.prior.cpu(), dim=0)
+        sample = torch.rand(h, w, generator=self.generator)
+        classes = torch.searchsorted(thresholds, sample, right=True)
 
-def sample_to_val(x):
-    if x < 0.5:
-        return zero_pred()
-    else:
-        return one_pred()
+        return self.one_hot(classes.clamp(max=self.num_labels - 1))
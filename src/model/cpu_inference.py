@@ -0,0 +1,215 @@
+import copy
+import inspect
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+
+from src.model.span_detection_metrics import IGNORE_LABEL, evaluate_masked
+from src.model.span_inference import predict_token_logits
+
+
+def quantize_dynamic_model(model):
+    """
+    CPU copy of a token classification model with int8 dynamically
+    quantized Linear layers; activations stay fp32. The given model is left
+    on its device and in its mode.
+    """
+    model = copy.deepcopy(model).cpu().eval()
+
+    return torch.ao.quantization.quantize_dynamic(
+        model, {nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+
+
+def export_onnx(model, tokenizer, path: Path, quantize: bool = False, opset: int = 17) -> Path:
+    """
+    Export a token classification model to ONNX with dynamic batch and
+    sequence axes. A CPU copy is exported, the given model is left on its
+    device and in its mode.
+
+    Args:
+        quantize: Also write `<name>.int8.onnx` with onnxruntime dynamic
+            int8 weight quantization and return its path
+
+    Returns:
+        Path: Exported model
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    model = copy.deepcopy(model).cpu().eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [it for it in ("input_ids", "attention_mask", "token_type_ids") if it in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["logits"]}
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+
+    torch.onnx.export(
+        model,
+        tuple(sample[name] for name in input_names),
+        str(path),
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        **kwargs,
+    )
+
+    if not quantize:
+        return path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = path.with_suffix(".int8.onnx")
+    quantize_dynamic(str(path), str(quantized_path), weight_type=QuantType.QInt8)
+
+    return quantized_path
+
+
+class OnnxTokenClassifier:
+    """
+    ONNX Runtime session with the part of the transformers model interface
+    predict_token_logits uses, so predict_spans works unchanged.
+    """
+
+    def __init__(self, path: Path, config, num_threads: int = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self.config = config
+        self.device = torch.device("cpu")
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        self.__input_names = {it.name for it in self.session.get_inputs()}
+
+    def eval(self):
+        return self
+
+    def __call__(self, **inputs):
+        feed = {
+            name: value.cpu().numpy()
+            for name, value in inputs.items()
+            if name in self.__input_names
+        }
+        (logits,) = self.session.run(["logits"], feed)
+
+        return _Output(torch.from_numpy(logits))
+
+
+class _Output:
+
+    def __init__(self, logits):
+        self.logits = logits
+
+
+def benchmark_modes(
+    modes: dict,
+    dataset,
+    batch_size: int = 32,
+    latency_posts: int = 50,
+    reference: str = None,
+    max_f1_drop: float = 0.01,
+    logger: logging.Logger = logging.getLogger(__name__),
+) -> pd.DataFrame:
+    """
+    Quality and speed of the same model served in several modes.
+
+    Args:
+        modes: Mapping of mode name to a model, e.g. {"fp32": model,
+            "int8": quantize_dynamic_model(model), "onnx": OnnxTokenClassifier(...)}
+        dataset: Encoded split with input_ids and labels, e.g. the "test"
+            split of ManipulationDetectionDataset
+        latency_posts: Posts scored one at a time for the latency column
+        reference: Mode quality is compared against, defaults to the first
+            one, which should be the fp32 model
+        max_f1_drop: Largest token F1 loss against the reference that still
+            counts as parity
+
+    Returns:
+        pd.DataFrame: Token/span F1, token agreement and parity with the
+            reference, per-post latency and batched throughput of every mode
+    """
+    encodings = {"input_ids": dataset["input_ids"]}
+    if "token_type_ids" in dataset.column_names:
+        encodings["token_type_ids"] = dataset["token_type_ids"]
+
+    labels = dataset["labels"]
+    width = max(len(it) for it in labels)
+    padded_labels = np.full((len(labels), width), IGNORE_LABEL, dtype=np.int64)
+    for i, it in enumerate(labels):
+        padded_labels[i, : len(it)] = it
+
+    tokens_count = sum(len(it) for it in encodings["input_ids"])
+    latency_encodings = {k: v[:latency_posts] for k, v in encodings.items()}
+    reference = reference or next(iter(modes))
+
+    predictions = {}
+    rows = []
+
+    for name, model in modes.items():
+        start = time.perf_counter()
+        logits = predict_token_logits(model, encodings, batch_size)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predict_token_logits(model, latency_encodings, 1)
+        latency = (time.perf_counter() - start) / len(latency_encodings["input_ids"])
+
+        padded = np.zeros(padded_labels.shape, dtype=np.int64)
+        for i, it in enumerate(logits):
+            padded[i, : len(it)] = it.argmax(-1)
+        predictions[name] = padded
+
+        row = {"mode": name, **evaluate_masked(padded_labels, padded)}
+        row.update(
+            {
+                "latency_ms": latency * 1000,
+                "posts_per_second": len(labels) / elapsed,
+                "tokens_per_second": tokens_count / elapsed,
+            }
+        )
+        rows.append(row)
+        logger.info("Benchmarked [ %s ]: %s", name, row)
+
+    mask = padded_labels != IGNORE_LABEL
+    reference_f1 = next(row["token_f1"] for row in rows if row["mode"] == reference)
+
+    for row in rows:
+        row["agreement"] = float(
+            (predictions[row["mode"]][mask] == predictions[reference][mask]).mean()
+        )
+        row["parity"] = reference_f1 - row["token_f1"] <= max_f1_drop
+
+        if not row["parity"]:
+            logger.warning(
+                "[ %s ] token F1 [ %.4f ] is more than [ %s ] below [ %s ] [ %.4f ]",
+                row["mode"],
+                row["token_f1"],
+                max_f1_drop,
+                reference,
+                reference_f1,
+            )
+
+    columns = [
+        "mode",
+        "token_f1",
+        "span_f1",
+        "agreement",
+        "parity",
+        "latency_ms",
+        "posts_per_second",
+        "tokens_per_second",
+    ]
+
+    return pd.DataFrame(rows)[columns]
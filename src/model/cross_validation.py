@@ -0,0 +1,302 @@
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from datasets import concatenate_datasets, load_from_disk
+
+from src.util.cpu_budget import cpu_budget
+from src.visualization.reporting import EvaluatingReport_new
+
+_FOLD_METRICS_FILE = "metrics.json"
+_RUN_FILE = "cv.json"
+
+_worker_dataset = None
+_worker_models = {}
+
+
+def kfold_bounds(rows_count: int, k: int) -> np.ndarray:
+    """
+    [k + 1] fold boundaries, the last fold takes the remainder.
+    """
+    bounds = np.arange(k + 1) * (rows_count // k)
+    bounds[-1] = rows_count
+
+    return bounds
+
+
+def fold_views(dataset, bounds, fold: int):
+    """
+    Train and eval views of a fold.
+
+    Both are built from contiguous slices of the memory-mapped table, so no
+    rows are copied and no indices mapping is written.
+    """
+    start, end = int(bounds[fold]), int(bounds[fold + 1])
+    eval_ds = dataset.select(range(start, end))
+
+    parts = [
+        dataset.select(range(a, b))
+        for a, b in ((0, start), (end, len(dataset)))
+        if b > a
+    ]
+    train_ds = concatenate_datasets(parts) if len(parts) > 1 else parts[0]
+
+    return train_ds, eval_ds
+
+
+def run_cross_validation(
+    dataset_path: Path,
+    output_dir: Path,
+    train_fold,
+    k: int = 5,
+    num_workers: int = None,
+    threads_per_worker: int = None,
+    report_path: Path = None,
+    registry=None,
+    logger: logging.Logger = logging.getLogger(__name__),
+) -> dict:
+    """
+    Train and evaluate k folds of a saved tokenized dataset.
+
+    Every worker process memory-maps the dataset at dataset_path once and
+    evaluates folds on zero-copy views. Fold metrics are saved to
+    `output_dir / fold-<i> / metrics.json` as soon as a fold finishes, and
+    folds with saved metrics are skipped when the run is restarted.
+
+    Args:
+        dataset_path: Folder written by Dataset.save_to_disk,
+            e.g. ManipulationDetectionDataset(do_split=False).read() output
+        train_fold: Picklable callable (fold, train_ds, eval_ds, fold_dir)
+            -> metrics dict, e.g. TokenClassificationFold
+        num_workers: Parallel folds, defaults to 1 on CUDA and to
+            min(k, cpu_budget()) otherwise
+        threads_per_worker: torch/OpenMP threads per worker, defaults to an
+            even share of the CPUs
+        report_path: EvaluatingReport_new CSV that receives the mean and std
+            rows across folds
+        registry: RunRegistry that also receives them, under the report
+            folder name
+
+    Returns:
+        dict: Mapping of fold index to its metrics
+    """
+    import torch
+
+    dataset_path, output_dir = Path(dataset_path), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    rows_count = len(load_from_disk(str(dataset_path)))
+    __check_run(output_dir, {"dataset_path": str(dataset_path), "rows_count": rows_count, "k": k})
+    bounds = kfold_bounds(rows_count, k)
+
+    results = {}
+    for fold in range(k):
+        metrics_path = output_dir / f"fold-{fold}" / _FOLD_METRICS_FILE
+        if metrics_path.is_file():
+            with open(metrics_path) as f:
+                results[fold] = json.load(f)
+
+    pending = [fold for fold in range(k) if fold not in results]
+    logger.info("Folds done [ %s ], pending [ %s ]", sorted(results), pending)
+
+    if pending:
+        cpu_count = cpu_budget()
+        num_workers = num_workers or (1 if torch.cuda.is_available() else min(k, cpu_count))
+        num_workers = min(num_workers, len(pending))
+        threads_per_worker = threads_per_worker or max(1, cpu_count // num_workers)
+
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(str(dataset_path), threads_per_worker),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _run_fold, train_fold, bounds, fold, str(output_dir / f"fold-{fold}")
+                ): fold
+                for fold in pending
+            }
+
+            for future in as_completed(futures):
+                fold = futures[future]
+                results[fold] = future.result()
+                logger.info("Fold [ %s ] finished: %s", fold, results[fold])
+
+    if report_path is not None:
+        write_aggregated_report(results, report_path, registry=registry)
+
+    return dict(sorted(results.items()))
+
+
+def aggregate_metrics(results: dict) -> tuple:
+    """
+    Mean and population std of every numeric metric across folds.
+    """
+    names = sorted(
+        {
+            name
+            for metrics in results.values()
+            for name, value in metrics.items()
+            if isinstance(value, (int, float))
+        }
+    )
+    values = np.array(
+        [[metrics.get(name, np.nan) for name in names] for metrics in results.values()],
+        dtype=np.float64,
+    )
+
+    return (
+        dict(zip(names, np.nanmean(values, axis=0).tolist())),
+        dict(zip(names, np.nanstd(values, axis=0).tolist())),
+    )
+
+
+def write_aggregated_report(
+    results: dict, report_path: Path, now: str = None, registry=None
+):
+    """
+    Append `<now>-mean` and `<now>-std` rows to an EvaluatingReport_new CSV,
+    and to the RunRegistry if one is given.
+
+    Columns the folds did not report are left empty.
+    """
+    now = now or str(int(time.time()))
+    report = EvaluatingReport_new(report_path, registry=registry)
+    mean, std = aggregate_metrics(results)
+
+    for suffix, row in (("mean", mean), ("std", std)):
+        row = dict(row)
+        row.setdefault("eval_token_accuracy", row.get("eval_accuracy"))
+        report.write_to_report(__with_report_columns(row), f"{now}-{suffix}")
+
+
+class TokenClassificationFold:
+    """
+    Fold trainer of the span detection notebooks: a fresh copy of the
+    checkpoint per fold, trained and evaluated with the span metrics.
+
+    The checkpoint is read from disk once per worker process and deep-copied
+    for each fold it trains.
+    """
+
+    def __init__(
+        self,
+        model_checkpoint: str,
+        label2id: dict,
+        training_args: dict,
+        classifier_dropout: float = 0.1,
+    ):
+        self.model_checkpoint = model_checkpoint
+        self.label2id = label2id
+        self.training_args = training_args
+        self.classifier_dropout = classifier_dropout
+
+    def __call__(self, fold, train_ds, eval_ds, fold_dir):
+        from transformers import (
+            AutoModelForTokenClassification,
+            AutoTokenizer,
+            DataCollatorForTokenClassification,
+            Trainer,
+            TrainingArguments,
+        )
+
+        from src.model.span_detection_metrics import compute_metrics
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_checkpoint)
+
+        # Every task gets a fresh unpickled copy of self, so the base model is
+        # kept per worker process instead
+        model = _worker_models.get(self.model_checkpoint)
+        if model is None:
+            model = AutoModelForTokenClassification.from_pretrained(
+                self.model_checkpoint,
+                num_labels=len(self.label2id),
+                id2label={v: k for k, v in self.label2id.items()},
+                label2id=self.label2id,
+                classifier_dropout=self.classifier_dropout,
+            )
+            _worker_models[self.model_checkpoint] = model
+
+        trainer = Trainer(
+            model=copy.deepcopy(model),
+            args=TrainingArguments(output_dir=fold_dir, **self.training_args),
+            train_dataset=train_ds,
+            eval_dataset=eval_ds,
+            processing_class=tokenizer,
+            data_collator=DataCollatorForTokenClassification(tokenizer),
+            compute_metrics=compute_metrics(None),
+        )
+
+        trainer.train()
+
+        return trainer.evaluate()
+
+
+def __check_run(output_dir, params):
+    run_file = output_dir / _RUN_FILE
+
+    if run_file.is_file():
+        with open(run_file) as f:
+            saved = json.load(f)
+        if saved != params:
+            raise ValueError(
+                f"[ {output_dir} ] holds folds of another run: {saved}, expected {params}"
+            )
+    else:
+        with open(run_file, "w") as f:
+            json.dump(params, f)
+
+
+def __with_report_columns(row):
+    columns = [
+        "eval_loss",
+        "eval_token_precision",
+        "eval_token_recall",
+        "eval_token_f1",
+        "eval_token_accuracy",
+        "eval_span_precision",
+        "eval_span_recall",
+        "eval_span_f1",
+        "eval_span_accuracy",
+        "eval_runtime",
+        "eval_samples_per_second",
+        "eval_steps_per_second",
+        "epoch",
+    ]
+
+    return {column: row.get(column) for column in columns}
+
+
+def _init_worker(dataset_path, threads_per_worker):
+    global _worker_dataset
+
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_worker)
+    os.environ["MKL_NUM_THREADS"] = str(threads_per_worker)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    _worker_dataset = load_from_disk(dataset_path)
+
+
+def _run_fold(train_fold, bounds, fold, fold_dir):
+    fold_dir = Path(fold_dir)
+    fold_dir.mkdir(parents=True, exist_ok=True)
+
+    train_ds, eval_ds = fold_views(_worker_dataset, bounds, fold)
+    metrics = train_fold(fold, train_ds, eval_ds, str(fold_dir))
+
+    tmp_path = fold_dir / f".{_FOLD_METRICS_FILE}"
+    with open(tmp_path, "w") as f:
+        json.dump(metrics, f)
+    os.replace(tmp_path, fold_dir / _FOLD_METRICS_FILE)
+
+    return metrics
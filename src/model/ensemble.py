@@ -0,0 +1,351 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.encoding_cache import make_cache_key
+from src.definitions import ENSEMBLE_CACHE_FOLDER
+from src.model.span_detection_metrics import precision_recall_f1
+from src.model.span_inference import MANIPULATION_LABEL, predict_post_logits
+
+
+def dataset_hash(ids, texts) -> str:
+    digest = hashlib.sha256()
+
+    for post_id, text in zip(ids, texts):
+        digest.update(str(post_id).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def model_fingerprint(model) -> dict:
+    """
+    Config and parameter hashes of a model.
+
+    Parameters are hashed rather than the checkpoint files or their path,
+    since a model trained in memory keeps the name_or_path of the checkpoint
+    it started from, and the same weights may be loaded from another folder.
+    """
+    import torch
+
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy())
+
+    config = model.config.to_dict()
+    # The config keeps the folder it was loaded from and the transformers
+    # version that saved it, neither changes the model
+    config.pop("_name_or_path", None)
+    config.pop("transformers_version", None)
+    config = json.dumps(config, sort_keys=True, default=str)
+
+    return {
+        "config": hashlib.sha256(config.encode("utf-8")).hexdigest(),
+        "weights": digest.hexdigest(),
+    }
+
+
+class MemberLogits:
+    """
+    Token logits of one model over one dataset, mapped to character offsets.
+
+    Tokens of all posts are stored flat; post_bounds[i]:post_bounds[i + 1]
+    are the tokens of post i.
+    """
+
+    def __init__(self, ids, post_bounds, offsets, logits, label_id):
+        self.ids = np.asarray(ids)
+        self.post_bounds = np.asarray(post_bounds, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.logits = np.asarray(logits, dtype=np.float32)
+        self.label_id = label_id
+
+    @classmethod
+    def from_posts(cls, ids, offsets, logits, label_id):
+        lengths = [len(it) for it in offsets]
+        num_labels = logits[0].shape[-1] if logits else 0
+        offsets = [it.reshape(-1, 2) for it in offsets] + [np.empty((0, 2))]
+        logits = [it.reshape(-1, num_labels) for it in logits] + [np.empty((0, num_labels))]
+
+        return cls(
+            ids,
+            np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))),
+            np.concatenate(offsets),
+            np.concatenate(logits),
+            label_id,
+        )
+
+    def probabilities(self) -> np.ndarray:
+        """
+        Softmax probability of the label for every token.
+        """
+        shifted = self.logits - self.logits.max(axis=1, keepdims=True)
+        exp = np.exp(shifted)
+
+        return exp[:, self.label_id] / exp.sum(axis=1)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}")
+
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=self.ids.astype(str),
+                post_bounds=self.post_bounds,
+                offsets=self.offsets.astype(np.int32),
+                logits=self.logits,
+                label_id=np.int64(self.label_id),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            return cls(
+                data["ids"],
+                data["post_bounds"],
+                data["offsets"],
+                data["logits"],
+                int(data["label_id"]),
+            )
+
+
+class LogitEnsemble:
+    """
+    Ensemble of token classification models combined at character level.
+
+    Every member is scored once per dataset and its token logits are cached in
+    `cache_root` under a key of the model fingerprint, dataset hash and
+    windowing parameters. Members are projected onto characters through their
+    token offsets, so members with different tokenizers combine, and any
+    subset can be averaged or voted without running a model again.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        cache_root: Path = ENSEMBLE_CACHE_FOLDER,
+        label: str = MANIPULATION_LABEL,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self.ids = df["id"].tolist()
+        self.texts = df["content"].tolist()
+        self.label = label
+        self.dataset_hash = dataset_hash(self.ids, self.texts)
+
+        self.__cache_root = Path(cache_root)
+        self.__logger = logger
+        self.__members = {}
+        self.__char_scores = {}
+
+        lengths = np.fromiter(map(len, self.texts), dtype=np.int64, count=len(self.texts))
+        self.__char_bounds = np.concatenate(([0], np.cumsum(lengths)))
+
+    @property
+    def members(self):
+        return list(self.__members)
+
+    def score(
+        self,
+        name: str,
+        model,
+        tokenizer,
+        batch_size: int = 32,
+        max_length: int = None,
+        stride: int = None,
+    ) -> MemberLogits:
+        """
+        Add a member, running the model only when its logits are not cached.
+        """
+        key = make_cache_key(
+            model=model_fingerprint(model),
+            dataset=self.dataset_hash,
+            max_length=max_length,
+            stride=stride,
+            label=self.label,
+        )
+        path = self.__cache_root / f"{key}.npz"
+
+        if path.is_file():
+            self.__logger.info("Loading cached logits of [ %s ] from [ %s ]", name, path)
+            member = MemberLogits.load(path)
+        else:
+            self.__logger.info("Scoring [ %s ] on [ %s ] posts", name, len(self.texts))
+            offsets, logits = predict_post_logits(
+                model, tokenizer, self.texts, batch_size, max_length, stride
+            )
+            member = MemberLogits.from_posts(
+                self.ids, offsets, logits, model.config.label2id[self.label]
+            )
+            member.save(path)
+
+        self.add(name, member)
+
+        return member
+
+    def add(self, name: str, member: MemberLogits):
+        if member.ids.astype(str).tolist() != [str(it) for it in self.ids]:
+            raise ValueError(f"[ {name} ] was scored on other posts")
+
+        self.__members[name] = member
+        self.__char_scores.pop(name, None)
+
+    def char_scores(self, name: str):
+        """
+        Label probability of every character of the concatenated posts and a
+        mask of the characters covered by a token of the member.
+
+        Zero-width tokens cover no character and are ignored, otherwise a
+        single member gives the same spans as predict_spans.
+        """
+        if name not in self.__char_scores:
+            member = self.__members[name]
+            total = int(self.__char_bounds[-1])
+
+            post_idx = np.repeat(
+                np.arange(len(self.texts)), np.diff(member.post_bounds)
+            )
+            starts = member.offsets[:, 0] + self.__char_bounds[post_idx]
+            widths = np.clip(member.offsets[:, 1] - member.offsets[:, 0], 0, None)
+
+            token_idx = np.repeat(np.arange(len(starts)), widths)
+            chars = starts[token_idx] + (
+                np.arange(len(token_idx)) - np.repeat(np.cumsum(widths) - widths, widths)
+            )
+
+            # Characters shared by several tokens (byte-level BPE) get the mean
+            sums = np.bincount(chars, weights=member.probabilities()[token_idx], minlength=total)
+            counts = np.bincount(chars, minlength=total)
+            covered = counts > 0
+            scores = np.divide(sums, counts, out=np.zeros(total), where=covered)
+
+            self.__char_scores[name] = (scores, covered)
+
+        return self.__char_scores[name]
+
+    def combine(self, members=None, weights=None, method: str = "mean", threshold: float = 0.5):
+        """
+        Character spans of a member subset.
+
+        Args:
+            members: Member names, defaults to all of them
+            weights: Optional per-member weights
+            method: "mean" averages label probabilities, "vote" takes the
+                weighted share of members predicting the label
+            threshold: A character is positive when the combined score
+                exceeds it
+
+        Returns:
+            list: Per-post lists of (start, end) tuples
+        """
+        members = members or self.members
+        weights = np.ones(len(members)) if weights is None else np.asarray(weights)
+        total = int(self.__char_bounds[-1])
+
+        weighted = np.zeros(total, dtype=np.float64)
+        weight_sum = np.zeros(total, dtype=np.float64)
+
+        for name, weight in zip(members, weights):
+            scores, covered = self.char_scores(name)
+            if method == "vote":
+                scores = (scores > 0.5).astype(np.float32)
+            elif method != "mean":
+                raise ValueError(f"Unknown method [ {method} ]")
+
+            weighted += weight * scores * covered
+            weight_sum += weight * covered
+
+        covered = weight_sum > 0
+        combined = np.divide(weighted, weight_sum, out=np.zeros(total), where=covered)
+
+        return self.__spans(combined > threshold, covered)
+
+    def combine_df(self, **kwargs) -> pd.DataFrame:
+        return pd.DataFrame({"id": self.ids, "trigger_words": self.combine(**kwargs)})
+
+    def search(self, true_spans, max_size: int = None, methods=("mean", "vote")) -> pd.DataFrame:
+        """
+        Character-level F1 of every member subset, best first.
+
+        Args:
+            true_spans: Per-post lists of (start, end) gold spans
+        """
+        gold = self.__char_mask(true_spans)
+        max_size = max_size or len(self.members)
+        rows = []
+
+        for size in range(1, max_size + 1):
+            for subset in itertools.combinations(self.members, size):
+                for method in methods:
+                    predicted = self.__char_mask(self.combine(list(subset), method=method))
+                    precision, recall, f1 = precision_recall_f1(
+                        int(np.count_nonzero(gold & predicted)),
+                        int(np.count_nonzero(predicted)),
+                        int(np.count_nonzero(gold)),
+                    )
+                    rows.append(
+                        {
+                            "members": subset,
+                            "method": method,
+                            "char_f1": f1,
+                            "char_precision": precision,
+                            "char_recall": recall,
+                        }
+                    )
+
+        return pd.DataFrame(rows).sort_values("char_f1", ascending=False, ignore_index=True)
+
+    def __spans(self, positive, covered):
+        # Uncovered characters (whitespace between tokens) neither start nor
+        # break a span, like consecutive tokens in spans_from_token_predictions
+        chars = np.flatnonzero(covered)
+        post_idx = np.searchsorted(self.__char_bounds, chars, side="right") - 1
+        positive = positive[chars]
+
+        new_post = np.ones(len(chars), dtype=bool)
+        new_post[1:] = post_idx[1:] != post_idx[:-1]
+        last_of_post = np.ones(len(chars), dtype=bool)
+        last_of_post[:-1] = new_post[1:]
+
+        prev_positive = np.zeros(len(chars), dtype=bool)
+        prev_positive[1:] = positive[:-1]
+        next_positive = np.zeros(len(chars), dtype=bool)
+        next_positive[:-1] = positive[1:]
+
+        run_starts = np.flatnonzero(positive & (new_post | ~prev_positive))
+        run_ends = np.flatnonzero(positive & (last_of_post | ~next_positive))
+
+        base = self.__char_bounds[post_idx[run_starts]]
+        spans = [[] for _ in self.texts]
+        for post, start, end in zip(
+            post_idx[run_starts].tolist(),
+            (chars[run_starts] - base).tolist(),
+            (chars[run_ends] + 1 - base).tolist(),
+        ):
+            spans[post].append((start, end))
+
+        return spans
+
+    def __char_mask(self, spans):
+        mask = np.zeros(int(self.__char_bounds[-1]) + 1, dtype=np.int64)
+
+        for post, post_spans in enumerate(spans):
+            if post_spans is None:
+                continue
+
+            base, length = self.__char_bounds[post], len(self.texts[post])
+            for start, end in post_spans:
+                mask[base + min(start, length)] += 1
+                mask[base + min(end, length)] -= 1
+
+        return np.cumsum(mask)[:-1] > 0
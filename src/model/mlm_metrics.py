@@ -1,38 +1,160 @@
-import torch
-import evaluate
-from transformers import EvalPrediction
+from typing import TYPE_CHECKING
+
+import numpy as np
 from math import exp
 
-f1_metric = evaluate.load("f1")
+if TYPE_CHECKING:
+    from transformers import EvalPrediction
+
+CHUNK_BYTES = 64 * 2**20
+
 
+def compute_metrics(p: "EvalPrediction", chunk_bytes: int = CHUNK_BYTES):
+    """
+    Masked accuracy, perplexity and macro F1 of MLM logits.
+
+    Only the masked positions are read, in chunks of at most `chunk_bytes` of
+    logits, and each chunk is reduced to argmax ids and label log-probabilities
+    right away, so no softmax or full-size tensor copy is ever made.
+    """
+    import torch
 
-def compute_metrics(p: EvalPrediction):
     logits, labels = p.predictions, p.label_ids
 
-    probs = torch.nn.functional.softmax(torch.tensor(logits), dim=-1)
+    if isinstance(logits, tuple):
+        logits = logits[0]
 
-    predictions = torch.argmax(probs, dim=-1)
+    vocab_size = logits.shape[-1]
+    logits = logits.reshape(-1, vocab_size)
+    labels = labels.reshape(-1)
+    masked = np.flatnonzero(labels != -100)
+    chunk_size = max(1, chunk_bytes // (vocab_size * logits.itemsize))
 
-    mask = labels != -100
+    accumulator = MlmMetricsAccumulator()
 
-    correct_predictions = (predictions[mask] == labels[mask]).sum().item()
-    total_masked_tokens = mask.sum().item()
-    masked_accuracy = (
-        correct_predictions / total_masked_tokens if total_masked_tokens > 0 else 0
-    )
+    for start in range(0, len(masked), chunk_size):
+        idx = masked[start : start + chunk_size]
+        chunk_labels = torch.from_numpy(labels[idx])
+        predictions, label_log_probs = preprocess_logits_for_metrics(
+            torch.from_numpy(logits[idx]), chunk_labels
+        )
+        accumulator.update(chunk_labels, predictions, label_log_probs)
+
+    return accumulator.compute()
+
+
+def compute_streaming_metrics():
+    """
+    Batch-wise counterpart of compute_metrics.
+
+    Use with preprocess_logits_for_metrics and
+    TrainingArguments(batch_eval_metrics=True): only argmax ids and the
+    log-probability of every label leave the device, and the accumulator keeps
+    per-token-id counts and a running negative log-likelihood.
+    """
+    return MlmMetricsAccumulator()
+
+
+def preprocess_logits_for_metrics(logits, labels):
+    if isinstance(logits, tuple):
+        logits = logits[0]
+
+    logits = logits.float()
+    predictions = logits.argmax(dim=-1)
+    label_logits = logits.gather(-1, labels.clamp(min=0).unsqueeze(-1)).squeeze(-1)
+    label_log_probs = (label_logits - logits.logsumexp(dim=-1)).float()
+
+    return predictions, label_log_probs
+
+
+class MlmMetricsAccumulator:
+
+    def __init__(self):
+        self.reset()
+
+    def __call__(self, p, compute_result: bool = False):
+        predictions, labels = p.predictions, p.label_ids
+
+        if isinstance(predictions, (tuple, list)):
+            predictions, label_log_probs = predictions
+        else:
+            import torch
+
+            predictions, label_log_probs = preprocess_logits_for_metrics(
+                torch.as_tensor(predictions), torch.as_tensor(labels)
+            )
 
-    loss_fn = torch.nn.CrossEntropyLoss()
-    loss = loss_fn(torch.tensor(logits[mask]), torch.tensor(labels[mask]))
-    perplexity = exp(loss.item())
+        self.update(labels, predictions, label_log_probs)
 
-    f1_score = f1_metric.compute(
-        predictions=predictions[mask].tolist(),
-        references=labels[mask].tolist(),
-        average="macro",
+        if not compute_result:
+            return None
+
+        result = self.compute()
+        self.reset()
+
+        return result
+
+    def update(self, labels, predictions, label_log_probs):
+        labels = _to_numpy(labels)
+        mask = labels != -100
+
+        labels = labels[mask].astype(np.int64)
+        predictions = _to_numpy(predictions)[mask].astype(np.int64)
+
+        self.__correct += int(np.count_nonzero(predictions == labels))
+        self.__total += len(labels)
+        self.__nll_sum -= float(_to_numpy(label_log_probs)[mask].astype(np.float64).sum())
+
+        self.__true_positive = _add_counts(self.__true_positive, labels[predictions == labels])
+        self.__predicted = _add_counts(self.__predicted, predictions)
+        self.__actual = _add_counts(self.__actual, labels)
+
+    def compute(self):
+        return {
+            "masked_accuracy": self.__correct / self.__total if self.__total > 0 else 0,
+            "perplexity": exp(self.__nll_sum / self.__total) if self.__total > 0 else float("nan"),
+            "f1_score": macro_f1(self.__true_positive, self.__predicted, self.__actual),
+        }
+
+    def reset(self):
+        self.__correct = 0
+        self.__total = 0
+        self.__nll_sum = 0.0
+        self.__true_positive = np.zeros(0, dtype=np.int64)
+        self.__predicted = np.zeros(0, dtype=np.int64)
+        self.__actual = np.zeros(0, dtype=np.int64)
+
+
+def macro_f1(true_positive, predicted, actual):
+    """
+    Macro F1 over every token id seen in the references or predictions,
+    the label set sklearn's f1_score(average="macro") uses.
+    """
+    size = max(len(true_positive), len(predicted), len(actual))
+    true_positive = np.pad(true_positive, (0, size - len(true_positive)))
+    support = np.pad(predicted, (0, size - len(predicted))) + np.pad(
+        actual, (0, size - len(actual))
     )
+    present = support > 0
+
+    if not present.any():
+        return 0.0
+
+    return float(np.mean(2 * true_positive[present] / support[present]))
+
+
+def _add_counts(counts, values):
+    if len(values) == 0:
+        return counts
+
+    batch_counts = np.bincount(values, minlength=len(counts))
+    batch_counts[: len(counts)] += counts
+
+    return batch_counts
+
+
+def _to_numpy(x):
+    if hasattr(x, "detach"):
+        return x.detach().cpu().numpy()
 
-    return {
-        "masked_accuracy": masked_accuracy,
-        "perplexity": perplexity,
-        "f1_score": f1_score["f1"],
-    }
+    return np.asarray(x)
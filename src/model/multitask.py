@@ -0,0 +1,314 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+from transformers import AutoModel
+from transformers.utils import ModelOutput
+
+from src.data.span_detection_ds import TECHNIQUES
+from src.model.span_detection_metrics import IGNORE_LABEL, evaluate_masked
+from src.model.span_inference import (
+    MANIPULATION_LABEL,
+    encode_posts,
+    iter_model_batches,
+    post_token_logits,
+    spans_from_token_predictions,
+)
+
+_HEADS_FILE = "multitask_heads.safetensors"
+
+
+@dataclass
+class MultiTaskOutput(ModelOutput):
+    loss: Optional[torch.FloatTensor] = None
+    logits: torch.FloatTensor = None
+    technique_logits: torch.FloatTensor = None
+
+
+class MultiTaskModel(nn.Module):
+    """
+    One encoder pass for both subtasks: a token classification head for
+    manipulation spans and a multilabel head over the mean-pooled tokens for
+    techniques.
+
+    The output's `logits` are the token logits, so predict_token_logits,
+    predict_spans and the span metrics work with this model unchanged.
+    Training takes `labels` and `technique_labels` as produced by
+    ManipulationDetectionDataset(with_techniques=True); the loss is token
+    cross-entropy plus `technique_weight` times the technique BCE.
+    """
+
+    def __init__(
+        self,
+        encoder,
+        techniques: list = TECHNIQUES,
+        technique_weight: float = 1.0,
+        classifier_dropout: float = 0.1,
+    ):
+        super().__init__()
+        self.encoder = encoder
+        self.config = encoder.config
+        self.config.techniques = list(techniques)
+        self.config.technique_weight = technique_weight
+
+        self.dropout = nn.Dropout(classifier_dropout)
+        self.token_head = nn.Linear(self.config.hidden_size, self.config.num_labels)
+        self.technique_head = nn.Linear(self.config.hidden_size, len(techniques))
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        checkpoint,
+        label2id: dict = None,
+        techniques: list = TECHNIQUES,
+        technique_weight: float = 1.0,
+        classifier_dropout: float = 0.1,
+        **kwargs,
+    ):
+        """
+        Either a folder written by save_pretrained, or an encoder checkpoint
+        the heads are freshly initialized on top of.
+
+        Args:
+            label2id: Token labels, e.g. ManipulationDetectionDataset.label2id;
+                required for a plain encoder checkpoint
+        """
+        heads_path = Path(checkpoint) / _HEADS_FILE
+
+        if heads_path.is_file():
+            from safetensors.torch import load_file
+
+            encoder = AutoModel.from_pretrained(checkpoint, add_pooling_layer=False, **kwargs)
+            model = cls(
+                encoder,
+                encoder.config.techniques,
+                encoder.config.technique_weight,
+                classifier_dropout,
+            )
+
+            # The encoder is already loaded, only the head keys must line up
+            result = model.load_state_dict(load_file(str(heads_path)), strict=False)
+            missing = [it for it in result.missing_keys if not it.startswith("encoder.")]
+            if missing or result.unexpected_keys:
+                raise ValueError(
+                    f"[ {heads_path} ] does not match the model heads: "
+                    f"missing {missing}, unexpected {result.unexpected_keys}"
+                )
+
+            return model
+
+        encoder = AutoModel.from_pretrained(
+            checkpoint,
+            add_pooling_layer=False,
+            num_labels=len(label2id),
+            label2id=label2id,
+            id2label={v: k for k, v in label2id.items()},
+            **kwargs,
+        )
+
+        return cls(encoder, techniques, technique_weight, classifier_dropout)
+
+    def save_pretrained(self, path: Path):
+        """
+        The encoder in the usual transformers layout, plus the head weights.
+        """
+        from safetensors.torch import save_file
+
+        path = Path(path)
+        self.encoder.save_pretrained(path)
+
+        heads = {
+            k: v.detach().contiguous().cpu()
+            for k, v in self.state_dict().items()
+            if not k.startswith("encoder.")
+        }
+        save_file(heads, str(path / _HEADS_FILE))
+
+    @property
+    def device(self) -> torch.device:
+        return next(self.parameters()).device
+
+    def forward(
+        self,
+        input_ids=None,
+        attention_mask=None,
+        token_type_ids=None,
+        labels=None,
+        technique_labels=None,
+    ) -> MultiTaskOutput:
+        encoder_inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if token_type_ids is not None:
+            encoder_inputs["token_type_ids"] = token_type_ids
+
+        hidden = self.encoder(**encoder_inputs).last_hidden_state
+
+        if attention_mask is None:
+            attention_mask = torch.ones(hidden.shape[:2], dtype=torch.long, device=hidden.device)
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+        logits = self.token_head(self.dropout(hidden))
+        technique_logits = self.technique_head(self.dropout(pooled))
+
+        loss = None
+        if labels is not None:
+            loss = nn.functional.cross_entropy(
+                logits.view(-1, logits.shape[-1]),
+                labels.view(-1),
+                ignore_index=IGNORE_LABEL,
+            )
+        if technique_labels is not None:
+            technique_loss = nn.functional.binary_cross_entropy_with_logits(
+                technique_logits, technique_labels.to(technique_logits.dtype)
+            )
+            technique_loss = self.config.technique_weight * technique_loss
+            loss = technique_loss if loss is None else loss + technique_loss
+
+        return MultiTaskOutput(loss=loss, logits=logits, technique_logits=technique_logits)
+
+
+def compute_multitask_metrics(p) -> dict:
+    """
+    Trainer compute_metrics: token and span metrics of evaluate_masked plus
+    macro technique precision, recall and F1 at a 0.5 probability threshold.
+    """
+    (logits, technique_logits), (labels, technique_labels) = p.predictions, p.label_ids
+
+    result = evaluate_masked(labels, np.argmax(logits, axis=2))
+    result.update(technique_metrics(technique_labels, technique_logits > 0))
+
+    return result
+
+
+def technique_metrics(y_true, y_pred) -> dict:
+    """
+    Macro-averaged multilabel metrics over [posts, techniques] 0/1 matrices.
+    """
+    y_true, y_pred = np.asarray(y_true) > 0.5, np.asarray(y_pred, dtype=bool)
+
+    tp = (y_true & y_pred).sum(axis=0)
+    predicted, actual = y_pred.sum(axis=0), y_true.sum(axis=0)
+
+    precision = np.divide(tp, predicted, out=np.zeros(len(tp)), where=predicted > 0)
+    recall = np.divide(tp, actual, out=np.zeros(len(tp)), where=actual > 0)
+    f1 = np.divide(
+        2 * precision * recall,
+        precision + recall,
+        out=np.zeros(len(tp)),
+        where=precision + recall > 0,
+    )
+
+    return {
+        "technique_precision": float(precision.mean()),
+        "technique_recall": float(recall.mean()),
+        "technique_f1": float(f1.mean()),
+        "technique_exact_match": float((y_true == y_pred).all(axis=1).mean()),
+    }
+
+
+def predict_multitask_logits(
+    model,
+    tokenizer,
+    texts,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+):
+    """
+    Token and technique logits of every post from one forward pass per
+    sequence. Windows of a long post are merged as in predict_post_logits,
+    their technique logits are averaged.
+
+    Returns:
+        tuple: Per-post offset arrays [n, 2], token logit arrays
+            [n, num_labels] and a [posts, techniques] technique logit array
+    """
+    encodings = encode_posts(tokenizer, texts, max_length=max_length, stride=stride)
+
+    logits = [None] * len(encodings["input_ids"])
+    sequence_logits = np.zeros(
+        (len(encodings["input_ids"]), len(model.config.techniques)), dtype=np.float32
+    )
+
+    for batch_idx, batch_lengths, output in iter_model_batches(model, encodings, batch_size):
+        batch_logits = output.logits.float().cpu().numpy()
+        sequence_logits[batch_idx] = output.technique_logits.float().cpu().numpy()
+
+        for row, i in enumerate(batch_idx):
+            logits[i] = batch_logits[row, : batch_lengths[row]]
+
+    offsets, logits = post_token_logits(encodings, logits, len(texts))
+
+    sample_mapping = encodings.get("overflow_to_sample_mapping")
+    if sample_mapping is None:
+        return offsets, logits, sequence_logits
+
+    technique_logits = np.zeros((len(texts), sequence_logits.shape[1]), dtype=np.float32)
+    np.add.at(technique_logits, sample_mapping, sequence_logits)
+    windows = np.bincount(sample_mapping, minlength=len(texts)).astype(np.float32)
+
+    return offsets, logits, technique_logits / windows[:, None]
+
+
+def predict_spans_and_techniques(
+    model,
+    tokenizer,
+    texts,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+    threshold: float = 0.5,
+    label: str = MANIPULATION_LABEL,
+):
+    """
+    Returns:
+        tuple: Per-post span lists, as predict_spans returns them, and
+            per-post lists of techniques with probability above threshold
+    """
+    offsets, logits, technique_logits = predict_multitask_logits(
+        model, tokenizer, texts, batch_size=batch_size, max_length=max_length, stride=stride
+    )
+
+    label_id = model.config.label2id[label]
+    spans = spans_from_token_predictions(
+        offsets, [it.argmax(-1) == label_id for it in logits], None
+    )
+
+    selected = 1 / (1 + np.exp(-technique_logits)) > threshold
+    names = np.asarray(model.config.techniques)
+    techniques = [names[row].tolist() for row in selected]
+
+    return spans, techniques
+
+
+def predict_spans_and_techniques_df(
+    model,
+    tokenizer,
+    df: pd.DataFrame,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+    threshold: float = 0.5,
+) -> pd.DataFrame:
+    """
+    Returns:
+        pd.DataFrame: `id, trigger_words, techniques` frame covering both
+            subtask submissions
+    """
+    spans, techniques = predict_spans_and_techniques(
+        model,
+        tokenizer,
+        df["content"].tolist(),
+        batch_size=batch_size,
+        max_length=max_length,
+        stride=stride,
+        threshold=threshold,
+    )
+
+    return pd.DataFrame(
+        {"id": df["id"].tolist(), "trigger_words": spans, "techniques": techniques}
+    )
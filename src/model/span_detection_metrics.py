@@ -1,109 +1,250 @@
-import evaluate
 import numpy as np
-from sklearn.metrics import classification_report
 
-seqeval = evaluate.load("seqeval")
+IGNORE_LABEL = -100
+MANIPULATION_ID = 1
+
+_COUNT_NAMES = (
+    "token_tp",
+    "token_predicted",
+    "token_actual",
+    "span_tp",
+    "span_predicted",
+    "span_actual",
+    "correct",
+    "total",
+)
 
 
 def compute_metrics(dataset_blueprint):
     def compute_internal(p):
         """
         Evaluate both token-level and span-level metrics.
-        
+
         Args:
-            y_true: List of lists containing true binary labels (0/1)
-            y_pred: List of lists containing predicted binary labels (0/1)
+            p: EvalPrediction with [N, seq, num_labels] logits and [N, seq] labels
             dataset_blueprint: Dataset object containing label mappings
-        
+
         Returns:
             dict: Dictionary containing both token and span level metrics
         """
         predictions, labels = p
         predictions = np.argmax(predictions, axis=2)
 
-        true_predictions = [
-            [
-                p
-                for (p, l) in zip(prediction, label)
-                if l != -100
-            ]
-            for prediction, label in zip(predictions, labels)
-        ]
-        true_labels = [
-            [
-                l
-                for (p, l) in zip(prediction, label)
-                if l != -100
-            ]
-            for prediction, label in zip(predictions, labels)
-        ]
-        # Get token-level metrics
-        token_metrics = evaluate_tokens(true_labels, true_predictions)
-        
-        # Convert to IO format for seqeval span-level evaluation
-        y_true_io = convert_to_io(true_labels, dataset_blueprint.id2label)
-        y_pred_io = convert_to_io(true_predictions, dataset_blueprint.id2label)
-        
-        # Calculate span-level metrics
-        results = seqeval.compute(predictions=y_pred_io, references=y_true_io)
-        return {
-            # Token-level metrics
-            'token_f1': token_metrics['token_f1'],
-            'token_precision': token_metrics['token_precision'],
-            'token_recall': token_metrics['token_recall'],
-            # Span-level metrics
-            'span_f1': results['overall_f1'],
-            'span_precision': results['overall_precision'],
-            'span_recall': results['overall_recall'],
-            'accuracy': results['overall_accuracy'],
-        }
-    
+        return evaluate_masked(labels, predictions)
+
     return compute_internal
 
 
-def convert_to_io(labels, id2label):
+def compute_streaming_metrics(dataset_blueprint):
     """
-    Convert binary labels to IO format.
-    1 -> I-MANIPULATION
-    0 -> O
+    Batch-wise counterpart of compute_metrics.
 
-    Args:
-        labels: List of lists containing binary labels (0/1)
-        id2label: Dictionary mapping label IDs to label names
+    Pass the result as compute_metrics together with
+    preprocess_logits_for_metrics and TrainingArguments(batch_eval_metrics=True),
+    so evaluation keeps running counts instead of every logit.
+    """
+    return SpanMetricsAccumulator()
 
-    Returns:
-        List of lists containing IO
+
+def preprocess_logits_for_metrics(logits, labels):
+    if isinstance(logits, tuple):
+        logits = logits[0]
+
+    return logits.argmax(dim=-1)
+
+
+class SpanMetricsAccumulator:
+
+    __counts: dict
+
+    def __init__(self):
+        self.reset()
+
+    def __call__(self, p, compute_result: bool = False):
+        predictions, labels = p
+        self.update(labels, predictions)
+
+        if not compute_result:
+            return None
+
+        result = self.compute()
+        self.reset()
+
+        return result
+
+    def update(self, labels, predictions):
+        labels = _to_numpy(labels)
+        predictions = _to_numpy(predictions)
+
+        if predictions.ndim == labels.ndim + 1:
+            predictions = predictions.argmax(-1)
+
+        for name, value in count_masked(labels, predictions).items():
+            self.__counts[name] += value
+
+    def compute(self):
+        return metrics_from_counts(self.__counts)
+
+    def reset(self):
+        self.__counts = dict.fromkeys(_COUNT_NAMES, 0)
+
+
+def evaluate_masked(labels, predictions):
+    """
+    Token and span metrics over padded [N, seq] label and prediction arrays.
+
+    Positions labelled -100 are dropped before anything is counted, exactly
+    like the IO sequences that used to be handed to seqeval.
     """
-    io_labels = []
-    for sequence in labels:
-        io_sequence = ['I-MANIPULATION' if label == 1 else 'O' for label in sequence]
-        io_labels.append(io_sequence)
-    return io_labels
+    return metrics_from_counts(count_masked(labels, predictions))
+
+
+def count_masked(labels, predictions):
+    labels = np.asarray(labels)
+    predictions = np.asarray(predictions)
+    mask = labels != IGNORE_LABEL
+
+    y_true = labels[mask] == MANIPULATION_ID
+    y_pred = predictions[mask] == MANIPULATION_ID
+    sequence_idx = np.broadcast_to(
+        np.arange(labels.shape[0])[:, None], labels.shape
+    )[mask]
+
+    true_spans = extract_spans(y_true, sequence_idx)
+    pred_spans = extract_spans(y_pred, sequence_idx)
+
+    return {
+        "token_tp": int(np.count_nonzero(y_true & y_pred)),
+        "token_predicted": int(np.count_nonzero(y_pred)),
+        "token_actual": int(np.count_nonzero(y_true)),
+        "span_tp": len(np.intersect1d(true_spans, pred_spans, assume_unique=True)),
+        "span_predicted": len(pred_spans),
+        "span_actual": len(true_spans),
+        "correct": int(np.count_nonzero(y_true == y_pred)),
+        "total": len(y_true),
+    }
+
+
+def metrics_from_counts(counts):
+    token_precision, token_recall, token_f1 = precision_recall_f1(
+        counts["token_tp"], counts["token_predicted"], counts["token_actual"]
+    )
+    span_precision, span_recall, span_f1 = precision_recall_f1(
+        counts["span_tp"], counts["span_predicted"], counts["span_actual"], harmonic_f1=True
+    )
+
+    return {
+        # Token-level metrics
+        "token_f1": token_f1,
+        "token_precision": token_precision,
+        "token_recall": token_recall,
+        # Span-level metrics
+        "span_f1": span_f1,
+        "span_precision": span_precision,
+        "span_recall": span_recall,
+        "accuracy": counts["correct"] / counts["total"] if counts["total"] > 0 else 0.0,
+    }
 
 
 def evaluate_tokens(y_true, y_pred):
     """
     Evaluate token-level metrics without considering span continuity.
-    
+
     Args:
-        y_true: List of lists containing true binary labels (0/1)
-        y_pred: List of lists containing predicted binary labels (0/1)
-    
+        y_true: Flat array of true binary labels (0/1)
+        y_pred: Flat array of predicted binary labels (0/1)
+
     Returns:
         dict: Dictionary containing token-level F1, precision, and recall scores
     """
-    # Flatten the nested lists
-    y_true_flat = [label for seq in y_true for label in seq]
-    y_pred_flat = [label for seq in y_pred for label in seq]
-    
-    # Calculate token-level metrics
-    report = classification_report(y_true_flat, y_pred_flat, 
-                                labels=[0, 1],
-                                target_names=['O', 'I-MANIPULATION'],
-                                output_dict=True)
-    
+    y_true = np.asarray(y_true, dtype=bool)
+    y_pred = np.asarray(y_pred, dtype=bool)
+
+    tp = int(np.count_nonzero(y_true & y_pred))
+    precision, recall, f1 = precision_recall_f1(
+        tp, int(np.count_nonzero(y_pred)), int(np.count_nonzero(y_true))
+    )
+
     return {
-        'token_f1': report['I-MANIPULATION']['f1-score'],
-        'token_precision': report['I-MANIPULATION']['precision'],
-        'token_recall': report['I-MANIPULATION']['recall'],
+        "token_f1": f1,
+        "token_precision": precision,
+        "token_recall": recall,
     }
+
+
+def evaluate_spans(y_true, y_pred, sequence_idx):
+    """
+    Evaluate exact-match span metrics, as seqeval does for IO tags.
+
+    A span is a maximal run of positive tokens inside one sequence.
+
+    Args:
+        y_true: Flat array of true binary labels (0/1)
+        y_pred: Flat array of predicted binary labels (0/1)
+        sequence_idx: Flat array with the sequence index of every token
+
+    Returns:
+        dict: Dictionary containing span-level F1, precision, and recall scores
+    """
+    true_spans = extract_spans(y_true, sequence_idx)
+    pred_spans = extract_spans(y_pred, sequence_idx)
+
+    tp = len(np.intersect1d(true_spans, pred_spans, assume_unique=True))
+    precision, recall, f1 = precision_recall_f1(
+        tp, len(pred_spans), len(true_spans), harmonic_f1=True
+    )
+
+    return {
+        "span_f1": f1,
+        "span_precision": precision,
+        "span_recall": recall,
+    }
+
+
+def extract_spans(positive, sequence_idx):
+    """
+    Encode every run of positive tokens as a single integer start * n + end.
+    """
+    positive = np.asarray(positive, dtype=bool)
+    sequence_idx = np.asarray(sequence_idx)
+    n = len(positive)
+
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boundary = np.ones(n + 1, dtype=bool)
+    boundary[1:-1] = sequence_idx[1:] != sequence_idx[:-1]
+
+    padded = np.zeros(n + 2, dtype=bool)
+    padded[1:-1] = positive
+
+    starts = np.flatnonzero(positive & (~padded[:-2] | boundary[:-1]))
+    ends = np.flatnonzero(positive & (~padded[2:] | boundary[1:]))
+
+    return starts.astype(np.int64) * n + ends
+
+
+def precision_recall_f1(tp, predicted, actual, harmonic_f1=False):
+    """
+    Precision, recall and F1 with 0 for empty denominators.
+
+    sklearn computes token F1 as 2 * tp / (predicted + actual) while seqeval
+    takes the harmonic mean of precision and recall; both are kept so the
+    results match those libraries to the last bit.
+    """
+    precision = tp / predicted if predicted > 0 else 0.0
+    recall = tp / actual if actual > 0 else 0.0
+
+    if harmonic_f1:
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    else:
+        f1 = 2 * tp / (predicted + actual) if predicted + actual > 0 else 0.0
+
+    return precision, recall, f1
+
+
+def _to_numpy(x):
+    if hasattr(x, "detach"):
+        return x.detach().cpu().numpy()
+
+    return np.asarray(x)
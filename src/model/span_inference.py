@@ -0,0 +1,310 @@
+import numpy as np
+import pandas as pd
+import torch
+
+MANIPULATION_LABEL = "I-MANIPULATION"
+
+
+def predict_spans_df(
+    model,
+    tokenizer,
+    df: pd.DataFrame,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+    label: str = MANIPULATION_LABEL,
+) -> pd.DataFrame:
+    """
+    Score every post of a frame with `id` and `content` columns.
+
+    With `stride` set, long posts are split into overlapping windows of
+    `max_length` tokens instead of being truncated.
+
+    Returns:
+        pd.DataFrame: `id, trigger_words` frame accepted by submit_df_competition
+    """
+    spans = predict_spans(
+        model,
+        tokenizer,
+        df["content"].tolist(),
+        batch_size=batch_size,
+        max_length=max_length,
+        stride=stride,
+        label=label,
+    )
+
+    return pd.DataFrame({"id": df["id"].tolist(), "trigger_words": spans})
+
+
+def predict_spans(
+    model,
+    tokenizer,
+    texts,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+    label: str = MANIPULATION_LABEL,
+):
+    offsets, logits = predict_post_logits(
+        model, tokenizer, texts, batch_size=batch_size, max_length=max_length, stride=stride
+    )
+    label_id = model.config.label2id[label]
+    predictions = [it.argmax(-1) == label_id for it in logits]
+
+    return spans_from_token_predictions(offsets, predictions, None)
+
+
+def predict_post_logits(
+    model,
+    tokenizer,
+    texts,
+    batch_size: int = 32,
+    max_length: int = None,
+    stride: int = None,
+):
+    """
+    Token logits of every post, keyed by character offsets.
+
+    Special tokens are dropped; with `stride` set, overlapping windows are
+    merged back into one sequence per post.
+
+    Returns:
+        tuple: Per-post offset arrays [n, 2] and logit arrays [n, num_labels]
+    """
+    encodings = encode_posts(tokenizer, texts, max_length=max_length, stride=stride)
+    logits = predict_token_logits(model, encodings, batch_size)
+
+    return post_token_logits(encodings, logits, len(texts))
+
+
+def encode_posts(tokenizer, texts, max_length: int = None, stride: int = None):
+    """
+    Tokenize posts with the offsets and special tokens mask post_token_logits
+    needs; with `stride` set, long posts overflow into overlapping windows.
+    """
+    windowed = stride is not None
+
+    return tokenizer(
+        texts,
+        truncation=True,
+        max_length=max_length,
+        stride=stride if windowed else 0,
+        return_overflowing_tokens=windowed,
+        return_offsets_mapping=True,
+        return_special_tokens_mask=True,
+    )
+
+
+def post_token_logits(encodings, logits, posts_count):
+    """
+    Drop special tokens from per-sequence token logits of encode_posts
+    output and merge overlapping windows back into one sequence per post.
+
+    Returns:
+        tuple: Per-post offset arrays [n, 2] and logit arrays [n, num_labels]
+    """
+    if "overflow_to_sample_mapping" in encodings:
+        return merge_window_logits(
+            encodings["overflow_to_sample_mapping"],
+            encodings["offset_mapping"],
+            logits,
+            encodings["special_tokens_mask"],
+            posts_count,
+        )
+
+    offsets = []
+    for i, it in enumerate(logits):
+        keep = ~np.asarray(encodings["special_tokens_mask"][i], dtype=bool)
+        post_offsets = np.asarray(encodings["offset_mapping"][i], dtype=np.int64)
+        offsets.append(post_offsets.reshape(-1, 2)[keep])
+        logits[i] = it[keep]
+
+    return offsets, logits
+
+
+def predict_token_logits(model, encodings, batch_size: int = 32):
+    """
+    Run a token classification model over pre-tokenized posts.
+
+    Posts are sorted by length and grouped into batches of neighbours, so each
+    batch is padded only up to its own longest post.
+
+    Args:
+        model: Token classification model
+        encodings: Tokenizer output with unpadded `input_ids`
+        batch_size: Number of posts per forward pass
+
+    Returns:
+        list: Per-post float32 arrays of shape [n_tokens, num_labels], in input order
+    """
+    results = [None] * len(encodings["input_ids"])
+
+    for batch_idx, batch_lengths, output in iter_model_batches(model, encodings, batch_size):
+        batch_logits = output.logits.float().cpu().numpy()
+
+        for row, i in enumerate(batch_idx):
+            results[i] = batch_logits[row, : batch_lengths[row]]
+
+    return results
+
+
+def iter_model_batches(model, encodings, batch_size: int = 32):
+    """
+    Forward passes of predict_token_logits, for models whose output carries
+    more than token logits.
+
+    Yields:
+        tuple: Post indices of the batch, their token counts and the model output
+    """
+    input_ids = encodings["input_ids"]
+    token_type_ids = encodings.get("token_type_ids")
+    lengths = np.fromiter((len(it) for it in input_ids), dtype=np.int64)
+    order = np.argsort(lengths, kind="stable")
+    pad_token_id = model.config.pad_token_id or 0
+    device = model.device
+
+    model.eval()
+
+    with torch.inference_mode():
+        for batch_start in range(0, len(order), batch_size):
+            batch_idx = order[batch_start : batch_start + batch_size]
+            batch_lengths = lengths[batch_idx]
+            width = int(batch_lengths.max())
+            attention_mask = np.arange(width) < batch_lengths[:, None]
+
+            batch = {
+                "input_ids": __pad([input_ids[i] for i in batch_idx], width, pad_token_id),
+                "attention_mask": attention_mask.astype(np.int64),
+            }
+            if token_type_ids is not None:
+                batch["token_type_ids"] = __pad(
+                    [token_type_ids[i] for i in batch_idx], width, 0
+                )
+
+            batch = {k: torch.from_numpy(v).to(device) for k, v in batch.items()}
+
+            yield batch_idx, batch_lengths, model(**batch)
+
+
+def merge_window_logits(
+    sample_mapping, offset_mapping, logits, special_tokens_mask, posts_count
+):
+    """
+    Fold per-window token logits back into one sequence per post.
+
+    Tokens from overlapping windows share their character offsets, so logits
+    are averaged per (post, start, end) key. Special tokens are dropped.
+
+    Args:
+        sample_mapping: Post index of every window (overflow_to_sample_mapping)
+        offset_mapping: Per-window lists of (start, end) token offsets
+        logits: Per-window arrays of shape [n_tokens, num_labels]
+        special_tokens_mask: Per-window lists, 1 for special tokens
+        posts_count: Number of posts that were tokenized
+
+    Returns:
+        tuple: Per-post offset arrays [n, 2] and merged logit arrays [n, num_labels],
+            ordered by character offset
+    """
+    lengths = np.fromiter((len(it) for it in offset_mapping), dtype=np.int64)
+    num_labels = logits[0].shape[-1] if len(logits) > 0 else 0
+
+    post_idx = np.repeat(np.asarray(sample_mapping, dtype=np.int64), lengths)
+    offsets = np.concatenate(
+        [np.asarray(it, dtype=np.int64).reshape(-1, 2) for it in offset_mapping]
+        + [np.empty((0, 2), dtype=np.int64)]
+    )
+    values = np.concatenate(
+        [np.asarray(it, dtype=np.float32).reshape(-1, num_labels) for it in logits]
+        + [np.empty((0, num_labels), dtype=np.float32)]
+    )
+    keep = ~np.concatenate(
+        [np.asarray(it, dtype=bool).reshape(-1) for it in special_tokens_mask]
+        + [np.empty(0, dtype=bool)]
+    )
+
+    post_idx, offsets, values = post_idx[keep], offsets[keep], values[keep]
+
+    order = np.lexsort((offsets[:, 1], offsets[:, 0], post_idx))
+    post_idx, offsets, values = post_idx[order], offsets[order], values[order]
+
+    new_key = np.ones(len(post_idx), dtype=bool)
+    new_key[1:] = (post_idx[1:] != post_idx[:-1]) | np.any(
+        offsets[1:] != offsets[:-1], axis=1
+    )
+    group = np.cumsum(new_key) - 1
+    groups_count = int(new_key.sum())
+
+    sums = np.zeros((groups_count, num_labels), dtype=np.float32)
+    np.add.at(sums, group, values)
+    counts = np.bincount(group, minlength=groups_count).astype(np.float32)
+    merged = sums / counts[:, None]
+
+    bounds = np.cumsum(np.bincount(post_idx[new_key], minlength=posts_count))[:-1]
+
+    return np.split(offsets[new_key], bounds), np.split(merged, bounds)
+
+
+def spans_from_token_predictions(offset_mapping, predictions, special_tokens_mask):
+    """
+    Merge runs of consecutive positive tokens into character spans.
+
+    Mirrors pipeline("ner", aggregation_strategy="simple"): a span starts at the
+    first token of a run and ends at the last one, special tokens never belong
+    to a span.
+
+    Args:
+        offset_mapping: Per-post lists of (start, end) token offsets
+        predictions: Per-post boolean arrays, True for manipulation tokens
+        special_tokens_mask: Per-post lists, 1 for special tokens, or None
+
+    Returns:
+        list: Per-post lists of (start, end) tuples
+    """
+    lengths = np.fromiter((len(it) for it in offset_mapping), dtype=np.int64)
+    total = int(lengths.sum())
+
+    if total == 0:
+        return [[] for _ in offset_mapping]
+
+    offsets = np.concatenate(
+        [np.asarray(it, dtype=np.int64).reshape(-1, 2) for it in offset_mapping]
+    )
+    positive = np.concatenate(
+        [np.asarray(it, dtype=bool).reshape(-1) for it in predictions]
+    )
+    if special_tokens_mask is not None:
+        positive &= ~np.concatenate(
+            [np.asarray(it, dtype=bool).reshape(-1) for it in special_tokens_mask]
+        )
+
+    post_idx = np.repeat(np.arange(len(lengths)), lengths)
+    new_post = np.ones(total, dtype=bool)
+    new_post[1:] = post_idx[1:] != post_idx[:-1]
+
+    prev_positive = np.zeros(total, dtype=bool)
+    prev_positive[1:] = positive[:-1]
+    next_positive = np.zeros(total, dtype=bool)
+    next_positive[:-1] = positive[1:]
+    last_of_post = np.roll(new_post, -1)
+
+    run_starts = np.flatnonzero(positive & (new_post | ~prev_positive))
+    run_ends = np.flatnonzero(positive & (last_of_post | ~next_positive))
+
+    spans = [[] for _ in offset_mapping]
+    for post, start, end in zip(
+        post_idx[run_starts].tolist(),
+        offsets[run_starts, 0].tolist(),
+        offsets[run_ends, 1].tolist(),
+    ):
+        spans[post].append((start, end))
+
+    return spans
+
+
+def __pad(sequences, width, value):
+    result = np.full((len(sequences), width), value, dtype=np.int64)
+    for row, it in enumerate(sequences):
+        result[row, : len(it)] = it
+
+    return result
@@ -0,0 +1,363 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.encoding_cache import make_cache_key
+from src.data.span_detection_ds import TECHNIQUES, technique_targets
+
+MINILM_CHECKPOINT = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class SentenceEncoder:
+    """
+    Mean-pooled, L2-normalized sentence embeddings of a transformers
+    encoder, as sentence-transformers computes them for MiniLM.
+    """
+
+    def __init__(
+        self,
+        checkpoint: str = MINILM_CHECKPOINT,
+        max_length: int = 256,
+        batch_size: int = 64,
+        device=None,
+    ):
+        from transformers import AutoModel, AutoTokenizer
+
+        from src.model.ensemble import model_fingerprint
+        from src.util.torch_device import resolve_torch_device
+
+        self.tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+        self.model = AutoModel.from_pretrained(checkpoint).to(device or resolve_torch_device())
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.cache_key = make_cache_key(
+            model=model_fingerprint(self.model), max_length=max_length, pooling="mean"
+        )
+
+    def __call__(self, texts) -> np.ndarray:
+        import torch
+
+        from src.model.span_inference import iter_model_batches
+
+        encodings = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        result = np.zeros((len(texts), self.model.config.hidden_size), dtype=np.float32)
+
+        for batch_idx, batch_lengths, output in iter_model_batches(
+            self.model, encodings, self.batch_size
+        ):
+            hidden = output.last_hidden_state
+            lengths = torch.from_numpy(batch_lengths).to(hidden.device)
+            mask = (torch.arange(hidden.shape[1], device=hidden.device) < lengths[:, None])
+            mask = mask.unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / lengths[:, None].to(hidden.dtype)
+            result[batch_idx] = torch.nn.functional.normalize(pooled, dim=-1).float().cpu().numpy()
+
+        return result
+
+
+class IVFIndex:
+    """
+    Inverted-file index for inner-product search over normalized vectors.
+
+    Centroids are trained with spherical k-means on the first `add` (or an
+    explicit `train`); every vector goes to the list of its nearest centroid
+    and a query scans the `nprobe` lists closest to it. Inserts after
+    training only append to lists, so the index grows incrementally; call
+    `train` again once the data has drifted far from the centroids.
+    """
+
+    def __init__(self, nlist: int = 64, nprobe: int = 8, seed: int = 42):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = None
+
+        self.__size = 0
+        # Grown by doubling, rows past self.__size are unused capacity
+        self.__vectors = None
+        self.__lists = []
+        self.__list_arrays = []
+
+    def __len__(self):
+        return self.__size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.__vectors[: self.__size]
+
+    def train(self, vectors: np.ndarray, iterations: int = 10):
+        """
+        Spherical k-means centroids; vectors already in the index are
+        reassigned to them.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        nlist = max(1, min(self.nlist, len(vectors)))
+
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            empty = ~np.bincount(assignment, minlength=nlist).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids
+        self.__lists = [[] for _ in range(nlist)]
+        self.__list_arrays = [None] * nlist
+
+        if self.__size:
+            self.__assign(np.arange(self.__size))
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Index rows of the added vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = np.arange(self.__size, self.__size + len(vectors))
+
+        if self.__vectors is None:
+            self.__vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        if self.__size + len(vectors) > len(self.__vectors):
+            capacity = max(self.__size + len(vectors), 2 * len(self.__vectors))
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            grown[: self.__size] = self.vectors
+            self.__vectors = grown
+
+        self.__vectors[rows] = vectors
+        self.__size += len(vectors)
+
+        if self.centroids is None:
+            self.train(self.vectors)
+        else:
+            self.__assign(rows)
+
+        return rows
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = None):
+        """
+        Returns:
+            tuple: [queries, k] scores and index rows, best first; rows are -1
+                where the probed lists hold fewer than k vectors
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+        # One matrix product per probed list against all queries probing it,
+        # merged into the running top k of those queries
+        pair_queries = np.repeat(np.arange(len(queries)), nprobe)
+        pair_lists = probes.reshape(-1)
+        order = np.argsort(pair_lists, kind="stable")
+        pair_queries, pair_lists = pair_queries[order], pair_lists[order]
+        bounds = np.flatnonzero(np.diff(pair_lists)) + 1
+
+        for query_rows, lists in zip(np.split(pair_queries, bounds), np.split(pair_lists, bounds)):
+            candidates = self.__list_rows(lists[0])
+            if not len(candidates):
+                continue
+
+            found = queries[query_rows] @ self.__vectors[candidates].T
+            merged_scores = np.concatenate([scores[query_rows], found], axis=1)
+            merged_rows = np.concatenate(
+                [rows[query_rows], np.broadcast_to(candidates, found.shape)], axis=1
+            )
+
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            scores[query_rows] = np.take_along_axis(merged_scores, top, axis=1)
+            rows[query_rows] = np.take_along_axis(merged_rows, top, axis=1)
+
+        order = np.argsort(-scores, axis=1, kind="stable")
+
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def search_exact(self, queries: np.ndarray, k: int = 10):
+        """
+        Brute-force counterpart of search.
+        """
+        found = np.asarray(queries, dtype=np.float32) @ self.vectors.T
+        top = np.argpartition(-found, min(k, found.shape[1]) - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(found, top, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+
+        return np.take_along_axis(found, top, axis=1), top
+
+    def recall(self, queries: np.ndarray, k: int = 10, nprobe: int = None) -> float:
+        """
+        Share of the exact top-k neighbours that search returns. A returned
+        neighbour scoring as high as the exact k-th one counts as a hit, so
+        ties are not held against the index.
+        """
+        scores, rows = self.search(queries, k, nprobe)
+        exact_scores, _ = self.search_exact(queries, k)
+
+        kth = exact_scores[:, -1:] - 1e-6
+        hits = ((scores >= kth) & (rows >= 0)).sum()
+
+        return float(hits / exact_scores.size)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            vectors=self.vectors,
+            centroids=self.centroids,
+            params=np.array([self.nlist, self.nprobe, self.seed]),
+        )
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            nlist, nprobe, seed = data["params"].tolist()
+            index = cls(nlist, nprobe, seed)
+            index.centroids = data["centroids"]
+            index.__lists = [[] for _ in range(len(index.centroids))]
+            index.__list_arrays = [None] * len(index.centroids)
+            index.add(data["vectors"])
+
+        return index
+
+    def __assign(self, rows):
+        assignment = np.argmax(self.__vectors[rows] @ self.centroids.T, axis=1)
+
+        for row, centroid in zip(rows.tolist(), assignment.tolist()):
+            self.__lists[centroid].append(row)
+            self.__list_arrays[centroid] = None
+
+    def __list_rows(self, centroid) -> np.ndarray:
+        if self.__list_arrays[centroid] is None:
+            self.__list_arrays[centroid] = np.asarray(self.__lists[centroid], dtype=np.int64)
+
+        return self.__list_arrays[centroid]
+
+
+class TechniqueRetriever:
+    """
+    kNN technique voting over embedded labelled posts.
+
+    Every neighbour votes with its cosine similarity for each of its
+    techniques and for being manipulative, so the result is a similarity
+    weighted share per technique. `skip_mask` is the cheap first stage in
+    front of the span and technique models: posts whose neighbourhood is
+    almost entirely non-manipulative need not be scored by them.
+    """
+
+    def __init__(
+        self,
+        encode,
+        store=None,
+        index: IVFIndex = None,
+        k: int = 10,
+        techniques: list = TECHNIQUES,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        """
+        Args:
+            encode: Callable mapping texts to normalized embeddings, e.g.
+                SentenceEncoder
+            store: Optional EmbeddingStore that caches the embeddings
+        """
+        self.encode = encode
+        self.store = store
+        self.index = index or IVFIndex()
+        self.k = k
+        self.techniques = list(techniques)
+        self.skip_threshold = 0.0
+        self.__logger = logger
+
+        self.__technique_labels = np.empty((0, len(self.techniques)), dtype=np.float32)
+        self.__manipulative = np.empty(0, dtype=np.float32)
+
+    def embed(self, texts) -> np.ndarray:
+        texts = list(texts)
+        if self.store is not None:
+            return self.store.embed(texts, self.encode)
+
+        return self.encode(texts)
+
+    def add(self, df: pd.DataFrame):
+        """
+        Insert labelled posts, e.g. span-detection.parquet rows with
+        `content`, `manipulative` and `techniques` columns.
+        """
+        self.index.add(self.embed(df["content"]))
+
+        targets = np.asarray(technique_targets(df["techniques"], self.techniques), dtype=np.float32)
+        self.__technique_labels = np.concatenate([self.__technique_labels, targets])
+        self.__manipulative = np.concatenate(
+            [self.__manipulative, df["manipulative"].to_numpy(dtype=np.float32)]
+        )
+        self.__logger.info("Retrieval index holds [ %s ] posts", len(self.index))
+
+    def vote(self, texts, k: int = None):
+        """
+        Returns:
+            tuple: [posts, techniques] technique scores and [posts]
+                manipulative scores, both in [0, 1]
+        """
+        scores, rows = self.index.search(self.embed(texts), k or self.k)
+
+        weights = np.where(rows >= 0, np.clip(scores, 0, None), 0)
+        total = np.maximum(weights.sum(axis=1, keepdims=True), 1e-12)
+        safe_rows = np.maximum(rows, 0)
+
+        technique_scores = np.einsum(
+            "qk,qkt->qt", weights, self.__technique_labels[safe_rows]
+        ) / total
+        manipulative_scores = (weights * self.__manipulative[safe_rows]).sum(axis=1) / total[:, 0]
+
+        return technique_scores, manipulative_scores
+
+    def predict_techniques(self, texts, threshold: float = 0.5, k: int = None) -> list:
+        technique_scores, _ = self.vote(texts, k)
+        names = np.asarray(self.techniques)
+
+        return [names[row].tolist() for row in technique_scores >= threshold]
+
+    def skip_mask(self, texts, k: int = None) -> np.ndarray:
+        """
+        True for posts that are likely non-manipulative, whose manipulative
+        score is at most skip_threshold (see calibrate_skip).
+        """
+        _, manipulative_scores = self.vote(texts, k)
+
+        return manipulative_scores <= self.skip_threshold
+
+    def calibrate_skip(self, df: pd.DataFrame, max_missed: float = 0.01, k: int = None) -> dict:
+        """
+        Set skip_threshold to the largest manipulative score that skips at
+        most `max_missed` of the manipulative posts of a labelled holdout.
+
+        Returns:
+            dict: Threshold, share of all posts skipped and share of
+                manipulative posts skipped
+        """
+        _, manipulative_scores = self.vote(df["content"], k)
+        manipulative = df["manipulative"].to_numpy(dtype=bool)
+
+        candidates = np.unique(manipulative_scores)
+        manipulative_sorted = np.sort(manipulative_scores[manipulative])
+        missed = np.searchsorted(manipulative_sorted, candidates, side="right") / max(
+            len(manipulative_sorted), 1
+        )
+
+        allowed = candidates[missed <= max_missed]
+        self.skip_threshold = float(allowed.max()) if len(allowed) else -1.0
+        skipped = manipulative_scores <= self.skip_threshold
+
+        result = {
+            "skip_threshold": self.skip_threshold,
+            "skipped": float(skipped.mean()),
+            "missed": float(skipped[manipulative].mean()) if manipulative.any() else 0.0,
+        }
+        self.__logger.info("Calibrated skip gate: %s", result)
+
+        return result
+
@@ -0,0 +1,162 @@
+import math
+import os
+from pathlib import Path
+
+# Checked in order, the first one set wins over the detected limits
+BUDGET_ENV_VARS = ("CPU_BUDGET", "SLURM_CPUS_PER_TASK")
+
+_CGROUP_ROOT = Path("/sys/fs/cgroup")
+_PROC_CGROUP = Path("/proc/self/cgroup")
+# Where the cgroup v1 cpu controller may be mounted under the cgroup root
+_V1_CPU_MOUNTS = ("cpu", "cpu,cpuacct")
+
+
+def cpu_budget() -> int:
+    """
+    Number of CPUs this process may actually use.
+
+    An explicit budget from BUDGET_ENV_VARS wins; otherwise the smallest of
+    the CPU affinity mask, the cgroup CPU quota and os.cpu_count().
+    """
+    for name in BUDGET_ENV_VARS:
+        value = os.environ.get(name, "").strip()
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+
+    limits = [os.cpu_count() or 1]
+
+    if hasattr(os, "sched_getaffinity"):
+        limits.append(len(os.sched_getaffinity(0)))
+
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        limits.append(max(1, math.ceil(quota)))
+
+    return min(limits)
+
+
+def cgroup_cpu_quota(
+    root: Path = _CGROUP_ROOT, proc_cgroup: Path = _PROC_CGROUP
+) -> float:
+    """
+    CPUs granted by the cgroup v2 cpu.max or v1 cfs quota, None if unlimited.
+
+    Containers and systemd slices set the quota on a nested cgroup rather
+    than on the root, so the cgroup of this process is resolved from
+    proc_cgroup and it and every ancestor under root are checked; the
+    tightest quota wins.
+    """
+    unified_path, cpu_path = _process_cgroup_paths(proc_cgroup)
+
+    quotas = [_cpu_max_quota(it) for it in _cgroup_dirs(root, unified_path)]
+
+    cpu_mount = next(
+        (root / it for it in _V1_CPU_MOUNTS if (root / it).is_dir()), None
+    )
+    if cpu_mount is not None:
+        quotas += [_cfs_quota(it) for it in _cgroup_dirs(cpu_mount, cpu_path)]
+
+    quotas = [it for it in quotas if it is not None]
+
+    return min(quotas) if quotas else None
+
+
+def _process_cgroup_paths(proc_cgroup: Path) -> tuple:
+    # Lines are "hierarchy-id:controllers:path"; the v2 hierarchy has no
+    # controllers listed. Without the file only the root cgroup is checked
+    try:
+        lines = proc_cgroup.read_text().splitlines()
+    except OSError:
+        return "/", "/"
+
+    unified_path, cpu_path = None, None
+
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if not controllers:
+            unified_path = path
+        elif "cpu" in controllers.split(","):
+            cpu_path = path
+
+    return unified_path, cpu_path
+
+
+def _cgroup_dirs(mount: Path, path: str) -> list:
+    # Without a cgroup namespace the listed path may not exist under the
+    # mount, only the ancestors that do are checked then
+    if path is None:
+        return []
+
+    relative = Path(path).relative_to("/")
+    dirs = [mount / relative] + [mount / it for it in relative.parents]
+
+    return [it for it in dirs if it.is_dir()]
+
+
+def _cpu_max_quota(directory: Path) -> float:
+    cpu_max = directory / "cpu.max"
+    if not cpu_max.is_file():
+        return None
+
+    quota, period = cpu_max.read_text().split()[:2]
+
+    return None if quota == "max" else int(quota) / int(period)
+
+
+def _cfs_quota(directory: Path) -> float:
+    quota_file = directory / "cpu.cfs_quota_us"
+    period_file = directory / "cpu.cfs_period_us"
+    if not (quota_file.is_file() and period_file.is_file()):
+        return None
+
+    quota = int(quota_file.read_text())
+
+    return None if quota <= 0 else quota / int(period_file.read_text())
+
+
+def plan_cpu_budget(workload: str = "inference", budget: int = None) -> dict:
+    """
+    Split the CPU budget between dataset worker processes, torch intra-op
+    threads and the tokenizers Rayon pool, so they do not oversubscribe it.
+
+    Args:
+        workload: "preprocess" runs one single-threaded datasets worker per
+            CPU; "inference" and "training" keep one process and give all
+            CPUs to torch, while batched tokenization between forward passes
+            may use the Rayon pool
+
+    Returns:
+        dict: num_proc, torch_threads and tokenizers_parallelism
+    """
+    budget = budget or cpu_budget()
+
+    if workload == "preprocess":
+        return {
+            "num_proc": budget,
+            "torch_threads": 1,
+            "tokenizers_parallelism": budget == 1,
+        }
+
+    if workload in ("inference", "training"):
+        return {
+            "num_proc": 1,
+            "torch_threads": budget,
+            "tokenizers_parallelism": True,
+        }
+
+    raise ValueError(f"Unknown workload [ {workload} ]")
+
+
+def dataset_num_proc(budget: int = None) -> int:
+    """
+    num_proc for datasets.map/filter in place of multiprocessing.cpu_count().
+
+    With several worker processes the tokenizers Rayon pool is switched off
+    (unless TOKENIZERS_PARALLELISM is already set), one thread per worker.
+    """
+    plan = plan_cpu_budget("preprocess", budget)
+
+    if not plan["tokenizers_parallelism"]:
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    return plan["num_proc"]
@@ -1,8 +1,109 @@
+import logging
+import os
+import time
+
+import numpy as np
 import torch
 
+from src.util.cpu_budget import plan_cpu_budget
+
+
+def resolve_torch_device(
+    configure_cpu: bool = False, workload: str = "inference"
+) -> torch.device:
+    """
+    Args:
+        configure_cpu: On CPU, also apply the plan_cpu_budget split for the
+            workload with configure_cpu_threads
+    """
+    device = torch.device(__resolve_torch_device_str())
+
+    if configure_cpu and device.type == "cpu":
+        configure_cpu_threads(workload)
+
+    return device
+
+
+def configure_cpu_threads(workload: str = "inference", budget: int = None) -> dict:
+    """
+    Apply plan_cpu_budget to torch and the tokenizers library.
+
+    Returns:
+        dict: The applied plan, its num_proc is meant for datasets.map
+    """
+    plan = plan_cpu_budget(workload, budget)
+
+    torch.set_num_threads(plan["torch_threads"])
+    os.environ["TOKENIZERS_PARALLELISM"] = str(plan["tokenizers_parallelism"]).lower()
+
+    return plan
+
+
+def autotune_batch_size(
+    model,
+    encodings,
+    candidates=(1, 2, 4, 8, 16, 32, 64, 128),
+    sample_size: int = 256,
+    logger: logging.Logger = logging.getLogger(__name__),
+):
+    """
+    Pick the inference batch size with the highest token throughput.
+
+    Every candidate scores the same sample of posts with
+    predict_token_logits after one warm-up batch. Candidates stop at the
+    first out-of-memory error, on CUDA or MPS, or once throughput drops
+    below the best so far twice in a row.
+
+    Args:
+        encodings: Tokenizer output with unpadded input_ids, as passed to
+            predict_token_logits
 
-def resolve_torch_device() -> torch.device:
-    return torch.device(__resolve_torch_device_str())
+    Returns:
+        tuple: Best batch size and a {batch_size: tokens_per_second} dict
+    """
+    from src.model.span_inference import predict_token_logits
+
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.permutation(len(encodings["input_ids"]))[:sample_size])
+    sample = {
+        k: [v[i] for i in rows]
+        for k, v in encodings.items()
+        if k in ("input_ids", "token_type_ids")
+    }
+    tokens_count = sum(len(it) for it in sample["input_ids"])
+
+    results = {}
+    best, worse_in_a_row = None, 0
+
+    for batch_size in candidates:
+        try:
+            warm_up = {k: v[:batch_size] for k, v in sample.items()}
+            predict_token_logits(model, warm_up, batch_size)
+            __synchronize(model.device)
+
+            start = time.perf_counter()
+            predict_token_logits(model, sample, batch_size)
+            __synchronize(model.device)
+            elapsed = time.perf_counter() - start
+        except RuntimeError as e:
+            if not __is_out_of_memory(e):
+                raise
+
+            logger.info("Batch size [ %s ] does not fit on [ %s ]", batch_size, model.device)
+            __empty_cache(model.device)
+            break
+
+        results[batch_size] = tokens_count / elapsed
+        logger.info("Batch size [ %s ]: [ %.0f ] tokens/s", batch_size, results[batch_size])
+
+        if best is None or results[batch_size] > results[best]:
+            best, worse_in_a_row = batch_size, 0
+        else:
+            worse_in_a_row += 1
+            if worse_in_a_row == 2:
+                break
+
+    return best, results
 
 
 def __resolve_torch_device_str() -> str:
@@ -12,3 +113,25 @@ def __resolve_torch_device_str() -> str:
         return "cuda"
     else:
         return "cpu"
+
+
+def __synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+
+def __is_out_of_memory(error: RuntimeError) -> bool:
+    # torch.cuda.OutOfMemoryError subclasses RuntimeError, while MPS raises a
+    # plain RuntimeError saying "MPS backend out of memory"
+    return isinstance(error, torch.cuda.OutOfMemoryError) or (
+        "out of memory" in str(error)
+    )
+
+
+def __empty_cache(device):
+    if device.type == "cuda":
+        torch.cuda.empty_cache()
+    elif device.type == "mps":
+        torch.mps.empty_cache()
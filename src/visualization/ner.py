@@ -1,6 +1,8 @@
 from enum import Enum
 import os
 
+import numpy as np
+
 
 ERROR_TYPE_TO_COLOR = {1: "green", 2: "yellow", 3: "red"}
 
@@ -11,98 +13,183 @@ class VisualizationMode(Enum):
 
 
 class MarkdownVisualizer:
+    """
+    Markdown error analysis of span detection: every post is rendered with
+    true positive (green), false negative (yellow) and false positive (red)
+    tokens highlighted, consecutive tokens of one class sharing a `<mark>`.
+
+    A continuation subword takes the label and prediction of the word it
+    belongs to.
+    """
 
     def __init__(self, tokenizer, path, visualization_mode):
         self.tokenizer = tokenizer
         self.path = path
         self.visualization_mode = visualization_mode
+        self.__vocab = None
 
     def visualize_as_markdown_and_save(
         self,
         dataset,
         predictions,
+        worst: int = None,
+        batch_size: int = 1000,
     ):
-        entries = self.visualize_as_markdown(dataset, predictions)
-
+        """
+        Append the rendered posts to the report, `batch_size` posts at a time.
+
+        Args:
+            predictions: Token classification pipeline output per post
+            worst: Render only this many posts with the most false negative
+                and false positive tokens, worst first
+        """
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
 
         with open(self.path, "a") as the_file:
-            for it in entries:
-                the_file.write(it)
-                the_file.write("\n\n")
+            for entries in self.__iter_batches(dataset, predictions, worst, batch_size):
+                the_file.write("".join(it + "\n\n" for it in entries))
 
-    def visualize_as_markdown(self, dataset, predictions):
+    def visualize_as_markdown(self, dataset, predictions, worst: int = None):
         return [
-            self.__visualize_single_datapoint(id, labels, input_ids, prediction)
-            for id, labels, input_ids, prediction in zip(
-                dataset["id"], dataset["labels"], dataset["input_ids"], predictions
-            )
+            it
+            for entries in self.__iter_batches(dataset, predictions, worst, 1000)
+            for it in entries
         ]
 
-    def __visualize_single_datapoint(self, id, labels, input_ids, prediction):
-        content = self.tokenizer.convert_ids_to_tokens(input_ids)
-        prediction_arr = self.__predictions_as_array(prediction, len(content))
-        confusion_arr = self.__extract_confusion(content, labels, prediction_arr)
-
-        def to_md(i):
-            token = content[i]
-
-            if self.visualization_mode == VisualizationMode.ROBERTA:
-                if token == "<s>" or token == "</s>":
-                    return ""
-
-            confusion = confusion_arr[i]
-
-            if self.visualization_mode == VisualizationMode.BERT:
-                result = token[2:] if token.startswith("##") else " " + token
-            else:
-                result = " " + token[1:] if token.startswith("▁") else token
-
-            if confusion > 0:
-                return f"<mark style='background-color:{ERROR_TYPE_TO_COLOR[confusion]}'>{result}</mark>"
+    def __iter_batches(self, dataset, predictions, worst, batch_size):
+        if worst is None:
+            order = np.arange(len(dataset))
+        else:
+            errors = np.concatenate(
+                [
+                    self.__confusion(*self.__batch(dataset, predictions, rows)[1:])[2]
+                    for rows in _chunks(np.arange(len(dataset)), batch_size)
+                ]
+            )
+            order = np.argsort(-errors, kind="stable")[:worst]
 
-            return result
+        for rows in _chunks(order, batch_size):
+            ids, token_ids, lengths, labels, prediction = self.__batch(
+                dataset, predictions, rows
+            )
+            confusion, display, _ = self.__confusion(
+                token_ids, lengths, labels, prediction
+            )
 
-        return id + "<br>" + "".join([to_md(i) for i in range(len(content))])
+            yield [
+                id + "<br>" + self.__render(display[i, :length], confusion[i, :length])
+                for i, (id, length) in enumerate(zip(ids, lengths))
+            ]
+
+    def __batch(self, dataset, predictions, rows):
+        """
+        Padded [posts, tokens] token id, label and prediction matrices.
+        """
+        if len(rows) and np.all(np.diff(rows) == 1):
+            batch = dataset[int(rows[0]) : int(rows[-1]) + 1]
+        else:
+            batch = dataset[[int(it) for it in rows]]
+
+        lengths = np.array([len(it) for it in batch["input_ids"]], dtype=np.int64)
+        shape = (len(rows), int(lengths.max(initial=0)))
+
+        token_ids = np.zeros(shape, dtype=np.int64)
+        labels = np.zeros(shape, dtype=np.int64)
+        prediction = np.zeros(shape, dtype=np.int64)
+
+        # Flat positions of every token, then one scatter per matrix
+        post_index = np.repeat(np.arange(len(rows)), lengths)
+        token_index = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        token_ids[post_index, token_index] = np.concatenate(
+            [np.asarray(it, dtype=np.int64) for it in batch["input_ids"]] or [[]]
+        )
+        labels[post_index, token_index] = np.concatenate(
+            [np.asarray(it, dtype=np.int64) for it in batch["labels"]] or [[]]
+        )
+
+        predicted = [(i, entry["index"]) for i, row in enumerate(rows) for entry in predictions[row]]
+        if predicted:
+            predicted = np.array(predicted)
+            prediction[predicted[:, 0], predicted[:, 1]] = 1
+
+        return batch["id"], token_ids, lengths, labels, prediction
+
+    def __confusion(self, token_ids, lengths, labels, prediction):
+        """
+        Returns:
+            tuple: [posts, tokens] confusion classes and display strings,
+                and the false negative plus false positive count per post
+        """
+        display, word_start = self.__vocabulary()
+        starts = word_start[token_ids]
+
+        # A sentinel first column stands for the 0 label before the first token
+        posts = len(token_ids)
+        starts = np.concatenate([np.ones((posts, 1), dtype=bool), starts], axis=1)
+        positions = np.where(starts, np.arange(starts.shape[1]), 0)
+        np.maximum.accumulate(positions, axis=1, out=positions)
+
+        def word_level(values):
+            values = np.concatenate([np.zeros((posts, 1), dtype=values.dtype), values], axis=1)
+            return np.take_along_axis(values, positions, axis=1)[:, 1:]
+
+        y_true, y_pred = word_level(labels), word_level(prediction)
+
+        confusion = np.select(
+            [
+                (y_true == 1) & (y_pred == 1),  ## TRUE POSITIVE
+                (y_true == 1) & (y_pred == 0),  ## FALSE NEGATIVE
+                (y_true == 0) & (y_pred == 1),  ## FALSE POSITIVE
+            ],
+            [1, 2, 3],
+            0,
+        )
+        confusion[np.arange(confusion.shape[1]) >= lengths[:, None]] = 0
+        errors = (confusion >= 2).sum(axis=1)
+
+        return confusion, display[token_ids], errors
+
+    def __render(self, display, confusion):
+        boundaries = np.flatnonzero(np.diff(confusion)) + 1
+        starts = np.concatenate([[0], boundaries])
+        stops = np.concatenate([boundaries, [len(confusion)]])
+
+        result = []
+        for start, stop in zip(starts, stops):
+            text = "".join(display[start:stop])
+            kind = confusion[start]
+
+            if kind > 0 and text:
+                text = f"<mark style='background-color:{ERROR_TYPE_TO_COLOR[kind]}'>{text}</mark>"
+            result.append(text)
+
+        return "".join(result)
+
+    def __vocabulary(self):
+        """
+        Display string and word start flag of every vocabulary id, so tokens
+        of a whole batch are converted with one lookup.
+        """
+        if self.__vocab is None:
+            tokens = self.tokenizer.convert_ids_to_tokens(list(range(len(self.tokenizer))))
 
-    def __extract_confusion(self, content, labels, predictions):
-        def extract_label(source, index, prev):
             if self.visualization_mode == VisualizationMode.BERT:
-                if content[index].startswith("##"):
-                    return prev
-                else:
-                    return source[index]
+                word_start = [not it.startswith("##") for it in tokens]
+                display = [it[2:] if it.startswith("##") else " " + it for it in tokens]
             else:
-                if not content[index].startswith("▁"):
-                    return prev
-                else:
-                    return source[index]
-
-        confusion = [0] * len(labels)
-
-        prev_y_true = 0
-        prev_y_pred = 0
-
-        for i in range(len(confusion)):
-            y_true = extract_label(labels, i, prev_y_true)
-            y_pred = extract_label(predictions, i, prev_y_pred)
-
-            if y_true == 1 and y_pred == 1:
-                confusion[i] = 1  ## TRUE POSITIVE
-            elif y_true == 1 and y_pred == 0:
-                confusion[i] = 2  ## FALSE NEGATIVE
-            elif y_true == 0 and y_pred == 1:
-                confusion[i] = 3  ## FALSE POSITIVE
-
-            prev_y_true = y_true
-            prev_y_pred = y_pred
+                word_start = [it.startswith("▁") for it in tokens]
+                display = [
+                    "" if it in ("<s>", "</s>")
+                    else " " + it[1:] if it.startswith("▁")
+                    else it
+                    for it in tokens
+                ]
 
-        return confusion
+            self.__vocab = (np.array(display, dtype=object), np.array(word_start))
 
-    def __predictions_as_array(self, prediction, tokens_count):
-        pred_arr = [0] * tokens_count
+        return self.__vocab
 
-        for pred_entry in prediction:
-            pred_arr[pred_entry["index"]] = 1
 
-        return pred_arr
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
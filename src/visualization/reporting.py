@@ -4,6 +4,9 @@ from pathlib import Path
 
 import pandas as pd
 
+from src.definitions import REPORTS_FOLDER
+from src.visualization.run_registry import RunRegistry
+
 
 class EvaluatingReport:
 
@@ -22,8 +25,16 @@ class EvaluatingReport:
 
     __path: Path
 
-    def __init__(self, path):
+    def __init__(self, path, registry: RunRegistry = None, run: str = None, model: str = None):
+        """
+        Args:
+            registry: Also append every row to this RunRegistry, under `run`
+                (the report folder name by default)
+        """
         self.__path = path
+        self.__registry = registry
+        self.__run = run or Path(path).parent.name
+        self.__model = model
 
     def write_to_report(self, output, now):
         os.makedirs(os.path.dirname(self.__path), exist_ok=True)
@@ -34,6 +45,19 @@ class EvaluatingReport:
             writer = csv.writer(the_file)
             writer.writerow(row)
 
+        if self.__registry is not None:
+            metrics = dict(zip(self.__report_columns[1:], row[1:]))
+            self.__registry.append(self.__run, metrics, now, self.__model)
+
+    def copy_to_registry(self, registry: RunRegistry) -> int:
+        """
+        Append the CSV rows the registry does not have yet for this run.
+
+        Returns:
+            int: Rows copied
+        """
+        return _copy_to_registry(self.read_report(), registry, self.__run, self.__model)
+
     def read_report(self):
         return pd.read_csv(
             self.__path,
@@ -61,8 +85,16 @@ class EvaluatingReport_new:
 
     __path: Path
 
-    def __init__(self, path):
+    def __init__(self, path, registry: RunRegistry = None, run: str = None, model: str = None):
+        """
+        Args:
+            registry: Also append every row to this RunRegistry, under `run`
+                (the report folder name by default)
+        """
         self.__path = path
+        self.__registry = registry
+        self.__run = run or Path(path).parent.name
+        self.__model = model
 
     def write_to_report(self, output, now):
         os.makedirs(os.path.dirname(self.__path), exist_ok=True)
@@ -73,8 +105,60 @@ class EvaluatingReport_new:
             writer = csv.writer(the_file)
             writer.writerow(row)
 
+        if self.__registry is not None:
+            metrics = dict(zip(self.__report_columns[1:], row[1:]))
+            self.__registry.append(self.__run, metrics, now, self.__model)
+
+    def copy_to_registry(self, registry: RunRegistry) -> int:
+        """
+        Append the CSV rows the registry does not have yet for this run.
+
+        Returns:
+            int: Rows copied
+        """
+        return _copy_to_registry(self.read_report(), registry, self.__run, self.__model)
+
     def read_report(self):
         return pd.read_csv(
             self.__path,
             names=self.__report_columns,
         )
+
+
+def migrate_reports(registry: RunRegistry, root: Path = REPORTS_FOLDER) -> dict:
+    """
+    Copy every headerless EvaluatingReport or EvaluatingReport_new CSV under
+    root into the registry, picking the report class by the number of
+    fields. Submission CSVs with a header row are left alone; running it
+    again only copies new rows.
+
+    Returns:
+        dict: Mapping of report path to rows copied
+    """
+    classes = {10: EvaluatingReport, 14: EvaluatingReport_new}
+    copied = {}
+
+    for path in sorted(Path(root).rglob("*.csv")):
+        with open(path) as the_file:
+            first = next(csv.reader(the_file), None)
+
+        if not first or first[0] == "id" or len(first) not in classes:
+            continue
+
+        copied[path] = classes[len(first)](path).copy_to_registry(registry)
+
+    return copied
+
+
+def _copy_to_registry(report: pd.DataFrame, registry: RunRegistry, run: str, model: str) -> int:
+    report["timestamp"] = report["timestamp"].astype(str)
+    report = report[~report["timestamp"].isin(registry.timestamps(run))]
+
+    registry.append_many(
+        run,
+        report.drop(columns="timestamp").to_dict("records"),
+        report["timestamp"].tolist(),
+        model,
+    )
+
+    return len(report)
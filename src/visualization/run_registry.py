@@ -0,0 +1,253 @@
+import numbers
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+from src.definitions import REPORTS_FOLDER
+
+REGISTRY_PATH = REPORTS_FOLDER / "runs.sqlite"
+
+# Columns of every row, the rest are added on first use
+_KEY_COLUMNS = ("id", "run", "model", "timestamp", "created_at")
+
+# EvaluatingReport logged token metrics without the token_ prefix
+METRIC_ALIASES = {
+    "eval_token_precision": ("eval_token_precision", "eval_precision"),
+    "eval_token_recall": ("eval_token_recall", "eval_recall"),
+    "eval_token_f1": ("eval_token_f1", "eval_f1"),
+    "eval_token_accuracy": ("eval_token_accuracy", "eval_accuracy"),
+}
+
+# Columns best() groups rows by
+_GROUP_COLUMNS = {"model": ("model", "run"), "run": ("run",)}
+
+
+class RunRegistry:
+    """
+    Evaluation rows of every run in one SQLite table.
+
+    A metric seen for the first time becomes a new column, so rows with the
+    EvaluatingReport and EvaluatingReport_new column sets live side by side
+    with NULLs for what they did not log. The database runs in WAL mode and
+    every append is its own write transaction, so parallel trainers can
+    append to the same file.
+    """
+
+    def __init__(self, path: Path = REGISTRY_PATH, timeout: float = 60):
+        self.__path = Path(path)
+        self.__timeout = timeout
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+
+        with closing(self.__connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "id INTEGER PRIMARY KEY, "
+                "run TEXT NOT NULL, "
+                "model TEXT, "
+                "timestamp TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS runs_run_timestamp ON runs (run, timestamp)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS runs_model ON runs (model)")
+            self.__create_metric_columns(connection)
+
+    def append(self, run: str, metrics: dict, timestamp=None, model: str = None) -> int:
+        """
+        Args:
+            metrics: Evaluation output, e.g. trainer.evaluate(); None values
+                are skipped
+            timestamp: Defaults to the current unix time, as the notebooks
+                log it
+
+        Returns:
+            int: Row id
+        """
+        return self.append_many(run, [metrics], [timestamp], model)[0]
+
+    def append_many(self, run: str, rows: list, timestamps: list = None, model: str = None) -> list:
+        """
+        Append several rows of one run in a single transaction.
+        """
+        now = time.time()
+        timestamps = timestamps or [None] * len(rows)
+        rows = [
+            {k: _to_sql(v) for k, v in row.items() if v is not None and not pd.isna(v)}
+            for row in rows
+        ]
+
+        with closing(self.__connect()) as connection:
+            # Writers queue up here, so the schema read below stays current
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                columns = self.__columns(connection)
+
+                for row in rows:
+                    for name, value in row.items():
+                        if name in columns:
+                            continue
+                        kind = "REAL" if isinstance(value, float) else "TEXT"
+                        connection.execute(
+                            f"ALTER TABLE runs ADD COLUMN {_quote(name)} {kind}"
+                        )
+                        columns.add(name)
+                        if kind == "REAL":
+                            self.__create_best_indexes(connection, [name])
+
+                ids = []
+                for row, timestamp in zip(rows, timestamps):
+                    record = {
+                        "run": run,
+                        "model": model,
+                        "timestamp": str(int(now) if timestamp is None else timestamp),
+                        "created_at": now,
+                        **{k: v for k, v in row.items() if k not in _KEY_COLUMNS},
+                    }
+                    names = ", ".join(_quote(it) for it in record)
+                    placeholders = ", ".join("?" * len(record))
+                    cursor = connection.execute(
+                        f"INSERT INTO runs ({names}) VALUES ({placeholders})",
+                        list(record.values()),
+                    )
+                    ids.append(cursor.lastrowid)
+
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        return ids
+
+    def read(self, run: str = None, model: str = None) -> pd.DataFrame:
+        """
+        Rows of a run and/or model in logging order, without the metric
+        columns none of them has.
+        """
+        conditions, params = [], []
+        for name, value in (("run", run), ("model", model)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        df = self.query(f"SELECT * FROM runs {where} ORDER BY run, timestamp, id", params)
+
+        metric_columns = [it for it in df.columns if it not in _KEY_COLUMNS]
+        empty = [it for it in metric_columns if df[it].isna().all()]
+
+        return df.drop(columns=empty)
+
+    def best(
+        self,
+        metric: str = "eval_token_f1",
+        by: str = "model",
+        lower_is_better: bool = False,
+        include_std: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Best row per model (or run) by a metric, e.g. the best token F1 per
+        model; METRIC_ALIASES also match the legacy column names.
+
+        Args:
+            include_std: Also consider the `<now>-std` rows of cross-validation
+                reports, which hold spreads rather than scores
+        """
+        if by not in _GROUP_COLUMNS:
+            raise ValueError(f"Unknown grouping [ {by} ]")
+
+        with closing(self.__connect()) as connection:
+            columns = self.__columns(connection)
+            candidates = [it for it in METRIC_ALIASES.get(metric, (metric,)) if it in columns]
+            if not candidates:
+                return pd.DataFrame()
+
+        value, group = _coalesce(candidates, "r."), _coalesce(_GROUP_COLUMNS[by], "r.")
+        order = "ASC" if lower_is_better else "DESC"
+        std_filter = "" if include_std else "AND r.timestamp NOT LIKE '%-std'"
+
+        df = self.query(
+            f"SELECT {value} AS {_quote(metric)}, r.* FROM runs r WHERE r.id IN ("
+            f"SELECT (SELECT r.id FROM runs r WHERE {group} = groups.key "
+            f"AND {value} IS NOT NULL {std_filter} ORDER BY {value} {order} LIMIT 1) "
+            f"FROM (SELECT DISTINCT {group} AS key FROM runs r) groups"
+            f") ORDER BY 1 {order}"
+        )
+        df = df.loc[:, ~df.columns.duplicated()]
+
+        return df.dropna(axis=1, how="all")
+
+    def timestamps(self, run: str) -> set:
+        return set(self.query("SELECT timestamp FROM runs WHERE run = ?", [run])["timestamp"])
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        with closing(self.__connect()) as connection:
+            return pd.read_sql_query(sql, connection, params=list(params))
+
+    def __create_metric_columns(self, connection):
+        """
+        Create the METRIC_ALIASES columns up front and index every metric
+        column for best(); an alias index has to cover all aliases to match
+        the COALESCE there.
+        """
+        # Concurrent first opens queue up here instead of adding a column twice
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            columns = self.__columns(connection)
+
+            for aliases in METRIC_ALIASES.values():
+                for name in aliases:
+                    if name not in columns:
+                        connection.execute(f"ALTER TABLE runs ADD COLUMN {_quote(name)} REAL")
+                        columns.add(name)
+
+                self.__create_best_indexes(connection, aliases)
+
+            # Other metrics are indexed when append_many adds their column,
+            # this covers registries written before that
+            aliased = {it for aliases in METRIC_ALIASES.values() for it in aliases}
+            for row in connection.execute("PRAGMA table_info(runs)").fetchall():
+                if row[2] == "REAL" and row[1] not in aliased and row[1] not in _KEY_COLUMNS:
+                    self.__create_best_indexes(connection, [row[1]])
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def __create_best_indexes(connection, metric_columns):
+        # Lets best() find every group's best row with one index seek
+        for by, group_columns in _GROUP_COLUMNS.items():
+            index_name = _quote("best_" + "_".join([by, *metric_columns]))
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON runs "
+                f"({_coalesce(group_columns)}, {_coalesce(metric_columns)})"
+            )
+
+    def __connect(self):
+        return sqlite3.connect(self.__path, timeout=self.__timeout, isolation_level=None)
+
+    @staticmethod
+    def __columns(connection) -> set:
+        return {row[1] for row in connection.execute("PRAGMA table_info(runs)")}
+
+
+def _to_sql(value):
+    if isinstance(value, numbers.Real):
+        return float(value)
+    return str(value)
+
+
+def _quote(name: str) -> str:
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def _coalesce(columns: list, prefix: str = "") -> str:
+    names = [prefix + _quote(it) for it in columns]
+
+    return names[0] if len(names) == 1 else "COALESCE({})".format(", ".join(names))
@@ -0,0 +1,29 @@
+import pytest
+import torch
+
+from src.model.baseline import AllOnesModel, BaselineModel, ClassPriorModel
+
+
+def test_baseline_model_is_abstract():
+    with pytest.raises(TypeError):
+        BaselineModel()
+
+
+def test_forward_without_labels_returns_only_logits():
+    output = AllOnesModel()(torch.zeros(3, 5, dtype=torch.long))
+
+    assert output.loss is None
+    assert output.logits.shape == (3, 5, 2)
+    assert len(output.to_tuple()) == 1
+    assert output[0] is output.logits
+
+
+def test_forward_with_labels_returns_loss():
+    labels = torch.ones(3, 5, dtype=torch.long)
+    labels[:, -1] = -100
+
+    model = ClassPriorModel(seed=0).fit(labels)
+    output = model(torch.zeros(3, 5, dtype=torch.long), labels=labels)
+
+    assert torch.isfinite(output.loss)
+    assert output.logits.argmax(-1).eq(1).all()
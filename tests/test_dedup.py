@@ -0,0 +1,19 @@
+from src.data.dedup import near_duplicate_mask
+
+TRAIN = [
+    "the minister said the bridge will reopen next week after repairs",
+    "prices of bread rose again in the capital according to the statistics office",
+]
+
+
+def test_near_duplicate_mask_flags_reposts_only():
+    test = [
+        "The minister said: the bridge will reopen next week after repairs! https://t.me/x",
+        "a completely different post about football results from the weekend games",
+    ]
+
+    assert near_duplicate_mask(test, TRAIN, num_proc=1).tolist() == [True, False]
+
+
+def test_near_duplicate_mask_without_reference_texts():
+    assert near_duplicate_mask(TRAIN, [], num_proc=1).tolist() == [False, False]
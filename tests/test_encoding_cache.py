@@ -0,0 +1,37 @@
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+from src.data.encoding_cache import tokenizer_fingerprint
+
+
+def _tokenizer():
+    vocab = {"[PAD]": 0, "[UNK]": 1, "hello": 2, "world": 3}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend, unk_token="[UNK]", pad_token="[PAD]"
+    )
+
+
+def test_tokenizer_fingerprint_ignores_truncation_and_padding():
+    tokenizer = _tokenizer()
+    before = tokenizer_fingerprint(tokenizer)
+
+    tokenizer(
+        ["hello world hello", "hello"],
+        truncation=True,
+        max_length=2,
+        padding="max_length",
+    )
+
+    assert tokenizer_fingerprint(tokenizer) == before
+
+
+def test_tokenizer_fingerprint_changes_with_vocab():
+    tokenizer = _tokenizer()
+    before = tokenizer_fingerprint(tokenizer)
+
+    tokenizer.add_tokens(["manipulation"])
+
+    assert tokenizer_fingerprint(tokenizer) != before
@@ -0,0 +1,36 @@
+from transformers import BertConfig, BertModel
+
+from src.model.ensemble import model_fingerprint
+
+
+def _tiny_bert():
+    config = BertConfig(
+        vocab_size=32,
+        hidden_size=8,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=16,
+    )
+
+    return BertModel(config)
+
+
+def test_model_fingerprint_ignores_checkpoint_folder(tmp_path):
+    model = _tiny_bert()
+    model.save_pretrained(tmp_path / "first")
+    model.save_pretrained(tmp_path / "second")
+
+    first = BertModel.from_pretrained(tmp_path / "first")
+    second = BertModel.from_pretrained(tmp_path / "second")
+
+    assert first.config._name_or_path != second.config._name_or_path
+    assert model_fingerprint(first) == model_fingerprint(second)
+
+
+def test_model_fingerprint_changes_with_weights():
+    model = _tiny_bert()
+    before = model_fingerprint(model)
+
+    model.pooler.dense.bias.data += 1
+
+    assert model_fingerprint(model) != before
@@ -0,0 +1,29 @@
+import pytest
+
+from src.data.html_text import strip_html, strip_html_bs4
+
+DOCUMENTS = [
+    "a</pre>  \n  <b>x</b>",
+    "<pre>a</pre></pre> \n <b>x</b>",
+    "a</textarea>  \n <i>y</i>",
+    "<div><pre>a</div>  \n  <b>x</b>",
+    "<pre> <b> \n </b></pre>",
+    "<template>abc",
+    "x<template><b>abc</b>",
+    "<template><![CDATA[kept]]>dropped",
+    "<ruby>base<rt>ruby text</rt></ruby>",
+    "<br>  </br> \n x",
+    "<script>a</script>  \n <b>b</b>",
+    "a &amp; b &#147;quoted&#148; &#x41;",
+    None,
+    "plain text",
+]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_strip_html_matches_beautifulsoup(document):
+    assert strip_html([document]) == strip_html_bs4([document])
+
+
+def test_strip_html_keeps_documents_in_order():
+    assert strip_html(["<p>a</p>", None, "b"]) == ["a", None, "b"]
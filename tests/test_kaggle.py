@@ -0,0 +1,54 @@
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.data.kaggle import iter_member_batches, open_member, read_member
+
+
+def _archive(tmp_path, name, content, compression=zipfile.ZIP_DEFLATED):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w", compression) as zf:
+        zf.writestr(name, content)
+
+    return archive
+
+
+def test_csv_member_keeps_one_schema_across_chunks(tmp_path):
+    # Numbers in the first chunk, text in the second
+    lines = ["id,value"] + [f"{i},{i}" for i in range(15_000)] + ["15000,text"]
+    archive = _archive(tmp_path, "posts.csv", "\n".join(lines))
+
+    batches = list(iter_member_batches(archive, "posts.csv"))
+    table = read_member(archive, "posts.csv")
+
+    assert {it.schema for it in batches} == {table.schema}
+    assert table.schema.field("value").type == pa.large_string()
+    assert table.column("value")[-2:].to_pylist() == ["14999", "text"]
+
+
+def test_json_lines_member_fills_columns_missing_from_chunks(tmp_path):
+    lines = ['{"id": 1}'] * 10_000 + ['{"id": 2.5, "lang": "uk"}']
+    archive = _archive(tmp_path, "posts.jsonl", "\n".join(lines))
+
+    table = pa.Table.from_batches(list(iter_member_batches(archive, "posts.jsonl")))
+
+    assert table.schema.field("id").type == pa.float64()
+    assert table.column("lang").null_count == 10_000
+
+
+def test_csv_member_filters_and_columns(tmp_path):
+    lines = ["id,lang"] + [f"{i},{'uk' if i % 2 else 'ru'}" for i in range(20_000)]
+    archive = _archive(tmp_path, "posts.csv", "\n".join(lines))
+
+    table = read_member(archive, "posts.csv", columns=["id"], filters=pc.field("lang") == "uk")
+
+    assert table.column_names == ["id"]
+    assert table.num_rows == 10_000
+
+
+def test_stored_member_reads_in_place(tmp_path):
+    archive = _archive(tmp_path, "posts.csv", "id\n1\n2\n", zipfile.ZIP_STORED)
+
+    with open_member(archive, "posts.csv") as f:
+        assert f.read() == b"id\n1\n2\n"
@@ -0,0 +1,115 @@
+import pytest
+import torch
+import transformers
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import (
+    BertConfig,
+    BertForMaskedLM,
+    DataCollatorForLanguageModeling,
+    PreTrainedTokenizerFast,
+    XLMRobertaConfig,
+    XLMRobertaForMaskedLM,
+)
+
+from src.data.packing import DocumentMaskCollator, PAD_DOCUMENT_ID
+
+
+def _tokenizer():
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[MASK]": 2, "[SEP]": 3}
+    vocab.update({f"w{i}": i + 4 for i in range(12)})
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        unk_token="[UNK]",
+        pad_token="[PAD]",
+        mask_token="[MASK]",
+        sep_token="[SEP]",
+    )
+
+
+def _model(config_class, model_class):
+    torch.manual_seed(0)
+    config = config_class(
+        vocab_size=16,
+        hidden_size=16,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=16,
+        hidden_dropout_prob=0.0,
+        attention_probs_dropout_prob=0.0,
+    )
+
+    return model_class(config).eval()
+
+
+def _packed_batch(second_document):
+    # Two documents in the first block, one document and padding in the second
+    blocks = [
+        [4, 5, 6, 3] + second_document,
+        [10, 11, 3, 0, 0, 0, 0, 0],
+    ]
+    documents = [
+        [0, 0, 0, 0, 1, 1, 1, 1],
+        [0, 0, 0] + [PAD_DOCUMENT_ID] * 5,
+    ]
+    features = [
+        {
+            "input_ids": ids,
+            "attention_mask": [int(it != PAD_DOCUMENT_ID) for it in docs],
+            "document_ids": docs,
+        }
+        for ids, docs in zip(blocks, documents)
+    ]
+    collator = DocumentMaskCollator(
+        DataCollatorForLanguageModeling(_tokenizer(), mlm_probability=0.15)
+    )
+
+    return collator(features)
+
+
+def test_document_mask_shape():
+    batch = _packed_batch([7, 8, 9, 3])
+    mask = batch["attention_mask"]
+
+    assert mask.shape == (2, 8, 8)
+    assert set(mask.unique().tolist()) == {0.0, 1.0}
+    assert mask[0, 0, :4].tolist() == [1.0] * 4
+    assert mask[0, 0, 4:].tolist() == [0.0] * 4
+    assert mask[1, 0].tolist() == [1.0] * 3 + [0.0] * 5
+
+
+# transformers 5 builds attention masks from 2D padding masks only
+@pytest.mark.skipif(
+    int(transformers.__version__.split(".")[0]) >= 5,
+    reason="3D attention masks need transformers 4, as pinned in requirements.txt",
+)
+@pytest.mark.parametrize(
+    "config_class, model_class",
+    [
+        (BertConfig, BertForMaskedLM),
+        (XLMRobertaConfig, XLMRobertaForMaskedLM),
+    ],
+)
+def test_document_mask_forward_pass_isolates_documents(config_class, model_class):
+    model = _model(config_class, model_class)
+
+    with torch.no_grad():
+        first = _packed_batch([7, 8, 9, 3])
+        second = _packed_batch([12, 13, 14, 3])
+        # Same inputs in both batches apart from the second document
+        second["input_ids"][:, :4] = first["input_ids"][:, :4]
+        second["input_ids"][1] = first["input_ids"][1]
+
+        first_logits = model(
+            input_ids=first["input_ids"], attention_mask=first["attention_mask"]
+        ).logits
+        second_logits = model(
+            input_ids=second["input_ids"], attention_mask=second["attention_mask"]
+        ).logits
+
+    assert torch.isfinite(first_logits).all()
+    assert torch.allclose(first_logits[0, :4], second_logits[0, :4], atol=1e-5)
+    assert not torch.allclose(first_logits[0, 4:], second_logits[0, 4:], atol=1e-5)
@@ -0,0 +1,75 @@
+from src.visualization.reporting import EvaluatingReport, EvaluatingReport_new
+from src.visualization.run_registry import RunRegistry
+
+
+def _metrics(f1, **extra):
+    return {"eval_loss": 1 - f1, "eval_token_f1": f1, **extra}
+
+
+def test_best_picks_the_best_row_per_model(tmp_path):
+    registry = RunRegistry(tmp_path / "runs.sqlite")
+    registry.append("a", _metrics(0.5), 1, model="x")
+    registry.append("a", _metrics(0.7), 2, model="x")
+    registry.append("b", _metrics(0.6), 3, model="y")
+    # Legacy EvaluatingReport column
+    registry.append("c", {"eval_f1": 0.9}, 4, model="y")
+
+    best = registry.best()
+
+    assert best["model"].tolist() == ["y", "x"]
+    assert best["eval_token_f1"].tolist() == [0.9, 0.7]
+
+
+def test_best_leaves_the_schema_alone(tmp_path):
+    registry = RunRegistry(tmp_path / "runs.sqlite")
+    registry.append("a", _metrics(0.5, eval_span_f1=0.4), 1, model="x")
+    registry.append("a", _metrics(0.6, eval_span_f1=0.3), 2, model="x")
+    schema = registry.query("SELECT * FROM sqlite_master")
+
+    assert registry.best()["eval_token_f1"].tolist() == [0.6]
+    assert registry.best("eval_span_f1", by="run")["eval_span_f1"].tolist() == [0.4]
+    assert registry.query("SELECT * FROM sqlite_master").equals(schema)
+
+
+def test_best_uses_an_index(tmp_path):
+    registry = RunRegistry(tmp_path / "runs.sqlite")
+    registry.append("a", _metrics(0.5, eval_span_f1=0.4), 1, model="x")
+
+    indexes = set(registry.query("SELECT name FROM sqlite_master WHERE type = 'index'")["name"])
+
+    assert "best_model_eval_token_f1_eval_f1" in indexes
+    assert "best_run_eval_span_f1" in indexes
+
+
+def test_copy_to_registry_skips_copied_rows(tmp_path):
+    registry = RunRegistry(tmp_path / "runs.sqlite")
+    old_path = tmp_path / "old" / "report.csv"
+    new_path = tmp_path / "new" / "report.csv"
+
+    old = EvaluatingReport(old_path)
+    new = EvaluatingReport_new(new_path)
+    for now in (1, 2):
+        old.write_to_report(
+            {
+                "eval_loss": 0.1, "eval_precision": 0.2, "eval_recall": 0.3,
+                "eval_f1": 0.4, "eval_accuracy": 0.5, "eval_runtime": 1.0,
+                "eval_samples_per_second": 1.0, "eval_steps_per_second": 1.0, "epoch": now,
+            },
+            now,
+        )
+        new.write_to_report(
+            {
+                "eval_loss": 0.1, "eval_token_precision": 0.2, "eval_token_recall": 0.3,
+                "eval_token_f1": 0.4, "eval_token_accuracy": 0.5, "eval_span_precision": 0.2,
+                "eval_span_recall": 0.3, "eval_span_f1": 0.4, "eval_span_accuracy": 0.5,
+                "eval_runtime": 1.0, "eval_samples_per_second": 1.0,
+                "eval_steps_per_second": 1.0, "epoch": now,
+            },
+            now,
+        )
+
+    assert old.copy_to_registry(registry) == 2
+    assert new.copy_to_registry(registry) == 2
+    assert old.copy_to_registry(registry) == 0
+    assert registry.read(run="old")["eval_f1"].tolist() == [0.4, 0.4]
+    assert registry.read(run="new")["eval_token_f1"].tolist() == [0.4, 0.4]